@@ -0,0 +1,76 @@
+"""Compare output size and write throughput of the export formats.
+
+Run from the top of the repository:
+
+    python -m benchmarks.exporters --rows 1000000
+"""
+
+from collections.abc import Iterator
+
+import os
+import random
+import tempfile
+import time
+
+import click
+
+from exporters import EXPORTERS
+from exporters import ExportRow
+
+FIELDS = {"unique_system_identifier": int, "call_sign": str, "operator_class": str}
+
+
+def rows(count: int, batch_size: int) -> Iterator[list[ExportRow]]:
+    rng = random.Random(0)
+    batch = []
+    for usi in range(1, count + 1):
+        batch.append(
+            ExportRow(
+                lat=rng.uniform(25, 49),
+                lon=rng.uniform(-124, -67),
+                name=f"Licensee {usi} [E] K{usi % 10}{usi:06d}",
+                desc=f"{rng.randint(1, 999)} Main St, Belmont, MA 02478",
+                properties={
+                    "unique_system_identifier": usi,
+                    "call_sign": f"K{usi % 10}{usi:06d}",
+                    "operator_class": rng.choice("AEGT"),
+                },
+            )
+        )
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@click.command()
+@click.option("--rows", "-n", "count", default=1_000_000)
+@click.option("--batch-size", "-b", default=1000)
+def main(count: int, batch_size: int):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, exporter in EXPORTERS.items():
+            for compress in [False, True]:
+                if compress and name == "parquet":
+                    continue
+                path = os.path.join(tmpdir, f"out{exporter.extension}")
+                label = f"{name}{' gzip' if compress else ''}"
+                start = time.perf_counter()
+                try:
+                    with open(path, "wb") as fd, exporter(
+                        fd, FIELDS, compress=compress
+                    ) as out:
+                        for batch in rows(count, batch_size):
+                            out.write(batch)
+                except ValueError as err:
+                    print(f"{label:>16}: skipped ({err})")
+                    continue
+                elapsed = time.perf_counter() - start
+                print(
+                    f"{label:>16}: {os.path.getsize(path) / 1024 / 1024:8.1f} MiB, "
+                    f"{elapsed:6.2f}s ({count / elapsed:,.0f} rows/s)"
+                )
+
+
+if __name__ == "__main__":
+    main()
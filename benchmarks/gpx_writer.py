@@ -0,0 +1,76 @@
+"""Compare GpxWriter with building a GpxFile and calling to_xml().
+
+Each variant runs in its own process so that its peak memory use can be reported.
+Run from the top of the repository:
+
+    python -m benchmarks.gpx_writer --waypoints 1000000
+"""
+
+from collections.abc import Iterator
+
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import click
+
+import bettergpx
+
+
+def waypoints(count: int) -> Iterator[bettergpx.Waypoint]:
+    for i in range(count):
+        yield bettergpx.Waypoint(
+            lat=42 + i / count,
+            lon=-71 - i / count,
+            name=f"Licensee {i} [E] K1{i:06d}",
+            desc=f"{i % 999} Main St, Belmont, MA 02478",
+        )
+
+
+def run_to_xml(path: str, count: int):
+    gpx = bettergpx.GpxFile(waypoints=list(waypoints(count)))
+    with open(path, "w") as fd:
+        fd.write(gpx.to_xml(skip_empty=True, pretty_print=True).decode())
+
+
+def run_writer(path: str, count: int, compress: bool = False):
+    with (
+        open(path, "wb") as fd,
+        bettergpx.GpxWriter(fd, pretty_print=True, compress=compress) as writer,
+    ):
+        for wpt in waypoints(count):
+            writer.write(wpt)
+
+
+def measure(target, *args) -> tuple[float, int]:
+    start = time.perf_counter()
+    target(*args)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+@click.command()
+@click.option("--waypoints", "-n", "count", default=1_000_000)
+def main(count: int):
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "out.gpx")
+        for label, target, args in [
+            ("to_xml", run_to_xml, (path, count)),
+            ("GpxWriter", run_writer, (path, count)),
+            ("GpxWriter gzip", run_writer, (path, count, True)),
+        ]:
+            with context.Pool(1) as pool:
+                elapsed, maxrss = pool.apply(measure, (target, *args))
+            size = os.path.getsize(path)
+            print(
+                f"{label:>16}: {elapsed:7.2f}s, peak RSS {maxrss / 1024:8.1f} MiB, "
+                f"{size / 1024 / 1024:.1f} MiB written"
+            )
+
+
+if __name__ == "__main__":
+    main()
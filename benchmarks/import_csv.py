@@ -0,0 +1,78 @@
+"""Compare Base.import_csv (ORM) with Base.bulk_import_csv on a synthetic EN.dat.
+
+Run from the top of the repository:
+
+    python -m benchmarks.import_csv --rows 2000000
+"""
+
+import os
+import resource
+import tempfile
+import time
+
+import click
+
+from sqlalchemy import create_engine
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from fccdb import Base
+from fccdb import Entity
+
+from benchmarks.synthetic import entity_lines, write_file
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(label: str, datafile: str, dburi: str, bulk: bool, batch_size: int):
+    engine = create_engine(dburi)
+    Base.metadata.create_all(engine)
+    start = time.perf_counter()
+    with Session(engine) as session:
+        with session.begin():
+            with open(datafile, newline="\r\n") as fd:
+                if bulk:
+                    Entity.bulk_import_csv(fd, session, batch_size=batch_size)
+                else:
+                    Entity.import_csv(fd, session)
+        elapsed = time.perf_counter() - start
+        count = session.scalar(select(func.count()).select_from(Entity))
+    print(
+        f"{label:>6}: {count} rows in {elapsed:.2f}s "
+        f"({count / elapsed:,.0f} rows/s), peak rss {peak_rss_mb():,.0f} MB"
+    )
+
+
+@click.command()
+@click.option("--rows", "-n", default=2_000_000)
+@click.option("--batch-size", "-b", default=10_000)
+@click.option("--skip-orm", is_flag=True, help="Only time the bulk path")
+def main(rows: int, batch_size: int, skip_orm: bool):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        datafile = os.path.join(tmpdir, "EN.dat")
+        write_file(datafile, entity_lines(rows))
+
+        # Run the bulk path first so the peak RSS it reports is not inflated
+        # by the ORM run.
+        run(
+            "bulk",
+            datafile,
+            f"sqlite:///{tmpdir}/bulk.db",
+            bulk=True,
+            batch_size=batch_size,
+        )
+        if not skip_orm:
+            run(
+                "orm",
+                datafile,
+                f"sqlite:///{tmpdir}/orm.db",
+                bulk=False,
+                batch_size=batch_size,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Time common lookups against a populated database, with and without indexes.
+
+Run from the top of the repository:
+
+    python -m benchmarks.lookups --rows 1000000
+"""
+
+import os
+import random
+import tempfile
+import time
+
+import click
+
+from sqlalchemy import create_engine
+from sqlalchemy import Engine
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from fccdb import Base
+from fccdb import Entity
+from fccdb import History
+from fccdb import create_indexes
+from fccdb import drop_indexes
+
+from benchmarks.synthetic import entity_lines, history_lines
+
+
+def populate(engine: Engine, rows: int):
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        drop_indexes(conn)
+        Entity.bulk_import_csv(entity_lines(rows), conn)
+        History.bulk_import_csv(history_lines(rows * 3), conn)
+
+
+def time_queries(engine: Engine, rows: int, repeat: int) -> dict[str, float]:
+    rng = random.Random(0)
+    queries = {
+        "call_sign": lambda: select(Entity).where(
+            Entity.call_sign == f"K{(n := rng.randint(1, rows)) % 10}{n:06d}"[:10]
+        ),
+        "zip_code": lambda: select(Entity).where(
+            Entity.zip_code == f"{rng.randint(1000, 99999):05d}"
+        ),
+        "state_city": lambda: select(Entity)
+        .where(Entity.state == "MA", Entity.city == "Belmont")
+        .limit(100),
+        "history_join": lambda: select(Entity, History)
+        .join(History)
+        .where(Entity.unique_system_identifier == rng.randint(1, rows)),
+    }
+
+    results = {}
+    with Session(engine) as session:
+        for name, query in queries.items():
+            start = time.perf_counter()
+            for _ in range(repeat):
+                session.execute(query()).all()
+            results[name] = (time.perf_counter() - start) / repeat
+    return results
+
+
+@click.command()
+@click.option("--rows", "-n", default=1_000_000)
+@click.option("--repeat", "-r", default=20)
+def main(rows: int, repeat: int):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmpdir, 'fcc.db')}")
+        populate(engine, rows)
+
+        unindexed = time_queries(engine, rows, repeat)
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            create_indexes(conn)
+        print(f"created indexes in {time.perf_counter() - start:.2f}s")
+        indexed = time_queries(engine, rows, repeat)
+
+        for name in unindexed:
+            print(
+                f"{name:>14}: {unindexed[name] * 1000:10.3f} ms unindexed, "
+                f"{indexed[name] * 1000:8.3f} ms indexed"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Time a fixed set of name searches as the number of entities grows.
+
+The query set mixes whole names, partial names and misspellings of the names
+generated by benchmarks.synthetic. Run from the top of the repository:
+
+    python -m benchmarks.namesearch --rows 10000 --rows 100000 --rows 1000000
+"""
+
+import os
+import statistics
+import tempfile
+import time
+
+import click
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from fccdb import Base
+from fccdb import Entity
+from fccdb import refresh_name_search
+
+import namesearch
+
+from benchmarks.synthetic import entity_lines
+
+QUERIES = {
+    "last name": "Last1234",
+    "first and last": "First234 Last1234",
+    "entity name": "Licensee 4242",
+    "partial": "ast123",
+    "misspelled": "Lsat1234",
+    "misspelled both": "Frist234 Lats1234",
+    "no match": "Zzyzx",
+}
+
+
+@click.command()
+@click.option("--rows", "-n", multiple=True, type=int, default=[10_000, 100_000])
+@click.option("--repeat", "-r", default=20)
+@click.option("--limit", "-k", default=10)
+def main(rows: tuple[int, ...], repeat: int, limit: int):
+    for count in rows:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            engine = create_engine(f"sqlite:///{os.path.join(tmpdir, 'fcc.db')}")
+            Base.metadata.create_all(engine)
+            with engine.begin() as conn:
+                Entity.bulk_import_csv(entity_lines(count), conn)
+                start = time.perf_counter()
+                refresh_name_search(conn)
+            print(f"{count} entities: indexed in {time.perf_counter() - start:.2f}s")
+
+            with Session(engine) as session:
+                for label, query in QUERIES.items():
+                    times = []
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        matches = namesearch.search_names(session, query, limit)
+                        times.append(time.perf_counter() - start)
+                        session.expunge_all()
+                    best = matches[0][1] if matches else 0.0
+                    print(
+                        f"{label:>16}: p50 {statistics.median(times) * 1000:8.2f} ms, "
+                        f"max {max(times) * 1000:8.2f} ms, "
+                        f"{len(matches)} matches, best score {best:.2f}"
+                    )
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Load test the lookup server with concurrent keep-alive clients.
+
+Each client looks up call signs drawn from a pool of --distinct values, so the
+pool size sets how often the cache is hit. Use --cache-size 0 to disable the
+cache. Run from the top of the repository:
+
+    python -m benchmarks.query_load --rows 100000 --clients 8 --requests 2000
+"""
+
+import http.client
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+import click
+
+from sqlalchemy import create_engine
+
+from fccdb import Base
+from fccdb import Entity
+from fccdb import History
+from fccdb import refresh_license_status
+
+import query
+
+from benchmarks.synthetic import entity_lines, history_lines
+
+
+def run_client(
+    port: int, call_signs: list[str], requests: int, seed: int, latencies: list[float]
+):
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    for _ in range(requests):
+        start = time.perf_counter()
+        conn.request("GET", f"/call_sign/{rng.choice(call_signs)}")
+        res = conn.getresponse()
+        res.read()
+        latencies.append(time.perf_counter() - start)
+        if res.status != 200:
+            raise ValueError(f"unexpected status {res.status}")
+    conn.close()
+
+
+@click.command()
+@click.option("--rows", "-n", default=100_000)
+@click.option("--clients", "-c", default=8)
+@click.option("--requests", "-r", default=2000, help="Requests per client")
+@click.option("--distinct", default=10_000, help="Distinct call signs requested")
+@click.option("--cache-size", default=100_000)
+@click.option("--pool-size", default=8)
+def main(
+    rows: int,
+    clients: int,
+    requests: int,
+    distinct: int,
+    cache_size: int,
+    pool_size: int,
+):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dburi = f"sqlite:///{os.path.join(tmpdir, 'fcc.db')}"
+        engine = create_engine(dburi)
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            Entity.bulk_import_csv(entity_lines(rows), conn)
+            History.bulk_import_csv(history_lines(rows * 3), conn)
+            refresh_license_status(conn)
+        engine.dispose()
+
+        rng = random.Random(0)
+        call_signs = [
+            f"K{usi % 10}{usi:06d}"[:10]
+            for usi in rng.sample(range(1, rows + 1), min(distinct, rows))
+        ]
+
+        lookup = query.Lookup(
+            query.readonly_engine(dburi, pool_size), query.TTLCache(cache_size)
+        )
+        server = query.LookupServer(("127.0.0.1", 0), lookup)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_address[1]
+
+        latencies: list[float] = []
+        threads = [
+            threading.Thread(
+                target=run_client, args=(port, call_signs, requests, seed, latencies)
+            )
+            for seed in range(clients)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        server.shutdown()
+        server.server_close()
+        lookup.engine.dispose()
+
+        quantiles = statistics.quantiles(latencies, n=100)
+        print(
+            f"{len(latencies)} requests in {elapsed:.2f}s: "
+            f"{len(latencies) / elapsed:,.0f} requests/s"
+        )
+        print(
+            f"latency p50 {quantiles[49] * 1000:.3f} ms, "
+            f"p99 {quantiles[98] * 1000:.3f} ms"
+        )
+        print(f"cache hits {lookup.cache.hits}, misses {lookup.cache.misses}")
+
+
+if __name__ == "__main__":
+    main()
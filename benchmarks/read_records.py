@@ -0,0 +1,60 @@
+"""Compare read_uls_records with the csv-based reader it replaced.
+
+Run from the top of the repository:
+
+    python -m benchmarks.read_records --rows 1000000
+"""
+
+from collections.abc import Iterable, Iterator
+
+import csv
+import os
+import tempfile
+import time
+
+import click
+
+import fccdb
+
+from benchmarks.synthetic import entity_lines, history_lines, write_file
+
+
+def legacy_read_records(data: Iterable[str]) -> Iterator[list[str]]:
+    def line_combiner(data: Iterable[str]) -> Iterable[str]:
+        vline: list[str] = []
+        for line in data:
+            line = line.removesuffix("\r\n")
+            vline.append(line.replace("\r", " "))
+            if line.endswith("\r"):
+                continue
+            yield "".join(vline)
+            vline = []
+
+    return csv.DictReader(
+        line_combiner(data),
+        fieldnames=[str(i) for i in range(30)],
+        dialect="uls",
+    )
+
+
+def run(label: str, path: str, reader):
+    start = time.perf_counter()
+    with open(path, newline="\r\n") as fd:
+        count = sum(1 for _ in reader(fd))
+    elapsed = time.perf_counter() - start
+    print(f"{label:>12}: {count} records in {elapsed:.2f}s ({count / elapsed:,.0f}/s)")
+
+
+@click.command()
+@click.option("--rows", "-n", default=1_000_000)
+def main(rows: int):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, lines in [("EN", entity_lines), ("HS", history_lines)]:
+            path = os.path.join(tmpdir, f"{name}.dat")
+            write_file(path, lines(rows))
+            run(f"{name} legacy", path, legacy_read_records)
+            run(f"{name} new", path, fccdb.read_uls_records)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Compare an analytical query over the ORM with the same query over a snapshot.
+
+The query counts history codes per state. It is run once by iterating ORM objects
+from a sqlite database loaded with bulk_import_csv, and once by scanning a Parquet
+snapshot of the same files with pyarrow. Run from the top of the repository:
+
+    python -m benchmarks.snapshot --rows 200000
+"""
+
+from collections import Counter
+
+import os
+import tempfile
+import time
+
+import click
+import pyarrow.dataset
+
+from sqlalchemy import create_engine
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from fccdb import Base
+from fccdb import Entity
+from fccdb import History
+
+import snapshot
+
+from benchmarks.synthetic import entity_lines, history_lines, write_file
+
+
+@click.command()
+@click.option("--rows", "-n", default=200_000)
+@click.option("--jobs", "-j", default=2)
+def main(rows: int, jobs: int):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        datadir = os.path.join(tmpdir, "db")
+        os.mkdir(datadir)
+        files = {
+            "EN": os.path.join(datadir, "EN.dat"),
+            "HS": os.path.join(datadir, "HS.dat"),
+        }
+        write_file(files["EN"], entity_lines(rows))
+        write_file(files["HS"], history_lines(rows * 3))
+
+        start = time.perf_counter()
+        engine = create_engine(f"sqlite:///{os.path.join(tmpdir, 'fcc.db')}")
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            for model, path in [(Entity, files["EN"]), (History, files["HS"])]:
+                with open(path, newline="\r\n") as fd:
+                    model.bulk_import_csv(fd, conn)
+        print(f"database load: {time.perf_counter() - start:.2f}s")
+
+        start = time.perf_counter()
+        outdir = os.path.join(tmpdir, "snapshot")
+        snapshot.snapshot(files, outdir, partition_by="state", jobs=jobs)
+        print(f"snapshot:      {time.perf_counter() - start:.2f}s")
+
+        start = time.perf_counter()
+        orm_counts: Counter[tuple[str, str]] = Counter()
+        with Session(engine) as session:
+            query = select(History, Entity).join(Entity)
+            for history, entity in session.execute(
+                query.execution_options(yield_per=10000)
+            ):
+                orm_counts[entity.state, history.code] += 1
+        print(f"orm query:     {time.perf_counter() - start:.2f}s")
+
+        start = time.perf_counter()
+        table = (
+            pyarrow.dataset.dataset(
+                os.path.join(outdir, "history"), partitioning="hive"
+            )
+            .to_table(columns=["state", "code"])
+            .group_by(["state", "code"])
+            .aggregate([("code", "count")])
+        )
+        arrow_counts = Counter(
+            {
+                (row["state"], row["code"]): row["code_count"]
+                for row in table.to_pylist()
+            }
+        )
+        print(f"arrow query:   {time.perf_counter() - start:.2f}s")
+        assert arrow_counts == orm_counts
+
+
+if __name__ == "__main__":
+    main()
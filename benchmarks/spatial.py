@@ -0,0 +1,114 @@
+"""Compare geohash-indexed spatial queries with a linear scan of all geocodes.
+
+Run from the top of the repository:
+
+    python -m benchmarks.spatial --rows 1000000
+"""
+
+import datetime
+import os
+import random
+import tempfile
+import time
+
+import click
+
+from sqlalchemy import create_engine
+from sqlalchemy import Engine
+from sqlalchemy import insert
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from fccdb import Base
+from fccdb import Entity
+from fccdb import Geocode
+
+import geolocate
+import spatial
+
+from benchmarks.synthetic import entity_lines
+
+
+def populate(engine: Engine, rows: int):
+    rng = random.Random(0)
+    now = datetime.datetime.now()
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        Entity.bulk_import_csv(entity_lines(rows), conn)
+        for start in range(1, rows + 1, 10000):
+            conn.execute(
+                insert(Geocode),
+                [
+                    {
+                        "unique_system_identifier": usi,
+                        "address_hash": "",
+                        "lat": (lat := rng.uniform(25, 49)),
+                        "lon": (lon := rng.uniform(-124, -67)),
+                        "geohash": spatial.geohash_encode(lat, lon),
+                        "source": "benchmark",
+                        "geocoded_at": now,
+                    }
+                    for usi in range(start, min(start + 10000, rows + 1))
+                ],
+            )
+
+
+def linear_radius(
+    session: Session, lat: float, lon: float, radius_km: float
+) -> list[tuple[int, float]]:
+    found = []
+    query = select(Geocode.unique_system_identifier, Geocode.lat, Geocode.lon)
+    for usi, entity_lat, entity_lon in session.execute(query):
+        if (
+            distance := spatial.haversine_km(lat, lon, entity_lat, entity_lon)
+        ) <= radius_km:
+            found.append((usi, distance))
+    return sorted(found, key=lambda result: result[1])
+
+
+def timed(label: str, repeat: int, fn) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:>24}: {elapsed * 1000:10.3f} ms")
+    return elapsed
+
+
+@click.command()
+@click.option("--rows", "-n", default=1_000_000)
+@click.option("--repeat", "-r", default=5)
+@click.option("--radius", default=25.0, help="Search radius in km")
+@click.option("--k", default=10, help="Neighbours for the nearest search")
+def main(rows: int, repeat: int, radius: float, k: int):
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmpdir, 'fcc.db')}")
+        populate(engine, rows)
+
+        points = [(rng.uniform(30, 45), rng.uniform(-120, -70)) for _ in range(repeat)]
+        with Session(engine) as session:
+
+            def point():
+                return points[rng.randrange(len(points))]
+
+            linear = timed(
+                "linear scan radius",
+                repeat,
+                lambda: linear_radius(session, *point(), radius),
+            )
+            indexed = timed(
+                "geohash radius",
+                repeat,
+                lambda: geolocate.within_radius(session, *point(), radius),
+            )
+            timed(
+                f"geohash nearest {k}",
+                repeat,
+                lambda: geolocate.nearest(session, *point(), k),
+            )
+            print(f"radius search speedup: {linear / indexed:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
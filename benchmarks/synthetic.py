@@ -0,0 +1,74 @@
+"""Generators for synthetic ULS .dat files used by the benchmarks."""
+
+from collections.abc import Iterator
+
+import random
+
+STATES = ["MA", "NH", "VT", "ME", "RI", "CT", "NY", "CA", "TX", "WA"]
+HISTORY_CODES = ["LIISS", "LIREN", "LIMOD", "LIEXP", "LICAN", "LIPUR"]
+STREETS = ["Main St", "Livermore Road", "Elm St", "Pleasant St", "Concord Ave"]
+CITIES = ["Belmont", "Arlington", "Lexington", "Waltham", "Watertown"]
+
+
+def random_date(rng: random.Random) -> str:
+    return (
+        f"{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/{rng.randint(1990, 2024)}"
+    )
+
+
+def entity_lines(count: int, seed: int = 0) -> Iterator[str]:
+    rng = random.Random(seed)
+    for usi in range(1, count + 1):
+        fields = [
+            "EN",
+            str(usi),
+            "",
+            "",
+            f"K{usi % 10}{usi:06d}"[:10],
+            "L",
+            f"L{usi:08d}",
+            f"Licensee {usi}",
+            f"First{usi % 1000}",
+            "Q",
+            f"Last{usi % 5000}",
+            "",
+            "",
+            "",
+            "",
+            f"{rng.randint(1, 999)} {rng.choice(STREETS)}",
+            rng.choice(CITIES),
+            rng.choice(STATES),
+            f"{rng.randint(1000, 99999):05d}",
+            "",
+            "",
+            "000",
+            f"{usi:010d}",
+            "I",
+            "",
+            "" if rng.random() < 0.8 else "A",
+            "" if rng.random() < 0.8 else random_date(rng),
+            "",
+            "",
+            "",
+        ]
+        yield "|".join(fields) + "\r\n"
+
+
+def history_lines(count: int, seed: int = 0) -> Iterator[str]:
+    rng = random.Random(seed)
+    for i in range(count):
+        usi = i // 3 + 1
+        fields = [
+            "HS",
+            str(usi),
+            "",
+            f"K{usi % 10}{usi:06d}"[:10],
+            random_date(rng),
+            rng.choice(HISTORY_CODES),
+        ]
+        yield "|".join(fields) + "\r\n"
+
+
+def write_file(path: str, lines: Iterator[str]):
+    with open(path, "w", newline="") as fd:
+        fd.writelines(lines)
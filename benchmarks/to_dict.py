@@ -0,0 +1,61 @@
+"""Compare Base.to_dict() with the inspect()-based version it replaced.
+
+Entities are loaded in chunks, and only the to_dict() calls are timed. Run from
+the top of the repository:
+
+    python -m benchmarks.to_dict --rows 1000000
+"""
+
+from typing import Any
+
+import time
+
+import click
+
+from sqlalchemy import create_engine
+from sqlalchemy import inspect
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from fccdb import Base
+from fccdb import Entity
+
+from benchmarks.synthetic import entity_lines
+
+
+def legacy_to_dict(obj: Base) -> dict[str, Any]:
+    names = [
+        field.name for field in inspect(type(obj)).c if not field.name.startswith("_")
+    ]
+    return {k: getattr(obj, k) for k in names}
+
+
+@click.command()
+@click.option("--rows", "-n", default=1_000_000)
+def main(rows: int):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        Entity.bulk_import_csv(entity_lines(rows), conn)
+
+    timings = {"legacy": 0.0, "cached": 0.0, "repr": 0.0}
+    with Session(engine) as session:
+        res = session.scalars(select(Entity).execution_options(yield_per=10000))
+        for chunk in res.partitions():
+            for label, fn in [
+                ("legacy", legacy_to_dict),
+                ("cached", Entity.to_dict),
+                ("repr", repr),
+            ]:
+                start = time.perf_counter()
+                for entity in chunk:
+                    fn(entity)
+                timings[label] += time.perf_counter() - start
+
+    for label, elapsed in timings.items():
+        print(f"{label:>8}: {elapsed:6.2f}s ({rows / elapsed:,.0f} objects/s)")
+    print(f"to_dict speedup: {timings['legacy'] / timings['cached']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
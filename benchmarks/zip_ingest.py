@@ -0,0 +1,68 @@
+"""Compare loading a ULS archive after extracting it with loading it in place.
+
+Builds a .zip archive of synthetic EN and HS files, then loads it into a fresh
+sqlite database twice: once by extracting the archive to a directory first, and
+once by reading the members straight from the archive. Run from the top of the
+repository:
+
+    python -m benchmarks.zip_ingest --rows 200000
+"""
+
+import os
+import tempfile
+import time
+import zipfile
+
+import click
+
+from sqlalchemy import create_engine
+
+from fccdb import Base
+
+import ingest
+
+from benchmarks.synthetic import entity_lines, history_lines, write_file
+
+
+def load(path: str, dburi: str, parsers: int) -> float:
+    engine = create_engine(dburi)
+    Base.metadata.create_all(engine)
+    start = time.perf_counter()
+    ingest.IngestEngine(engine, parsers=parsers).load(ingest.find_sources(path))
+    return time.perf_counter() - start
+
+
+@click.command()
+@click.option("--rows", "-n", default=200_000)
+@click.option("--parsers", "-p", default=2)
+def main(rows: int, parsers: int):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        archive = os.path.join(tmpdir, "l_amat.zip")
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+            for name, lines in [
+                ("EN.dat", entity_lines(rows)),
+                ("HS.dat", history_lines(rows * 3)),
+            ]:
+                path = os.path.join(tmpdir, name)
+                write_file(path, lines)
+                zf.write(path, name)
+                os.unlink(path)
+        print(f"archive:   {os.path.getsize(archive) / 1e6:.1f} MB")
+
+        start = time.perf_counter()
+        datadir = os.path.join(tmpdir, "extracted")
+        with zipfile.ZipFile(archive) as zf:
+            zf.extractall(datadir)
+        extracted = sum(
+            os.path.getsize(os.path.join(datadir, name)) for name in os.listdir(datadir)
+        )
+        elapsed = time.perf_counter() - start
+        elapsed += load(datadir, f"sqlite:///{tmpdir}/extracted.db", parsers)
+        print(f"extracted: {elapsed:.2f}s ({extracted / 1e6:.1f} MB on disk)")
+
+        elapsed = load(archive, f"sqlite:///{tmpdir}/direct.db", parsers)
+        print(f"direct:    {elapsed:.2f}s (0.0 MB on disk)")
+
+
+if __name__ == "__main__":
+    main()
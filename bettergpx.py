@@ -1,7 +1,13 @@
-from typing import Literal
+from collections.abc import Iterator
+from typing import Any, BinaryIO, cast, Literal, NamedTuple, Self
 
 import datetime
+import gzip
+import math
 
+from array import array
+
+from lxml import etree
 from pydantic_xml import BaseXmlModel, attr, element
 from pydantic import NonNegativeInt
 
@@ -120,3 +126,175 @@ class GpxFile(
     waypoints: list[Waypoint] = element(tag="wpt", default_factory=list)
     routes: list[Route] = element(tag="rte", default_factory=list)
     tracks: list[Track] = element(tag="trk", default_factory=list)
+
+
+class GpxWriter:
+    """Write a GPX document one waypoint, route or track at a time.
+
+    Each item is serialized by its model and written out immediately, so memory
+    use doesn't grow with the size of the document. The output is the same as
+    GpxFile.to_xml(skip_empty=True) for a GpxFile holding the same items. Items
+    must be written in schema order: waypoints, then routes, then tracks.
+
+        with GpxWriter(fd, compress=True) as writer:
+            for wpt in waypoints:
+                writer.write(wpt)
+    """
+
+    # Element names and schema order of the items that may be written.
+    sections: dict[type, tuple[int, str]] = {
+        Waypoint: (0, "wpt"),
+        Route: (1, "rte"),
+        Track: (2, "trk"),
+    }
+
+    def __init__(
+        self,
+        fd: BinaryIO,
+        metadata: Metadata | None = None,
+        pretty_print: bool = False,
+        compress: bool = False,
+    ):
+        self.pretty_print = pretty_print
+        self.newline = b"\n" if pretty_print else b""
+        self.gzip = gzip.GzipFile(fileobj=fd, mode="wb") if compress else None
+        self.fd: BinaryIO = fd if self.gzip is None else self.gzip
+        self.section, self.tag = self.sections[Waypoint]
+        self.count = 0
+        self.closed = False
+
+        # Render the root element (and metadata) with the GpxFile model, so the
+        # namespaces and attributes match, and split it open.
+        doc = (
+            GpxFile(metadata=metadata)
+            .to_xml(skip_empty=True, pretty_print=pretty_print)
+            .rstrip()
+        )
+        if doc.endswith(b"/>"):
+            self.fd.write(doc[:-2] + b">" + self.newline)
+        else:
+            self.fd.write(doc.removesuffix(b"</gpx>"))
+
+    def write(self, item: Waypoint | Route | Track):
+        section, tag = self.sections[type(item)]
+        if section < self.section:
+            raise ValueError(f"{tag} elements must come before {self.tag} elements")
+        self.section, self.tag = section, tag
+
+        tree = item.to_xml_tree(skip_empty=True)
+        tree.tag = tag
+        if self.pretty_print:
+            etree.indent(tree, level=1)
+            self.fd.write(b"  " + etree.tostring(tree) + b"\n")
+        else:
+            self.fd.write(etree.tostring(tree))
+        self.count += 1
+
+    def close(self):
+        """Finish the document. The underlying file is not closed."""
+
+        if self.closed:
+            return
+        self.fd.write(b"</gpx>" + self.newline)
+        if self.gzip is not None:
+            self.gzip.close()
+        self.closed = True
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, *args: object):
+        # Leave the document unterminated on errors, so that a partial export
+        # can't be mistaken for a complete one.
+        if exc_type is None:
+            self.close()
+
+
+def _localname(tag: str) -> str:
+    return tag.rpartition("}")[2]
+
+
+def _clear(elem: etree._Element):
+    """Free a parsed element and the siblings before it."""
+
+    elem.clear()
+    while elem.getprevious() is not None:
+        del elem.getparent()[0]
+
+
+def _point_fields(elem: etree._Element) -> dict[str, Any]:
+    fields: dict[str, Any] = dict(elem.attrib)
+    for child in elem:
+        name = _localname(child.tag)
+        if name == "link":
+            fields[name] = dict(child.attrib) | {
+                _localname(sub.tag): sub.text for sub in child
+            }
+        elif name in Waypoint.model_fields and child.text is not None:
+            fields[name] = child.text
+    return fields
+
+
+def iter_points(source: Any, tag: str = "wpt") -> Iterator[Waypoint]:
+    """Yield the wpt, rtept or trkpt elements of a GPX file as validated Waypoints.
+
+    The file (a path or binary file object) is parsed incrementally and each
+    element is freed once it has been read, so memory use does not grow with the
+    size of the file. Unknown elements, such as extensions, are ignored."""
+
+    for _, elem in etree.iterparse(source, tag=f"{{*}}{tag}"):
+        fields = _point_fields(elem)
+        _clear(elem)
+        # model_validate() is several times faster than model_construct() here.
+        yield Waypoint.model_validate(fields)
+
+
+class PointColumns(NamedTuple):
+    """Coordinates of a sequence of points as parallel arrays of doubles.
+
+    Missing elevations and times are NaN, and times are POSIX timestamps. The arrays
+    support the buffer protocol, so numpy.frombuffer() can wrap them without
+    copying."""
+
+    lat: array
+    lon: array
+    ele: array
+    time: array
+
+
+def iter_track_segments(source: Any, validate: bool = False) -> Iterator[PointColumns]:
+    """Yield the points of each trkseg in a GPX file as PointColumns.
+
+    Elements are freed as they are read. Only lat, lon, ele and time are read,
+    and no model is built for each point unless validate is true, in which case
+    every trkpt must also be a valid Waypoint."""
+
+    columns = PointColumns(array("d"), array("d"), array("d"), array("d"))
+    for _, elem in etree.iterparse(source, tag=("{*}trkpt", "{*}trkseg")):
+        if _localname(elem.tag) == "trkseg":
+            yield columns
+            columns = PointColumns(array("d"), array("d"), array("d"), array("d"))
+            _clear(elem)
+            continue
+
+        if validate:
+            wpt = Waypoint.model_validate(_point_fields(elem))
+            lat, lon = cast(float, wpt.lat), cast(float, wpt.lon)
+            ele = math.nan if wpt.ele is None else wpt.ele
+            time = math.nan if wpt.time is None else wpt.time.timestamp()
+        else:
+            lat, lon = float(elem.get("lat")), float(elem.get("lon"))
+            ele = time = math.nan
+            for child in elem:
+                if child.text is None:
+                    continue
+                name = _localname(child.tag)
+                if name == "ele":
+                    ele = float(child.text)
+                elif name == "time":
+                    time = datetime.datetime.fromisoformat(child.text).timestamp()
+        columns.lat.append(lat)
+        columns.lon.append(lon)
+        columns.ele.append(ele)
+        columns.time.append(time)
+        _clear(elem)
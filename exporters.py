@@ -0,0 +1,202 @@
+"""Writers for the located entities exported by geolocate.
+
+Every exporter is fed the same stream of ExportRow batches and writes each batch
+out before the next one arrives, so memory use is bounded by the batch size."""
+
+from abc import ABC, abstractmethod
+from collections.abc import Sequence
+from typing import Any, BinaryIO, NamedTuple, Self
+
+import csv
+import gzip
+import io
+import json
+import struct
+
+import bettergpx as gpx
+
+
+class ExportRow(NamedTuple):
+    lat: float
+    lon: float
+    name: str
+    desc: str
+    properties: dict[str, Any]
+
+
+class Exporter(ABC):
+    """Base class for export formats.
+
+    fields maps the names of the properties carried by each row to their types
+    (str, int or float); formats with a fixed schema use it to build one."""
+
+    extension: str = ""
+
+    def __init__(self, fd: BinaryIO, fields: dict[str, type], compress: bool = False):
+        self.fields = fields
+        self.gzip = gzip.GzipFile(fileobj=fd, mode="wb") if compress else None
+        self.fd: BinaryIO = fd if self.gzip is None else self.gzip
+        self.count = 0
+
+    def write(self, rows: Sequence[ExportRow]):
+        self.write_rows(rows)
+        self.count += len(rows)
+
+    @abstractmethod
+    def write_rows(self, rows: Sequence[ExportRow]):
+        """Write one batch of rows."""
+
+    def finish(self):
+        """Write anything that must follow the last row."""
+
+    def close(self):
+        """Finish the output. The underlying file is not closed."""
+
+        self.finish()
+        if self.gzip is not None:
+            self.gzip.close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, *args: object):
+        # As with GpxWriter, a failed export is left unfinished rather than made
+        # to look complete.
+        if exc_type is None:
+            self.close()
+
+
+class GpxExporter(Exporter):
+    """GPX waypoints. Row properties are not included."""
+
+    extension = ".gpx"
+
+    def __init__(self, fd: BinaryIO, fields: dict[str, type], compress: bool = False):
+        super().__init__(fd, fields, compress)
+        self.writer = gpx.GpxWriter(self.fd, pretty_print=True)
+
+    def write_rows(self, rows: Sequence[ExportRow]):
+        for row in rows:
+            self.writer.write(
+                gpx.Waypoint(name=row.name, desc=row.desc, lat=row.lat, lon=row.lon)
+            )
+
+    def finish(self):
+        self.writer.close()
+
+
+class GeoJsonSeqExporter(Exporter):
+    """Newline-delimited GeoJSON Point features, one per line."""
+
+    extension = ".geojsonl"
+
+    def write_rows(self, rows: Sequence[ExportRow]):
+        self.fd.write(
+            "".join(
+                json.dumps(
+                    {
+                        "type": "Feature",
+                        "geometry": {
+                            "type": "Point",
+                            "coordinates": [row.lon, row.lat],
+                        },
+                        "properties": {
+                            "name": row.name,
+                            "desc": row.desc,
+                            **row.properties,
+                        },
+                    },
+                    default=str,
+                )
+                + "\n"
+                for row in rows
+            ).encode()
+        )
+
+
+class CsvExporter(Exporter):
+    extension = ".csv"
+
+    def __init__(self, fd: BinaryIO, fields: dict[str, type], compress: bool = False):
+        super().__init__(fd, fields, compress)
+        self.text = io.TextIOWrapper(self.fd, encoding="utf-8", newline="")
+        self.writer = csv.writer(self.text)
+        self.writer.writerow(["lat", "lon", "name", "desc", *fields])
+
+    def write_rows(self, rows: Sequence[ExportRow]):
+        self.writer.writerows(
+            [
+                row.lat,
+                row.lon,
+                row.name,
+                row.desc,
+                *(row.properties.get(field) for field in self.fields),
+            ]
+            for row in rows
+        )
+
+    def finish(self):
+        # Flush without closing the underlying file.
+        self.text.flush()
+        self.text.detach()
+
+
+class ParquetExporter(Exporter):
+    """GeoParquet, with WKB point geometries. Requires pyarrow.
+
+    Each batch of rows is written as its own row group. compress is ignored;
+    columns are always zstd compressed."""
+
+    extension = ".parquet"
+
+    def __init__(self, fd: BinaryIO, fields: dict[str, type], compress: bool = False):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ValueError("parquet export requires pyarrow")
+
+        super().__init__(fd, fields)
+        self.pa = pyarrow
+        types = {str: pyarrow.string(), int: pyarrow.int64(), float: pyarrow.float64()}
+        geo = {
+            "version": "1.0.0",
+            "primary_column": "geometry",
+            "columns": {"geometry": {"encoding": "WKB", "geometry_types": ["Point"]}},
+        }
+        self.schema = pyarrow.schema(
+            [
+                ("geometry", pyarrow.binary()),
+                ("name", pyarrow.string()),
+                ("desc", pyarrow.string()),
+                *((name, types[kind]) for name, kind in fields.items()),
+            ],
+            metadata={"geo": json.dumps(geo)},
+        )
+        self.writer = pyarrow.parquet.ParquetWriter(
+            self.fd, self.schema, compression="zstd"
+        )
+
+    def write_rows(self, rows: Sequence[ExportRow]):
+        columns = {
+            # WKB: little endian, geometry type 1 (point), x, y
+            "geometry": [struct.pack("<BIdd", 1, 1, row.lon, row.lat) for row in rows],
+            "name": [row.name for row in rows],
+            "desc": [row.desc for row in rows],
+        }
+        for field in self.fields:
+            columns[field] = [row.properties.get(field) for row in rows]
+        self.writer.write_batch(
+            self.pa.RecordBatch.from_pydict(columns, schema=self.schema)
+        )
+
+    def finish(self):
+        self.writer.close()
+
+
+EXPORTERS: dict[str, type[Exporter]] = {
+    "gpx": GpxExporter,
+    "geojsonseq": GeoJsonSeqExporter,
+    "csv": CsvExporter,
+    "parquet": ParquetExporter,
+}
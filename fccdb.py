@@ -1,22 +1,54 @@
-from typing import override, Any
-from collections.abc import Iterable
+from typing import override, Any, TextIO
+from collections.abc import Callable, Iterable, Iterator, Sequence
 
 import datetime
 import csv
+import functools
+import hashlib
+import io
+import itertools
 
+from collections import Counter
+
+from sqlalchemy import and_
+from sqlalchemy import BigInteger
+from sqlalchemy import bindparam
+from sqlalchemy import Boolean
+from sqlalchemy import case
 from sqlalchemy import create_engine
+from sqlalchemy import Connection
 from sqlalchemy import Date
+from sqlalchemy import DateTime
+from sqlalchemy import DDL
+from sqlalchemy import event
+from sqlalchemy import Float
+from sqlalchemy import func
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
+from sqlalchemy import insert
 from sqlalchemy import inspect
 from sqlalchemy import Integer
+from sqlalchemy import or_
 from sqlalchemy import String
+from sqlalchemy import Table
+from sqlalchemy import select
+from sqlalchemy import Select
 from sqlalchemy import Text
+from sqlalchemy import text
+from sqlalchemy import update
+from sqlalchemy.types import TypeEngine
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm import Session
-from sqlalchemy.orm import validates
+
+from geoindex import normalize_address
+from spatial import geohash_encode
+from ulsschema import ColumnSpec
+from ulsschema import load_tables
+from ulsschema import table_name
+from ulsschema import TableSpec
 
 
 def validate_date_field(
@@ -38,6 +70,129 @@ def validate_date_field(
         )
 
 
+def validate_integer_field(name: str, value: str | int | None) -> int | None:
+    if value is None or value == "":
+        return None
+    return int(value)
+
+
+def validate_float_field(name: str, value: str | float | None) -> float | None:
+    if value is None or value == "":
+        return None
+    return float(value)
+
+
+# ULS files repeat a few thousand distinct dates across millions of rows, so
+# parsed dates are memoized.
+@functools.lru_cache(maxsize=1 << 16)
+def _parse_date(value: str) -> datetime.date | None:
+    return validate_date_field("", value)
+
+
+def coerce_date(name: str, value: str | datetime.date | None) -> datetime.date | None:
+    if isinstance(value, str):
+        return _parse_date(value)
+    return validate_date_field(name, value)
+
+
+def coerce_dates(
+    name: str, values: Sequence[str | datetime.date | None]
+) -> list[datetime.date | None]:
+    parse = _parse_date
+    return [
+        parse(value) if isinstance(value, str) else validate_date_field(name, value)
+        for value in values
+    ]
+
+
+def coerce_integers(name: str, values: Sequence[str | int | None]) -> list[int | None]:
+    return [None if value is None or value == "" else int(value) for value in values]
+
+
+def coerce_floats(
+    name: str, values: Sequence[str | float | None]
+) -> list[float | None]:
+    return [None if value is None or value == "" else float(value) for value in values]
+
+
+# Column types that need converting from the strings found in ULS files. Each
+# entry maps a type to a function that converts a single value (used when
+# setting attributes on model instances) and one that converts a whole column
+# of a batch of rows.
+COERCERS: list[
+    tuple[type, Callable[[str, Any], Any], Callable[[str, Sequence[Any]], list[Any]]]
+] = [
+    (Date, coerce_date, coerce_dates),
+    (Integer, validate_integer_field, coerce_integers),
+    (Float, validate_float_field, coerce_floats),
+]
+
+
+# Number of rows written per executemany (or COPY) call by Base.bulk_import_csv.
+DEFAULT_BATCH_SIZE = 10000
+
+# Number of characters read at a time by read_uls_records.
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+
+def read_uls_records(
+    data: Iterable[str] | TextIO,
+    delimiter: str = "|",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[list[str]]:
+    """Split ULS source data into records, each a list of field values.
+
+    Fields in ULS source files are unquoted, but in some cases contain embedded carriage returns.
+    Records end with '\r\n', except that a '\r\r\n' sequence is a line continuation; any carriage
+    returns left inside a record are replaced with spaces. This means files must be opened with
+    newline="\r\n" so that line endings are not translated.
+
+    If data has a read() method it is consumed in chunks of chunk_size characters; otherwise it can
+    be any iterable of strings (lines or arbitrary chunks). Blank records are skipped.
+    """
+
+    if hasattr(data, "read"):
+        chunks: Iterable[str] = iter(functools.partial(data.read, chunk_size), "")
+    else:
+        chunks = data
+
+    # carry holds raw text after the last '\r\n' we have seen; pending holds the processed
+    # start of a record that was continued onto the next line.
+    carry = ""
+    pending = ""
+    for chunk in chunks:
+        buf = carry + chunk if carry else chunk
+        end = buf.rfind("\r\n")
+        if end < 0:
+            carry = buf
+            continue
+        carry = buf[end + 2 :]
+        records = buf[: end + 2].replace("\r\r\n", " ").split("\r\n")
+        records[0] = pending + records[0]
+        pending = records.pop()
+        for record in records:
+            if record:
+                if "\r" in record:
+                    record = record.replace("\r", " ")
+                yield record.split(delimiter)
+
+    # A final record without a line ending is still a record, unless it ends in a
+    # continuation.
+    if carry and not carry.endswith("\r"):
+        yield (pending + carry).replace("\r", " ").split(delimiter)
+
+
+def _coerce_attribute(
+    coerce: Callable[[str, Any], Any],
+    name: str,
+    target: Any,
+    value: Any,
+    oldvalue: Any,
+    initiator: Any,
+) -> Any:
+    return coerce(name, value)
+
+
 class uls_dialect(csv.Dialect):
     delimiter = "|"
     quotechar = '"'
@@ -52,54 +207,306 @@ class uls_dialect(csv.Dialect):
 csv.register_dialect("uls", uls_dialect)
 
 
+ColumnCoercer = Callable[[str, Sequence[Any]], list[Any]]
+
+
 class Base(DeclarativeBase):
+    # The column layout of each model, computed once by __init_subclass__.
+    _field_names: tuple[str, ...] = ()
+    _coercers: tuple[ColumnCoercer | None, ...] = ()
+
+    @classmethod
+    def get_field_names(cls) -> tuple[str, ...]:
+        """Return the names of the model's columns, except those starting with "_"."""
+
+        return cls._field_names
+
+    def __init_subclass__(cls, **kw: Any):
+        super().__init_subclass__(**kw)
+
+        columns = [
+            column for column in inspect(cls).c if not column.name.startswith("_")
+        ]
+        cls._field_names = tuple(column.name for column in columns)
+        cls._coercers = tuple(
+            next(
+                (
+                    coerce_column
+                    for coltype, _, coerce_column in COERCERS
+                    if isinstance(column.type, coltype)
+                ),
+                None,
+            )
+            for column in columns
+        )
+
+        # Convert values assigned to Date and Integer attributes, so that models can be
+        # built directly from the strings in ULS files.
+        for column in cls.__table__.columns:
+            for coltype, coerce, _ in COERCERS:
+                if isinstance(column.type, coltype):
+                    event.listen(
+                        getattr(cls, column.key),
+                        "set",
+                        functools.partial(_coerce_attribute, coerce, column.key),
+                        retval=True,
+                    )
+                    break
+
     @classmethod
-    def get_field_names(cls) -> list[str]:
-        mapper = inspect(cls)
-        return [field.name for field in mapper.c if not field.name.startswith("_")]
+    def get_coercers(cls) -> tuple[ColumnCoercer | None, ...]:
+        """Return a column conversion function (or None) for each of get_field_names()."""
+
+        return cls._coercers
 
     @classmethod
-    def import_csv(cls, data: Iterable[str], session: Session, delimiter: str = "|"):
-        def line_combiner(data: Iterable[str]) -> Iterable[str]:
-            """Deal with weird quoting in ULS source files.
-
-            Fields in ULS source files are unquoted, but in some cases contained embedded carriage returns. To
-            avoid problems, we need to (a) disable universal newlines when opening the files, and (b) we need
-            to identify terminal carriage returns as line-continuation characters, and (c) we need to replace
-            them with another character to keep the csv module happy."""
-
-            vline: list[str] = []
-            for line in data:
-                # strip '\r\n' from end of line
-                line = line.removesuffix("\r\n")
-                vline.append(line.replace("\r", " "))
-                if line.endswith("\r"):
-                    continue
-                yield "".join(vline)
-                vline = []
+    def coerce_records(cls, records: Sequence[list[str]]) -> list[tuple[Any, ...]]:
+        """Convert a batch of records from a ULS file into rows in get_field_names() order.
+
+        Conversion is done a column at a time. Short records are padded with None."""
+
+        return list(zip(*cls.coerce_columns(records)))
+
+    @classmethod
+    def coerce_columns(cls, records: Sequence[list[str]]) -> list[Sequence[Any]]:
+        """Convert a batch of records from a ULS file into columns in get_field_names() order."""
 
         fieldnames = cls.get_field_names()
-        reader = csv.DictReader(
-            line_combiner(data), fieldnames=fieldnames, dialect="uls"
-        )
-        for row in reader:
+        nfields = len(fieldnames)
+        for record in records:
+            if len(record) != nfields:
+                if len(record) > nfields:
+                    raise ValueError(
+                        f"{cls.__tablename__}: expected {nfields} fields, found {len(record)}"
+                    )
+                record.extend([None] * (nfields - len(record)))
+
+        columns: list[Sequence[Any]] = list(zip(*records))
+        if not columns:
+            return []
+        for i, coerce in enumerate(cls.get_coercers()):
+            if coerce is not None:
+                columns[i] = coerce(fieldnames[i], columns[i])
+        return columns
+
+    @staticmethod
+    def read_records(
+        data: Iterable[str] | TextIO, delimiter: str = "|"
+    ) -> Iterator[list[str]]:
+        return read_uls_records(data, delimiter=delimiter)
+
+    @classmethod
+    def import_csv(
+        cls, data: Iterable[str] | TextIO, session: Session, delimiter: str = "|"
+    ):
+        fieldnames = cls.get_field_names()
+        for record in cls.read_records(data, delimiter=delimiter):
+            row = dict(itertools.zip_longest(fieldnames, record))
             obj = cls(**row)
             session.add(obj)
 
+    @classmethod
+    def iter_rows(
+        cls, data: Iterable[str] | TextIO, delimiter: str = "|"
+    ) -> Iterator[tuple[Any, ...]]:
+        """Yield coerced rows as plain tuples in get_field_names() order."""
+
+        for batch in cls.iter_batches(data, delimiter=delimiter):
+            yield from batch
+
+    @classmethod
+    def bulk_import_csv(
+        cls,
+        data: Iterable[str] | TextIO,
+        session: Session | Connection,
+        delimiter: str = "|",
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> int:
+        """Load a ULS file without creating ORM objects.
+
+        Rows are written in batches of batch_size using executemany, or using COPY when
+        talking to PostgreSQL, so memory use does not grow with the size of the input.
+        Returns the number of rows written."""
+
+        conn = session.connection() if isinstance(session, Session) else session
+        count = 0
+        for batch in cls.iter_batches(data, delimiter=delimiter, batch_size=batch_size):
+            cls.write_batch(conn, batch)
+            count += len(batch)
+        return count
+
+    @classmethod
+    def iter_batches(
+        cls,
+        data: Iterable[str] | TextIO,
+        delimiter: str = "|",
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> Iterator[list[tuple[Any, ...]]]:
+        for records in itertools.batched(
+            cls.read_records(data, delimiter=delimiter), batch_size
+        ):
+            yield cls.coerce_records(records)
+
+    @classmethod
+    def iter_column_batches(
+        cls,
+        data: Iterable[str] | TextIO,
+        delimiter: str = "|",
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> Iterator[list[Sequence[Any]]]:
+        """Like iter_batches(), but yield each batch as columns rather than rows."""
+
+        for records in itertools.batched(
+            cls.read_records(data, delimiter=delimiter), batch_size
+        ):
+            yield cls.coerce_columns(records)
+
+    @classmethod
+    def write_batch(cls, conn: Connection, rows: Iterable[tuple[Any, ...]]):
+        fieldnames = cls.get_field_names()
+        if conn.dialect.name == "postgresql":
+            cls._copy_batch(conn, fieldnames, rows)
+        else:
+            conn.execute(
+                insert(cls.__table__), [dict(zip(fieldnames, row)) for row in rows]
+            )
+
+    @classmethod
+    def upsert_csv(
+        cls,
+        data: Iterable[str] | TextIO,
+        session: Session | Connection,
+        delimiter: str = "|",
+        changed_ids: set[int] | None = None,
+    ) -> int:
+        """Apply a ULS daily transaction file. Returns the number of rows written.
+
+        See upsert_rows(). Transaction files are small, so the whole file is read
+        into memory to group rows by unique_system_identifier."""
+
+        conn = session.connection() if isinstance(session, Session) else session
+        return cls.upsert_rows(
+            conn, cls.iter_rows(data, delimiter=delimiter), changed_ids=changed_ids
+        )
+
+    @classmethod
+    def upsert_rows(
+        cls,
+        conn: Connection,
+        rows: Iterable[tuple[Any, ...]],
+        changed_ids: set[int] | None = None,
+        ids: Iterable[int] = (),
+    ) -> int:
+        """Replace stored rows with the given rows, keyed on unique_system_identifier.
+
+        The rows for each unique_system_identifier replace everything currently
+        stored for that identifier in this table, so rows that are missing from the
+        transaction file are deleted. ids are more identifiers to replace, such as
+        those found in the other files of a daily transaction set; in tables other
+        than entity, their stored rows are deleted if rows has none for them.
+        Identifiers whose rows are unchanged are skipped. Returns the number of rows
+        written; if changed_ids is given, the identifiers that were written or
+        deleted are added to it."""
+
+        table = cls.__table__
+        fieldnames = cls.get_field_names()
+        key = fieldnames.index("unique_system_identifier")
+        usi = table.c.unique_system_identifier
+
+        incoming: dict[int, list[tuple[Any, ...]]] = {}
+        if list(table.primary_key.columns) != [usi]:
+            incoming = {k: [] for k in ids}
+        for row in rows:
+            incoming.setdefault(row[key], []).append(row)
+
+        existing: dict[int, list[tuple[Any, ...]]] = {}
+        columns = [table.c[name] for name in fieldnames]
+        for usis in itertools.batched(incoming, 500):
+            for row in conn.execute(select(*columns).where(usi.in_(usis))):
+                existing.setdefault(row[key], []).append(tuple(row))
+
+        changed = {
+            k: v
+            for k, v in incoming.items()
+            if Counter(v) != Counter(existing.get(k, []))
+        }
+        if not changed:
+            return 0
+        if changed_ids is not None:
+            changed_ids.update(changed)
+
+        if list(table.primary_key.columns) == [usi]:
+            # Other tables reference these rows, so update them in place rather
+            # than deleting and re-inserting.
+            updated = [row for k, v in changed.items() if k in existing for row in v]
+            inserted = [
+                row for k, v in changed.items() if k not in existing for row in v
+            ]
+            if updated:
+                conn.execute(
+                    update(table).where(usi == bindparam("b_usi")),
+                    [dict(zip(fieldnames, row), b_usi=row[key]) for row in updated],
+                )
+        else:
+            for usis in itertools.batched(changed, 500):
+                conn.execute(table.delete().where(usi.in_(usis)))
+            inserted = [row for v in changed.values() for row in v]
+
+        for batch in itertools.batched(inserted, DEFAULT_BATCH_SIZE):
+            cls.write_batch(conn, batch)
+
+        return sum(len(v) for v in changed.values())
+
+    @classmethod
+    def _copy_batch(
+        cls,
+        conn: Connection,
+        fieldnames: Sequence[str],
+        rows: Iterable[tuple[Any, ...]],
+    ):
+        copy_sql = (
+            f"COPY {cls.__tablename__} ({', '.join(fieldnames)}) FROM STDIN"
+            " WITH (FORMAT csv)"
+        )
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            if hasattr(cursor, "copy"):
+                # psycopg 3
+                with cursor.copy(copy_sql) as copy:
+                    for row in rows:
+                        copy.write_row(row)
+            else:
+                # psycopg2. QUOTE_STRINGS leaves None unquoted, which COPY reads as NULL,
+                # while empty strings are written as "" and preserved.
+                buf = io.StringIO()
+                csv.writer(buf, quoting=csv.QUOTE_STRINGS).writerows(rows)
+                buf.seek(0)
+                cursor.copy_expert(copy_sql, buf)
+        finally:
+            cursor.close()
+
     @override
     def __repr__(self) -> str:
+        state = self.__dict__
         return (
             f"{self.__class__.__name__}("
-            f"{','.join([f'{key}={self.__dict__[key]!r}' for key in self.get_field_names() if key in self.__dict__])}"
+            f"{','.join([f'{key}={state[key]!r}' for key in self._field_names if key in state])}"
             ")"
         )
 
     def to_dict(self) -> dict[str, Any]:
-        return {k: getattr(self, k) for k in self.get_field_names()}
+        # Loaded attributes are read straight from the instance dict, which is much
+        # faster than going through the attribute descriptors; anything else (such
+        # as expired attributes) goes through getattr so that it is loaded.
+        state = self.__dict__
+        return {
+            k: state[k] if k in state else getattr(self, k) for k in self._field_names
+        }
 
 
 class Entity(Base):
     __tablename__: str = "entity"
+    __table_args__ = (Index("ix_entity_state_city", "state", "city"),)
 
     record_type: Mapped[str] = mapped_column(String(2), nullable=False)
     unique_system_identifier: Mapped[int] = mapped_column(
@@ -109,9 +516,9 @@ class Entity(Base):
     )
     uls_file_number: Mapped[str] = mapped_column(String(4), nullable=True)
     ebf_number: Mapped[str] = mapped_column(String(30), nullable=True)
-    call_sign: Mapped[str] = mapped_column(String(10), nullable=True)
+    call_sign: Mapped[str] = mapped_column(String(10), nullable=True, index=True)
     entity_type: Mapped[str] = mapped_column(String(2), nullable=True)
-    licensee_id: Mapped[str] = mapped_column(String(9), nullable=True)
+    licensee_id: Mapped[str] = mapped_column(String(9), nullable=True, index=True)
     entity_name: Mapped[str] = mapped_column(String(200), nullable=True)
     first_name: Mapped[str] = mapped_column(String(20), nullable=True)
     mi: Mapped[str] = mapped_column(String(1), nullable=True)
@@ -123,11 +530,13 @@ class Entity(Base):
     street_address: Mapped[str] = mapped_column(String(60), nullable=True)
     city: Mapped[str] = mapped_column(String(20), nullable=True)
     state: Mapped[str] = mapped_column(String(2), nullable=True)
-    zip_code: Mapped[str] = mapped_column(String(9), nullable=True)
+    zip_code: Mapped[str] = mapped_column(String(9), nullable=True, index=True)
     po_box: Mapped[str] = mapped_column(String(20), nullable=True)
     attention_line: Mapped[str] = mapped_column(String(35), nullable=True)
     sgin: Mapped[str] = mapped_column(String(3), nullable=True)
-    fcc_registration_number: Mapped[str] = mapped_column(String(10), nullable=True)
+    fcc_registration_number: Mapped[str] = mapped_column(
+        String(10), nullable=True, index=True
+    )
     applicant_type_code: Mapped[str] = mapped_column(String(1), nullable=True)
     applicant_type_code_other: Mapped[str] = mapped_column(String(40), nullable=True)
     status_code: Mapped[str] = mapped_column(String(1), nullable=True)
@@ -146,18 +555,6 @@ class Entity(Base):
         relationship()
     )
 
-    @validates("status_date")
-    def validate_date_fields(
-        self, name: str, value: str | datetime.date
-    ) -> datetime.date | None:
-        return validate_date_field(name, value)
-
-    @validates("unique_system_identifier", "linked_unique_system_identifier")
-    def validate_integer_fields(self, name: str, value: str | int | None) -> int | None:
-        if value is None or value == "":
-            return None
-        return int(value)
-
 
 class Amateur(Base):
     __tablename__: str = "amateur"
@@ -169,7 +566,7 @@ class Amateur(Base):
     )
     uls_file_number: Mapped[str] = mapped_column(String(14), nullable=True)
     ebf_number: Mapped[str] = mapped_column(String(30), nullable=True)
-    call_sign: Mapped[str] = mapped_column(String(10), nullable=True)
+    call_sign: Mapped[str] = mapped_column(String(10), nullable=True, index=True)
     operator_class: Mapped[str] = mapped_column(String(1), nullable=True)
     group_code: Mapped[str] = mapped_column(String(1), nullable=True)
     region_code: Mapped[int] = mapped_column(Integer, nullable=True)
@@ -184,12 +581,6 @@ class Amateur(Base):
     previous_operator_class: Mapped[str] = mapped_column(String(1), nullable=True)
     trustee_name: Mapped[str] = mapped_column(String(50), nullable=True)
 
-    @validates("region_code")
-    def validate_integer_fields(self, name: str, value: str | int | None) -> int | None:
-        if value is None or value == "":
-            return None
-        return int(value)
-
 
 class History(Base):
     __tablename__: str = "history"
@@ -197,6 +588,7 @@ class History(Base):
     record_type: Mapped[str] = mapped_column(String(2), nullable=False)
     unique_system_identifier: Mapped[int] = mapped_column(
         ForeignKey("entity.unique_system_identifier"),
+        index=True,
     )
     uls_file_number: Mapped[str] = mapped_column(String(14), nullable=True)
     call_sign: Mapped[str] = mapped_column(String(10), nullable=True)
@@ -204,12 +596,6 @@ class History(Base):
     code: Mapped[str] = mapped_column(String(6), nullable=True)
     _id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
-    @validates("log_date")
-    def validate_date_fields(
-        self, name: str, value: str | datetime.date
-    ) -> datetime.date | None:
-        return validate_date_field(name, value)
-
 
 class LicenseHeader(Base):
     __tablename__: str = "license_header"
@@ -277,18 +663,6 @@ class LicenseHeader(Base):
     return_spectrum_cert_900: Mapped[str] = mapped_column(String(1), nullable=True)
     payment_cert_900: Mapped[str] = mapped_column(String(1), nullable=True)
 
-    @validates("grant_date", "expired_date", "cancellation_date")
-    def validate_date_fields(
-        self, name: str, value: str | datetime.date
-    ) -> datetime.date | None:
-        return validate_date_field(name, value)
-
-    @validates("auction_id")
-    def validate_integer_fields(self, name: str, value: str | int | None) -> int | None:
-        if value is None or value == "":
-            return None
-        return int(value)
-
 
 class Comment(Base):
     __tablename__: str = "comment"
@@ -296,6 +670,7 @@ class Comment(Base):
     record_type: Mapped[str] = mapped_column(String(2), nullable=False)
     unique_system_identifier: Mapped[int] = mapped_column(
         ForeignKey("entity.unique_system_identifier"),
+        index=True,
     )
     uls_file_number: Mapped[str] = mapped_column(String(14), nullable=True)
     call_sign: Mapped[str] = mapped_column(String(10), nullable=True)
@@ -305,12 +680,6 @@ class Comment(Base):
     status_date: Mapped[datetime.date] = mapped_column(Date, nullable=True)
     _id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
-    @validates("comment_date", "status_date")
-    def validate_date_fields(
-        self, name: str, value: str | datetime.date
-    ) -> datetime.date | None:
-        return validate_date_field(name, value)
-
 
 class LicenseAttachment(Base):
     __tablename__: str = "license_attachment"
@@ -318,6 +687,7 @@ class LicenseAttachment(Base):
     record_type: Mapped[str] = mapped_column(String(2), nullable=False)
     unique_system_identifier: Mapped[int] = mapped_column(
         ForeignKey("entity.unique_system_identifier"),
+        index=True,
     )
     call_sign: Mapped[str] = mapped_column(String(10), nullable=True)
     attachment_code: Mapped[str] = mapped_column(String(1), nullable=True)
@@ -327,12 +697,6 @@ class LicenseAttachment(Base):
     action_performed: Mapped[str] = mapped_column(String(1), nullable=True)
     _id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
-    @validates("attachment_date")
-    def validate_date_fields(
-        self, name: str, value: str | datetime.date
-    ) -> datetime.date | None:
-        return validate_date_field(name, value)
-
 
 class LicenseFreeformSpecialCondition(Base):
     __tablename__: str = "license_freeform_special_condition"
@@ -340,6 +704,7 @@ class LicenseFreeformSpecialCondition(Base):
     record_type: Mapped[str] = mapped_column(String(2), nullable=False)
     unique_system_identifier: Mapped[int] = mapped_column(
         ForeignKey("entity.unique_system_identifier"),
+        index=True,
     )
     uls_file_number: Mapped[str] = mapped_column(String(14), nullable=True)
     ebf_number: Mapped[str] = mapped_column(String(30), nullable=True)
@@ -352,18 +717,6 @@ class LicenseFreeformSpecialCondition(Base):
     status_date: Mapped[datetime.date] = mapped_column(Date, nullable=True)
     _id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
-    @validates("status_date")
-    def validate_date_fields(
-        self, name: str, value: str | datetime.date
-    ) -> datetime.date | None:
-        return validate_date_field(name, value)
-
-    @validates("unique_lic_freeform_id", "sequence_number")
-    def validate_integer_fields(self, name: str, value: str | int | None) -> int | None:
-        if value is None or value == "":
-            return None
-        return int(value)
-
 
 class LicenseSpecialCondition(Base):
     __tablename__: str = "license_special_condition"
@@ -371,6 +724,7 @@ class LicenseSpecialCondition(Base):
     record_type: Mapped[str] = mapped_column(String(2), nullable=False)
     unique_system_identifier: Mapped[int] = mapped_column(
         ForeignKey("entity.unique_system_identifier"),
+        index=True,
     )
     uls_file_number: Mapped[str] = mapped_column(String(14), nullable=True)
     ebf_number: Mapped[str] = mapped_column(String(30), nullable=True)
@@ -381,14 +735,422 @@ class LicenseSpecialCondition(Base):
     status_date: Mapped[datetime.date] = mapped_column(Date, nullable=True)
     _id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
-    @validates("status_date")
-    def validate_date_fields(
-        self, name: str, value: str | datetime.date
-    ) -> datetime.date | None:
-        return validate_date_field(name, value)
 
-    @validates("special_condition_code")
-    def validate_integer_fields(self, name: str, value: str | int | None) -> int | None:
-        if value is None or value == "":
-            return None
-        return int(value)
+class LicenseStatus(Base):
+    """Current status of each entity's license, derived from History, Amateur and LicenseHeader.
+
+    This table is maintained by refresh_license_status() when data is loaded, so that
+    queries don't have to find the latest history record for every entity."""
+
+    __tablename__: str = "license_status"
+    __table_args__ = (
+        Index("ix_license_status_zip_code_is_active", "zip_code", "is_active"),
+        Index("ix_license_status_state_is_active", "state", "is_active"),
+    )
+
+    unique_system_identifier: Mapped[int] = mapped_column(
+        ForeignKey("entity.unique_system_identifier"),
+        primary_key=True,
+    )
+    last_code: Mapped[str] = mapped_column(String(6), nullable=True)
+    last_log_date: Mapped[datetime.date] = mapped_column(Date, nullable=True)
+    operator_class: Mapped[str] = mapped_column(String(1), nullable=True)
+    license_status: Mapped[str] = mapped_column(String(1), nullable=True)
+    expired_date: Mapped[datetime.date] = mapped_column(Date, nullable=True)
+    cancellation_date: Mapped[datetime.date] = mapped_column(Date, nullable=True)
+    zip_code: Mapped[str] = mapped_column(String(9), nullable=True)
+    state: Mapped[str] = mapped_column(String(2), nullable=True)
+    is_active: Mapped[bool] = mapped_column(Boolean, nullable=False)
+
+
+class AppliedTransaction(Base):
+    """ULS daily transaction files that have already been applied."""
+
+    __tablename__: str = "applied_transaction"
+
+    digest: Mapped[str] = mapped_column(String(64), primary_key=True)
+    name: Mapped[str] = mapped_column(String(255), nullable=False)
+    applied_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False)
+    rows_changed: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
+class IngestCheckpoint(Base):
+    """Batches of a full load that have been committed, so that it can be resumed.
+
+    Each batch is recorded in the same transaction that writes it, identified by the
+    number of its first record, along with a fingerprint of its file (see
+    ingest.source_fingerprint). Checkpoints are removed when the load completes."""
+
+    __tablename__: str = "ingest_checkpoint"
+
+    record_type: Mapped[str] = mapped_column(String(2), primary_key=True)
+    first_record: Mapped[int] = mapped_column(Integer, primary_key=True)
+    fingerprint: Mapped[str] = mapped_column(String(64), nullable=False)
+    source: Mapped[str] = mapped_column(String(255), nullable=False)
+    rows: Mapped[int] = mapped_column(Integer, nullable=False)
+    committed_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False)
+
+
+class NameSearch(Base):
+    """The names of each entity and the trustee of its license, for name searches.
+
+    This table is maintained by refresh_name_search() when data is loaded. On sqlite
+    the names are indexed by the name_search_fts FTS5 table, and on postgresql by a
+    pg_trgm index; see namesearch.py."""
+
+    __tablename__: str = "name_search"
+
+    unique_system_identifier: Mapped[int] = mapped_column(
+        ForeignKey("entity.unique_system_identifier"),
+        primary_key=True,
+    )
+    names: Mapped[str] = mapped_column(Text, nullable=False)
+
+
+# Indexes on name_search that SQLAlchemy can't express. The FTS5 table indexes
+# name_search as external content, so it stores only the index;
+# refresh_name_search() keeps the two in step.
+for _dialect, _event, _statement in [
+    (
+        "sqlite",
+        "after_create",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS name_search_fts USING fts5("
+        "names, content='name_search', content_rowid='unique_system_identifier', "
+        "tokenize='trigram')",
+    ),
+    (
+        "sqlite",
+        "after_create",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS name_search_vocab "
+        "USING fts5vocab(name_search_fts, row)",
+    ),
+    ("sqlite", "after_drop", "DROP TABLE IF EXISTS name_search_vocab"),
+    ("sqlite", "after_drop", "DROP TABLE IF EXISTS name_search_fts"),
+    ("postgresql", "after_create", "CREATE EXTENSION IF NOT EXISTS pg_trgm"),
+    (
+        "postgresql",
+        "after_create",
+        "CREATE INDEX IF NOT EXISTS ix_name_search_names_trgm "
+        "ON name_search USING gin (names gin_trgm_ops)",
+    ),
+]:
+    event.listen(
+        NameSearch.__table__, _event, DDL(_statement).execute_if(dialect=_dialect)
+    )
+
+
+def _geohash_default(context: Any) -> str:
+    params = context.get_current_parameters()
+    return geohash_encode(params["lat"], params["lon"])
+
+
+class Geocode(Base):
+    """Geocoded location of an entity's address.
+
+    Rows are keyed by the hash of the address they were geocoded from, so a row whose
+    entity has since moved is never used; invalidate_geocodes() removes such rows
+    when data is loaded."""
+
+    __tablename__: str = "geocode"
+
+    unique_system_identifier: Mapped[int] = mapped_column(Integer, primary_key=True)
+    address_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    lat: Mapped[float] = mapped_column(Float, nullable=False)
+    lon: Mapped[float] = mapped_column(Float, nullable=False)
+    # Geohash prefixes are matched with range scans, which need byte ordering.
+    geohash: Mapped[str] = mapped_column(
+        String(12).with_variant(String(12, collation="C"), "postgresql"),
+        nullable=False,
+        index=True,
+        default=_geohash_default,
+    )
+    source: Mapped[str] = mapped_column(String(16), nullable=False)
+    geocoded_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False)
+
+
+# Map ULS record types (which are also the names of the .dat files in the ULS
+# archives) to the models that hold them.
+RECORD_TYPES: dict[str, type[Base]] = {
+    "EN": Entity,
+    "AM": Amateur,
+    "HS": History,
+    "HD": LicenseHeader,
+    "CO": Comment,
+    "LA": LicenseAttachment,
+    "SC": LicenseSpecialCondition,
+    "SF": LicenseFreeformSpecialCondition,
+}
+
+
+def column_type(spec: ColumnSpec) -> TypeEngine:
+    """Choose the column type for a column of schema.sql.
+
+    As in the hand-written models, dates are Date columns, although most are
+    declared as char(10) in schema.sql."""
+
+    if spec.type == "datetime" or (spec.length == 10 and "date" in spec.name):
+        return Date()
+    if spec.type in ("char", "varchar"):
+        return String(spec.length)
+    if spec.type in ("int", "integer", "smallint", "tinyint"):
+        return Integer()
+    if spec.type == "numeric" and not spec.scale:
+        return Integer() if (spec.length or 0) <= 9 else BigInteger()
+    if spec.type in ("numeric", "money"):
+        return Float()
+    raise ValueError(f"{spec.name}: unsupported column type {spec.type}")
+
+
+def generate_model(spec: TableSpec) -> type[Base]:
+    """Build a model for a table of schema.sql.
+
+    Generated models are laid out like History: rows are keyed by a surrogate _id,
+    and unique_system_identifier is an indexed reference to Entity."""
+
+    attrs: dict[str, Any] = {
+        "__tablename__": table_name(spec.title),
+        "__doc__": f"{spec.record_type} records ({spec.title}), from docs/schema.sql.",
+    }
+    for column in spec.columns:
+        if column.name == "unique_system_identifier":
+            attrs[column.name] = mapped_column(
+                ForeignKey("entity.unique_system_identifier"),
+                index=True,
+                nullable=column.nullable,
+            )
+        else:
+            attrs[column.name] = mapped_column(
+                column_type(column), nullable=column.nullable
+            )
+    attrs["_id"] = mapped_column(Integer, primary_key=True)
+    name = "".join(word.capitalize() for word in attrs["__tablename__"].split("_"))
+    return type(name, (Base,), attrs)
+
+
+# Record types without a hand-written model get one generated from docs/schema.sql.
+for _spec in load_tables().values():
+    if _spec.record_type not in RECORD_TYPES:
+        RECORD_TYPES[_spec.record_type] = generate_model(_spec)
+
+
+def drop_indexes(conn: Connection, tables: Iterable[Table] | None = None):
+    """Drop the secondary indexes on tables (default: all tables).
+
+    Loading a large table is much faster without indexes; use create_indexes() to
+    rebuild them once the load is complete."""
+
+    for table in Base.metadata.sorted_tables if tables is None else tables:
+        for index in table.indexes:
+            index.drop(conn, checkfirst=True)
+
+
+def create_indexes(conn: Connection, tables: Iterable[Table] | None = None):
+    for table in Base.metadata.sorted_tables if tables is None else tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+# History codes that mean a license is no longer active.
+INACTIVE_HISTORY_CODES = ["LICAN", "LIEXP"]
+
+
+def license_status_query(ids: Iterable[int] | None = None) -> Select:
+    """Compute LicenseStatus rows, for all entities or only those in ids."""
+
+    history = select(
+        History.unique_system_identifier,
+        History.code,
+        History.log_date,
+        func.row_number()
+        .over(
+            partition_by=History.unique_system_identifier,
+            order_by=(History.log_date.desc(), History._id.desc()),
+        )
+        .label("rownum"),
+    )
+    if ids is not None:
+        ids = list(ids)
+        history = history.where(History.unique_system_identifier.in_(ids))
+    latest = history.subquery()
+
+    is_active = case(
+        (
+            and_(
+                or_(
+                    LicenseHeader.license_status.is_(None),
+                    LicenseHeader.license_status == "A",
+                ),
+                or_(
+                    latest.c.code.is_(None),
+                    func.trim(latest.c.code).not_in(INACTIVE_HISTORY_CODES),
+                ),
+            ),
+            True,
+        ),
+        else_=False,
+    )
+    query = (
+        select(
+            Entity.unique_system_identifier,
+            latest.c.code,
+            latest.c.log_date,
+            Amateur.operator_class,
+            LicenseHeader.license_status,
+            LicenseHeader.expired_date,
+            LicenseHeader.cancellation_date,
+            Entity.zip_code,
+            Entity.state,
+            is_active,
+        )
+        .select_from(Entity)
+        .outerjoin(Amateur)
+        .outerjoin(LicenseHeader)
+        .outerjoin(
+            latest,
+            and_(
+                latest.c.unique_system_identifier == Entity.unique_system_identifier,
+                latest.c.rownum == 1,
+            ),
+        )
+    )
+    if ids is not None:
+        query = query.where(Entity.unique_system_identifier.in_(ids))
+    return query
+
+
+def refresh_license_status(conn: Connection, ids: Iterable[int] | None = None):
+    """Rebuild the license_status table, either entirely or only for the entities in ids."""
+
+    table = LicenseStatus.__table__
+    columns = [
+        "unique_system_identifier",
+        "last_code",
+        "last_log_date",
+        "operator_class",
+        "license_status",
+        "expired_date",
+        "cancellation_date",
+        "zip_code",
+        "state",
+        "is_active",
+    ]
+    if ids is None:
+        conn.execute(table.delete())
+        conn.execute(insert(table).from_select(columns, license_status_query()))
+        return
+
+    for batch in itertools.batched(ids, 500):
+        conn.execute(table.delete().where(table.c.unique_system_identifier.in_(batch)))
+        conn.execute(insert(table).from_select(columns, license_status_query(batch)))
+
+
+def name_search_query(ids: Iterable[int] | None = None) -> Select:
+    """Compute NameSearch rows, for all entities or only those in ids."""
+
+    names = func.coalesce(Entity.first_name, "")
+    for column in [Entity.last_name, Entity.entity_name, Amateur.trustee_name]:
+        names = names + " " + func.coalesce(column, "")
+
+    query = select(Entity.unique_system_identifier, func.trim(names)).outerjoin(Amateur)
+    if ids is not None:
+        query = query.where(Entity.unique_system_identifier.in_(ids))
+    return query
+
+
+def refresh_name_search(conn: Connection, ids: Iterable[int] | None = None):
+    """Rebuild the name_search table, either entirely or only for the entities in ids."""
+
+    table = NameSearch.__table__
+    columns = ["unique_system_identifier", "names"]
+    fts = conn.dialect.name == "sqlite"
+    if ids is None:
+        conn.execute(table.delete())
+        conn.execute(insert(table).from_select(columns, name_search_query()))
+        if fts:
+            conn.exec_driver_sql(
+                "INSERT INTO name_search_fts(name_search_fts) VALUES ('rebuild')"
+            )
+        return
+
+    for batch in itertools.batched(ids, 500):
+        params = {"ids": list(batch)}
+        # An external content FTS5 table needs the old values to remove a row.
+        if fts:
+            conn.execute(
+                text(
+                    "INSERT INTO name_search_fts(name_search_fts, rowid, names) "
+                    "SELECT 'delete', unique_system_identifier, names "
+                    "FROM name_search WHERE unique_system_identifier IN :ids"
+                ).bindparams(bindparam("ids", expanding=True)),
+                params,
+            )
+        conn.execute(table.delete().where(table.c.unique_system_identifier.in_(batch)))
+        conn.execute(insert(table).from_select(columns, name_search_query(batch)))
+        if fts:
+            conn.execute(
+                text(
+                    "INSERT INTO name_search_fts(rowid, names) "
+                    "SELECT unique_system_identifier, names "
+                    "FROM name_search WHERE unique_system_identifier IN :ids"
+                ).bindparams(bindparam("ids", expanding=True)),
+                params,
+            )
+
+
+def format_address(
+    street_address: str | None,
+    city: str | None,
+    state: str | None,
+    zip_code: str | None,
+) -> str:
+    return f"{street_address}, {city}, {state} {zip_code}"
+
+
+def address_hash(address: str) -> str:
+    """Hash an address for Geocode.address_hash. Addresses are normalized first, so
+    changes in punctuation or abbreviations don't invalidate a geocode."""
+
+    return hashlib.sha256(normalize_address(address).encode()).hexdigest()
+
+
+def invalidate_geocodes(conn: Connection, ids: Iterable[int] | None = None) -> int:
+    """Delete geocodes for entities whose address has changed or that no longer exist.
+
+    Checks every stored geocode, or only those for the entities in ids. Returns the
+    number of geocodes deleted."""
+
+    query = select(
+        Geocode.unique_system_identifier,
+        Geocode.address_hash,
+        Entity.unique_system_identifier,
+        Entity.street_address,
+        Entity.city,
+        Entity.state,
+        Entity.zip_code,
+    ).outerjoin(
+        Entity, Entity.unique_system_identifier == Geocode.unique_system_identifier
+    )
+    if ids is None:
+        queries = [query]
+    else:
+        queries = [
+            query.where(Geocode.unique_system_identifier.in_(batch))
+            for batch in itertools.batched(ids, 500)
+        ]
+
+    stale = [
+        {"b_usi": usi, "b_hash": digest}
+        for q in queries
+        for usi, digest, entity_usi, *address in conn.execute(q)
+        if entity_usi is None or address_hash(format_address(*address)) != digest
+    ]
+    if stale:
+        table = Geocode.__table__
+        conn.execute(
+            table.delete().where(
+                table.c.unique_system_identifier == bindparam("b_usi"),
+                table.c.address_hash == bindparam("b_hash"),
+            ),
+            stale,
+        )
+    return len(stale)
@@ -0,0 +1,272 @@
+"""Offline geocoding from a local index of address points and ZIP code centroids.
+
+Build an index from an OpenAddresses CSV export and/or the Census ZCTA gazetteer:
+
+    python geoindex.py geo.db --openaddresses ma.csv --zip-centroids zcta.txt
+"""
+
+from collections.abc import Iterable, Iterator
+from typing import TextIO
+
+import csv
+import itertools
+import logging
+import re
+import sqlite3
+
+import click
+
+LOG = logging.getLogger(__name__)
+
+STREET_ABBREVIATIONS = {
+    "ALLEY": "ALY",
+    "APARTMENT": "APT",
+    "AVENUE": "AVE",
+    "BOULEVARD": "BLVD",
+    "CIRCLE": "CIR",
+    "COURT": "CT",
+    "DRIVE": "DR",
+    "EAST": "E",
+    "EXPRESSWAY": "EXPY",
+    "HIGHWAY": "HWY",
+    "LANE": "LN",
+    "NORTH": "N",
+    "NORTHEAST": "NE",
+    "NORTHWEST": "NW",
+    "PARKWAY": "PKWY",
+    "PLACE": "PL",
+    "ROAD": "RD",
+    "ROUTE": "RTE",
+    "SOUTH": "S",
+    "SOUTHEAST": "SE",
+    "SOUTHWEST": "SW",
+    "SQUARE": "SQ",
+    "STREET": "ST",
+    "SUITE": "STE",
+    "TERRACE": "TER",
+    "TRAIL": "TRL",
+    "WEST": "W",
+}
+
+# Header names used for each column by the data sources we know about, compared
+# case-insensitively.
+ZIP_COLUMNS = ["GEOID", "ZCTA5", "ZCTA", "ZIP", "ZIPCODE", "ZIP_CODE", "POSTCODE"]
+LAT_COLUMNS = ["INTPTLAT", "LAT", "LATITUDE"]
+LON_COLUMNS = ["INTPTLONG", "LON", "LNG", "LONG", "LONGITUDE"]
+
+SCHEMA = """
+create table if not exists address_point (
+    key text primary key,
+    lat real not null,
+    lon real not null
+) without rowid;
+
+create table if not exists zip_centroid (
+    zip text primary key,
+    lat real not null,
+    lon real not null
+) without rowid;
+"""
+
+
+# Changes here invalidate existing indexes, and geolocate's cache keys (see
+# geolocate.CACHE_KEY_VERSION).
+def normalize_address(address: str) -> str:
+    """Put an address of the form "street, city, state zip" into a canonical form.
+
+    The result is upper case with punctuation and repeated whitespace removed,
+    common street words abbreviated (in the street part only) and ZIP+4 codes
+    reduced to five digits."""
+
+    parts = []
+    for i, part in enumerate(address.upper().split(",")):
+        words = re.findall(r"[A-Z0-9#/&'-]+", part)
+        if i == 0:
+            words = [STREET_ABBREVIATIONS.get(word, word) for word in words]
+        if words:
+            parts.append(" ".join(words))
+    return re.sub(r"\b(\d{5})-?\d{4}$", r"\1", ", ".join(parts))
+
+
+def address_zip(address: str) -> str | None:
+    """Return the five digit ZIP code at the end of an address, if there is one."""
+
+    if match := re.search(r"\b(\d{5})$", normalize_address(address)):
+        return match.group(1)
+    return None
+
+
+def address_key(address: str) -> str | None:
+    """Return the index key for an address: its normalized street part and ZIP code.
+
+    City names are left out because the FCC data and address point sources often
+    disagree about them (village vs. town names, for example)."""
+
+    normalized = normalize_address(address)
+    if (match := re.search(r"\b(\d{5})$", normalized)) is None:
+        return None
+    street = normalized.split(", ")[0]
+    if street == match.group(1):
+        return None
+    return f"{street}|{match.group(1)}"
+
+
+def find_column(fieldnames: Iterable[str], candidates: list[str]) -> str:
+    by_name = {name.strip().upper(): name for name in fieldnames}
+    for candidate in candidates:
+        if candidate in by_name:
+            return by_name[candidate]
+    raise ValueError(f"no column named any of {', '.join(candidates)}")
+
+
+class GeoIndex:
+    """A local geocoding index stored in an SQLite file.
+
+    Address points are keyed by address_key() and ZIP code centroids by five digit
+    ZIP code, so every lookup is a single primary key probe."""
+
+    precisions = ("address", "zip")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def add_address_points(
+        self, points: Iterable[tuple[str, float, float]], batch_size: int = 10000
+    ) -> int:
+        """Add (address, lat, lon) tuples to the index. Returns the number added."""
+
+        count = 0
+        rows = (
+            (key, lat, lon)
+            for address, lat, lon in points
+            if (key := address_key(address)) is not None
+        )
+        with self.conn:
+            for batch in itertools.batched(rows, batch_size):
+                self.conn.executemany(
+                    "insert or replace into address_point values (?, ?, ?)", batch
+                )
+                count += len(batch)
+        return count
+
+    def add_zip_centroids(
+        self, centroids: Iterable[tuple[str, float, float]], batch_size: int = 10000
+    ) -> int:
+        """Add (zip, lat, lon) tuples to the index. Returns the number added."""
+
+        count = 0
+        with self.conn:
+            for batch in itertools.batched(centroids, batch_size):
+                self.conn.executemany(
+                    "insert or replace into zip_centroid values (?, ?, ?)", batch
+                )
+                count += len(batch)
+        return count
+
+    def load_openaddresses(self, fd: TextIO) -> int:
+        """Add address points from an OpenAddresses CSV file.
+
+        Points without a house number or postal code can't be matched against
+        FCC addresses and are skipped."""
+
+        def points() -> Iterator[tuple[str, float, float]]:
+            for row in csv.DictReader(fd):
+                if not row["NUMBER"] or not row["POSTCODE"]:
+                    continue
+                yield (
+                    f"{row['NUMBER']} {row['STREET']}, {row['CITY']}, "
+                    f"{row['REGION']} {row['POSTCODE']}",
+                    float(row["LAT"]),
+                    float(row["LON"]),
+                )
+
+        return self.add_address_points(points())
+
+    def load_zip_centroids(self, fd: TextIO) -> int:
+        """Add ZIP code centroids from a CSV or tab separated file.
+
+        This reads the Census ZCTA gazetteer file as distributed, as well as simpler
+        files with zip, lat and lon columns."""
+
+        sample = fd.readline()
+        reader = csv.DictReader(
+            itertools.chain([sample], fd),
+            delimiter="\t" if "\t" in sample else ",",
+        )
+        fieldnames = reader.fieldnames or []
+        zip_column = find_column(fieldnames, ZIP_COLUMNS)
+        lat_column = find_column(fieldnames, LAT_COLUMNS)
+        lon_column = find_column(fieldnames, LON_COLUMNS)
+
+        return self.add_zip_centroids(
+            (
+                row[zip_column].strip().zfill(5),
+                float(row[lat_column]),
+                float(row[lon_column]),
+            )
+            for row in reader
+        )
+
+    def lookup(
+        self, address: str, precision: str = "address"
+    ) -> tuple[float, float] | None:
+        """Return (lat, lon) for an address, or None if it isn't in the index.
+
+        With precision "address" the address must match an address point; with
+        precision "zip" the centroid of its ZIP code is returned."""
+
+        if precision == "address":
+            query = "select lat, lon from address_point where key = ?"
+            key = address_key(address)
+        elif precision == "zip":
+            query = "select lat, lon from zip_centroid where zip = ?"
+            key = address_zip(address)
+        else:
+            raise ValueError(f"unknown precision {precision}")
+
+        if key is None:
+            return None
+        return self.conn.execute(query, (key,)).fetchone()
+
+
+@click.command(context_settings={"auto_envvar_prefix": "FCC"})
+@click.option("--verbosity", "-v", count=True)
+@click.option(
+    "--openaddresses",
+    "-a",
+    multiple=True,
+    type=click.File(),
+    help="OpenAddresses CSV file of address points",
+)
+@click.option(
+    "--zip-centroids",
+    "-z",
+    multiple=True,
+    type=click.File(),
+    help="ZIP code centroid file, such as the Census ZCTA gazetteer",
+)
+@click.argument("index_path")
+def main(
+    verbosity: int,
+    openaddresses: tuple[TextIO, ...],
+    zip_centroids: tuple[TextIO, ...],
+    index_path: str,
+):
+    logLevel = ["WARNING", "INFO", "DEBUG"][min(verbosity + 1, 2)]
+    logging.basicConfig(level=logLevel)
+
+    index = GeoIndex(index_path)
+    for fd in openaddresses:
+        LOG.info(f"loaded {index.load_openaddresses(fd)} address points from {fd.name}")
+    for fd in zip_centroids:
+        LOG.info(f"loaded {index.load_zip_centroids(fd)} ZIP centroids from {fd.name}")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,58 @@
-from typing import Any, cast
+from typing import Any, BinaryIO, cast
 
+import datetime
 import os
-import sys
-import io
+import re
+import string
+import asyncio
 import diskcache
 import click
 import dotenv
 import requests
 import time
+import itertools
 import logging
-import bettergpx as gpx
+import math
+import threading
 
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote as urlquote
 
+from sqlalchemy import and_
+from sqlalchemy import ColumnElement
+from sqlalchemy import Connection
 from sqlalchemy import create_engine
+from sqlalchemy import func
+from sqlalchemy import insert
+from sqlalchemy import or_
 from sqlalchemy import select
+from sqlalchemy import Select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.orm import Session
 
 from rich import box
 from rich.console import Console
 from rich.table import Table
 
+from fccdb import address_hash
+from fccdb import Amateur
 from fccdb import Entity
-from fccdb import History
+from fccdb import format_address
+from fccdb import Geocode
+from fccdb import LicenseStatus
+
+from exporters import EXPORTERS
+from exporters import ExportRow
+
+from geoindex import GeoIndex
+from geoindex import normalize_address
+
+from spatial import bbox_around
+from spatial import EARTH_RADIUS_KM
+from spatial import geohash_cover
+from spatial import haversine_km
 
 from pydantic import BaseModel, Field, RootModel
 
@@ -72,15 +102,90 @@ class Location(BaseModel):
     lon: float
 
 
-class Locator:
+class NegativeResult(BaseModel):
+    """Cached record of an address that could not be geocoded."""
+
+    message: str
+
+
+# Bump this when geoindex.normalize_address changes, so that cached entries are re-keyed by
+# BaseLocator.migrate_cache().
+CACHE_KEY_VERSION = 1
+
+
+class TokenBucket:
+    """Allow up to rate acquisitions per second, with bursts of up to capacity."""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token and return how many seconds the caller must wait before using it."""
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            # Tokens may go negative: each waiting caller has reserved its own slot.
+            self.tokens -= 1
+            return max(0, -self.tokens / self.rate)
+
+    def acquire(self):
+        if delay := self.reserve():
+            time.sleep(delay)
+
+
+class BaseLocator:
+    """Configuration, cache and response handling shared by Locator and AsyncLocator."""
+
     geocode_url = "https://geocode.maps.co/search?q={address}&api_key={api_key}"
     cache: dict[str, Any] = {}
     cache_hits: int = 0
     cache_misses: int = 0
-
-    def __init__(self, apikey: str, cachepath: str | None = None):
+    local_hits: int = 0
+    stored_hits: int = 0
+
+    # Responses with these status codes are retried, with exponential backoff.
+    retry_statuses = {429, 500, 502, 503, 504}
+
+    def __init__(
+        self,
+        apikey: str | None,
+        cachepath: str | None = None,
+        rate: float = 1,
+        concurrency: int = 4,
+        geocode_url: str | None = None,
+        retries: int = 3,
+        retry_backoff: float = 1,
+        timeout: float = 30,
+        negative_ttl: float | None = 7 * 24 * 3600,
+        index: GeoIndex | None = None,
+        precision: str = "address",
+    ):
         self.apikey = apikey
-        self.last_request = time.time()
+        self.index = index
+        self.precision = precision
+        self.negative_ttl = negative_ttl
+        self.limiter = TokenBucket(rate)
+        self.concurrency = concurrency
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        if geocode_url is not None:
+            self.geocode_url = geocode_url
+
+        # A single session keeps connections to the geocoding service alive
+        # between requests.
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
         if cachepath is None:
             xdg_cache_dir = os.environ.get(
@@ -91,32 +196,612 @@ class Locator:
 
         self.cache = diskcache.Cache(cachepath)
 
-    def lookup_address(self, address: str) -> LocatorApiResponse:
-        now = time.time()
-        if (now - self.last_request) < 1:
-            time.sleep(1)
-        self.last_request = time.time()
-        res = requests.get(
-            self.geocode_url.format(api_key=self.apikey, address=urlquote(address))
+    def request_url(self, address: str) -> str:
+        return self.geocode_url.format(
+            api_key=self.apikey, address=urlquote(normalize_address(address))
         )
+
+    def cache_key(self, address: str) -> str:
+        return f"v{CACHE_KEY_VERSION}:{normalize_address(address)}"
+
+    def local(self, address: str) -> Location | None:
+        """Return the location of address from the local index, if there is one."""
+
+        if self.index is None:
+            return None
+        if (point := self.index.lookup(address, self.precision)) is None:
+            return None
+        self.local_hits += 1
+        return Location(lat=point[0], lon=point[1])
+
+    def check_network(self, address: str):
+        """Raise ValueError if address can't be sent to the geocoding service.
+
+        Without an API key the service is not used at all, and only addresses in
+        the local index can be located."""
+
+        if self.apikey is None:
+            raise ValueError(f"{address} is not in the local index")
+
+    def cached(self, address: str) -> Location | ValueError | None:
+        """Return the cached result for address, if there is one.
+
+        Addresses that previously failed to geocode are cached for negative_ttl
+        seconds and returned as a ValueError."""
+
+        value = self.cache.get(self.cache_key(address))
+        if value is None:
+            return None
+        self.cache_hits += 1
+        if isinstance(value, NegativeResult):
+            return ValueError(value.message)
+        return value
+
+    def migrate_cache(self) -> int:
+        """Re-key cache entries written with an older (or no) cache key version.
+
+        Returns the number of entries migrated."""
+
+        migrated = 0
+        for key in list(self.cache.iterkeys()):
+            if not isinstance(key, str):
+                continue
+            if match := re.match(r"v(\d+):(.*)", key):
+                if int(match.group(1)) == CACHE_KEY_VERSION:
+                    continue
+                address = match.group(2)
+            else:
+                address = key
+
+            value = self.cache.get(key)
+            new_key = self.cache_key(address)
+            if isinstance(value, Location) and new_key not in self.cache:
+                self.cache.set(new_key, value)
+            del self.cache[key]
+            migrated += 1
+        return migrated
+
+    def stored_geocodes(
+        self, conn: Connection, hashes: dict[int, str]
+    ) -> dict[int, Location]:
+        """Return the geocodes stored in the database for entities.
+
+        hashes maps unique_system_identifier to the hash of the entity's current
+        address; geocodes for any other address are ignored."""
+
+        found = {}
+        for batch in itertools.batched(hashes, 500):
+            for usi, digest, lat, lon in conn.execute(
+                select(
+                    Geocode.unique_system_identifier,
+                    Geocode.address_hash,
+                    Geocode.lat,
+                    Geocode.lon,
+                ).where(Geocode.unique_system_identifier.in_(batch))
+            ):
+                if hashes[usi] == digest:
+                    found[usi] = Location(lat=lat, lon=lon)
+        self.stored_hits += len(found)
+        return found
+
+    def store_geocodes(
+        self, conn: Connection, geocodes: dict[int, tuple[str, Location, str]]
+    ):
+        """Store geocodes in the database, replacing any others for the same entities.
+
+        geocodes maps unique_system_identifier to (address hash, location, source)."""
+
+        if not geocodes:
+            return
+
+        table = Geocode.__table__
+        for batch in itertools.batched(geocodes, 500):
+            conn.execute(
+                table.delete().where(table.c.unique_system_identifier.in_(batch))
+            )
+
+        # Another process may store the same geocode concurrently.
+        match conn.dialect.name:
+            case "postgresql":
+                stmt = postgresql.insert(table).on_conflict_do_nothing()
+            case "sqlite":
+                stmt = sqlite.insert(table).on_conflict_do_nothing()
+            case _:
+                stmt = insert(table)
+
+        now = datetime.datetime.now()
+        conn.execute(
+            stmt,
+            [
+                {
+                    "unique_system_identifier": usi,
+                    "address_hash": digest,
+                    "lat": loc.lat,
+                    "lon": loc.lon,
+                    "source": source,
+                    "geocoded_at": now,
+                }
+                for usi, (digest, loc, source) in geocodes.items()
+            ],
+        )
+
+    def get(self, address: str) -> requests.Response | requests.RequestException:
+        """Request address from the geocoding service. Errors are returned, not raised."""
+
+        try:
+            return self.session.get(self.request_url(address), timeout=self.timeout)
+        except requests.RequestException as err:
+            return err
+
+    def retry_delay(
+        self, res: requests.Response | requests.RequestException, attempt: int
+    ) -> float | None:
+        """Return how long to wait before retrying a request, or None if it should not be retried.
+
+        Connection errors and timeouts are retried like the retry_statuses."""
+
+        if attempt >= self.retries:
+            return None
+        if isinstance(res, requests.RequestException):
+            if isinstance(res, (requests.ConnectionError, requests.Timeout)):
+                return self.retry_backoff * 2**attempt
+            return None
+        if res.status_code not in self.retry_statuses:
+            return None
+        try:
+            return float(res.headers["Retry-After"])
+        except (KeyError, ValueError):
+            return self.retry_backoff * 2**attempt
+
+    def parse_response(
+        self, address: str, res: requests.Response | requests.RequestException
+    ) -> LocatorApiResponse:
+        # Failed requests are not cached, but they are still only a failure to
+        # locate this address.
+        if isinstance(res, requests.RequestException):
+            raise ValueError(f"{address}: {res}") from res
+        if not res.ok:
+            raise ValueError(f"{address}: HTTP {res.status_code}")
         return LocatorApiResponse.model_validate(res.json())
 
+    def location_from_response(self, address: str, res: LocatorApiResponse) -> Location:
+        key = self.cache_key(address)
+        if len(res.root) == 1:
+            loc = Location(lat=float(res.root[0].lat), lon=float(res.root[0].lon))
+            self.cache[key] = loc
+            return loc
+
+        if len(res.root) > 1:
+            message = f"multiple results for {address}"
+        else:
+            message = f"no results for {address}"
+        self.cache.set(key, NegativeResult(message=message), expire=self.negative_ttl)
+        raise ValueError(message)
+
+
+class Locator(BaseLocator):
+    def lookup_address(self, address: str) -> LocatorApiResponse:
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            res = self.get(address)
+            if (delay := self.retry_delay(res, attempt)) is None:
+                return self.parse_response(address, res)
+            time.sleep(delay)
+            attempt += 1
+
     def locate(self, address: str) -> Location:
-        if address in self.cache:
-            self.cache_hits += 1
-            return self.cache[address]
+        if (loc := self.local(address)) is not None:
+            return loc
+        if (result := self.cached(address)) is not None:
+            if isinstance(result, ValueError):
+                raise result
+            return result
 
         self.cache_misses += 1
-        res = self.lookup_address(address)
+        return self.geocode(address)
+
+    def locate_many(self, addresses: Iterable[str]) -> dict[str, Location | ValueError]:
+        """Locate many addresses at once.
+
+        Addresses are deduplicated and checked against the local index and the cache
+        first; the remaining addresses are looked up concurrently, subject to the
+        rate limit. Returns a
+        mapping of address to either a Location or the ValueError locate() would have
+        raised."""
+
+        keys = {address: self.cache_key(address) for address in addresses}
+        by_key: dict[str, Location | ValueError] = {}
+        misses: dict[str, str] = {}
+        for address, key in keys.items():
+            if key in by_key or key in misses:
+                continue
+            if (loc := self.local(address)) is not None:
+                by_key[key] = loc
+            elif (result := self.cached(address)) is not None:
+                by_key[key] = result
+            else:
+                self.cache_misses += 1
+                misses[key] = address
+
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            futures = {
+                key: pool.submit(self.geocode, address)
+                for key, address in misses.items()
+            }
+            for key, future in futures.items():
+                try:
+                    by_key[key] = future.result()
+                except ValueError as err:
+                    by_key[key] = err
+
+        return {address: by_key[key] for address, key in keys.items()}
+
+    def locate_entities(
+        self, conn: Connection, entities: Iterable[Entity]
+    ) -> dict[int, Location | ValueError]:
+        """Locate entities, using and updating the geocodes stored in the database.
+
+        Entities without a stored geocode for their current address are located as
+        by locate_many(), and the results are written back in bulk. Returns a mapping
+        of unique_system_identifier to either a Location or a ValueError. The caller
+        is responsible for committing conn."""
+
+        addresses = {
+            entity.unique_system_identifier: entity_address(entity)
+            for entity in entities
+        }
+        hashes = {usi: address_hash(address) for usi, address in addresses.items()}
+        results: dict[int, Location | ValueError] = {}
+        results.update(self.stored_geocodes(conn, hashes))
+
+        new: dict[int, tuple[str, Location, str]] = {}
+        remaining: dict[int, str] = {}
+        for usi, address in addresses.items():
+            if usi in results:
+                continue
+            if (loc := self.local(address)) is not None:
+                new[usi] = (hashes[usi], loc, f"index:{self.precision}")
+                results[usi] = loc
+            else:
+                remaining[usi] = address
+
+        located = self.locate_many(remaining.values())
+        for usi, address in remaining.items():
+            results[usi] = result = located[address]
+            if isinstance(result, Location):
+                new[usi] = (hashes[usi], result, "geocoder")
+
+        self.store_geocodes(conn, new)
+        return results
+
+    def geocode(self, address: str) -> Location:
+        """Look up an address with the geocoding service and cache the result."""
+
+        self.check_network(address)
+        return self.location_from_response(address, self.lookup_address(address))
+
+
+class AsyncLocator(BaseLocator):
+    """A Locator for use from asyncio code.
+
+    HTTP requests are made on worker threads through the same pooled session as
+    Locator, so they never block the event loop. Concurrent requests for the same
+    address share a single lookup."""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.inflight: dict[str, asyncio.Future[Location]] = {}
+
+    async def lookup_address(self, address: str) -> LocatorApiResponse:
+        attempt = 0
+        while True:
+            if delay := self.limiter.reserve():
+                await asyncio.sleep(delay)
+            res = await asyncio.to_thread(self.get, address)
+            if (delay := self.retry_delay(res, attempt)) is None:
+                return self.parse_response(address, res)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def locate(self, address: str) -> Location:
+        if (loc := self.local(address)) is not None:
+            return loc
+        if (result := self.cached(address)) is not None:
+            if isinstance(result, ValueError):
+                raise result
+            return result
+
+        key = self.cache_key(address)
+        if (future := self.inflight.get(key)) is None:
+            self.cache_misses += 1
+            future = asyncio.ensure_future(self.geocode(address))
+            self.inflight[key] = future
+            future.add_done_callback(lambda _: self.inflight.pop(key, None))
+
+        # Don't let one cancelled caller cancel the lookup for everyone else.
+        return await asyncio.shield(future)
+
+    async def locate_many(
+        self, addresses: Iterable[str]
+    ) -> dict[str, Location | ValueError]:
+        """Locate many addresses concurrently. See Locator.locate_many()."""
+
+        async def locate_one(address: str) -> Location | ValueError:
+            try:
+                return await self.locate(address)
+            except ValueError as err:
+                return err
 
-        if len(res.root) > 1:
-            raise ValueError(f"multiple results for {address}")
-        if len(res.root) == 0:
-            raise ValueError(f"no results for {address}")
+        unique = list(dict.fromkeys(addresses))
+        results = await asyncio.gather(*(locate_one(address) for address in unique))
+        return dict(zip(unique, results))
+
+    async def geocode(self, address: str) -> Location:
+        self.check_network(address)
+        async with self.semaphore:
+            res = await self.lookup_address(address)
+        return self.location_from_response(address, res)
+
+
+def entity_address(entity: Entity) -> str:
+    return format_address(
+        entity.street_address, entity.city, entity.state, entity.zip_code
+    )
+
+
+def export_query(*where: ColumnElement[bool]) -> Select[tuple[Entity, Amateur, str]]:
+    """Select matching entities along with their amateur license and most recent history code.
+
+    This is a single query, rather than lazily loading entity.license and entity.history
+    for every row. The history code comes from the license_status table maintained by
+    ingest."""
+
+    return (
+        select(Entity, Amateur, LicenseStatus.last_code)
+        .outerjoin(Amateur)
+        .outerjoin(LicenseStatus)
+        .where(*where)
+    )
+
+
+def prefix_match(column: Any, prefix: str) -> ColumnElement[bool]:
+    """Match values of column that start with prefix.
+
+    This is written as a range rather than LIKE so that it can use a B-tree index
+    on any database. It assumes values don't contain characters sorting after "~",
+    and that the column sorts in byte order (collation "C" on postgresql)."""
 
-        loc = Location(lat=float(res.root[0].lat), lon=float(res.root[0].lon))
-        self.cache[address] = loc
-        return loc
+    return and_(column >= prefix, column < prefix + "~")
+
+
+def export_filters(
+    zip_codes: Iterable[str] = (),
+    states: Iterable[str] = (),
+    cities: Iterable[str] = (),
+    operator_classes: Iterable[str] = (),
+    call_signs: Iterable[str] = (),
+    active_only: bool = False,
+) -> list[ColumnElement[bool]]:
+    """Build where clauses for export_query().
+
+    Each zip code is a prefix, so "02478" also matches ZIP+4 codes and "024"
+    matches a whole sectional center. Values of the other filters are compared
+    case-insensitively; an empty filter matches everything."""
+
+    where: list[ColumnElement[bool]] = []
+    if zip_codes := list(zip_codes):
+        # Not prefix_match(): zip_code has the database's default collation.
+        where.append(
+            or_(*(Entity.zip_code.startswith(z, autoescape=True) for z in zip_codes))
+        )
+    if states := [state.upper() for state in states]:
+        where.append(Entity.state.in_(states))
+    if cities := [city.upper() for city in cities]:
+        where.append(func.upper(Entity.city).in_(cities))
+    if operator_classes := [oc.upper() for oc in operator_classes]:
+        where.append(Amateur.operator_class.in_(operator_classes))
+    if call_signs := [call_sign.upper() for call_sign in call_signs]:
+        where.append(Entity.call_sign.in_(call_signs))
+    if active_only:
+        where.append(LicenseStatus.is_active)
+    return where
+
+
+class RowFormatter:
+    """Turn export_query() rows into ExportRows, rendering the label and description.
+
+    The templates are parsed once, up front, so that only the attributes they
+    refer to (and the EXPORT_FIELDS properties) are looked up for each row. They
+    may use any Entity or Amateur column (Amateur wins where both have one), plus
+    full_name, address, last_code and loc. Missing values render as ""."""
+
+    def __init__(self, label_format: str, desc_format: str):
+        self.label_format = label_format
+        self.desc_format = desc_format
+
+        getters: dict[str, Any] = {
+            "full_name": lambda entity, license, last_code, loc: " ".join(
+                name
+                for name in (entity.first_name, entity.mi, entity.last_name)
+                if name
+            ),
+            "address": lambda entity, license, last_code, loc: entity_address(entity),
+            "last_code": lambda entity, license, last_code, loc: last_code,
+            "loc": lambda entity, license, last_code, loc: loc,
+        }
+        for name in Entity.get_field_names():
+            getters.setdefault(name, self.entity_getter(name))
+        for name in Amateur.get_field_names():
+            if name in Entity.get_field_names():
+                getters[name] = self.license_or_entity_getter(name)
+            else:
+                getters.setdefault(name, self.license_getter(name))
+
+        fields = set(EXPORT_FIELDS)
+        for template in (label_format, desc_format):
+            for _, field, _, _ in string.Formatter().parse(template):
+                if field is None:
+                    continue
+                if field == "" or field[0].isdigit():
+                    raise ValueError(f"positional field in template {template!r}")
+                name = re.match(r"\w*", field).group()
+                if name not in getters:
+                    raise ValueError(f"unknown field {name!r} in template {template!r}")
+                fields.add(name)
+        self.getters = {name: getters[name] for name in fields}
+
+    @staticmethod
+    def entity_getter(name: str):
+        return lambda entity, license, last_code, loc: getattr(entity, name)
+
+    @staticmethod
+    def license_getter(name: str):
+        return lambda entity, license, last_code, loc: (
+            None if license is None else getattr(license, name)
+        )
+
+    @staticmethod
+    def license_or_entity_getter(name: str):
+        return lambda entity, license, last_code, loc: getattr(
+            entity if license is None else license, name
+        )
+
+    def row(
+        self,
+        entity: Entity,
+        license: Amateur | None,
+        last_code: str | None,
+        loc: Location,
+    ) -> ExportRow:
+        values = {
+            name: getter(entity, license, last_code, loc)
+            for name, getter in self.getters.items()
+        }
+        attrs = {k: "" if v is None else v for k, v in values.items()}
+        return ExportRow(
+            lat=loc.lat,
+            lon=loc.lon,
+            name=self.label_format.format_map(attrs),
+            desc=self.desc_format.format_map(attrs),
+            properties={field: values[field] for field in EXPORT_FIELDS},
+        )
+
+
+def located_query(
+    *where: ColumnElement[bool],
+) -> Select[tuple[Entity, float, float]]:
+    """Select geocoded entities along with their coordinates.
+
+    license_status is joined as well, so that where may filter on it (for example
+    LicenseStatus.is_active)."""
+
+    return (
+        select(Entity, Geocode.lat, Geocode.lon)
+        .join(
+            Geocode,
+            Geocode.unique_system_identifier == Entity.unique_system_identifier,
+        )
+        .outerjoin(LicenseStatus)
+        .where(*where)
+    )
+
+
+def bbox_query(
+    south: float, west: float, north: float, east: float, *where: ColumnElement[bool]
+) -> Select[tuple[Entity, float, float]]:
+    """Select geocoded entities inside a bounding box.
+
+    Candidates are found with range scans of the geohash index, one for each cell
+    covering the box, and then filtered on their exact coordinates. A box that
+    crosses the antimeridian has west greater than east."""
+
+    if west <= east:
+        spans = [(west, east)]
+    else:
+        spans = [(west, 180.0), (-180.0, east)]
+    cells = or_(
+        *(
+            prefix_match(Geocode.geohash, prefix)
+            for span_west, span_east in spans
+            for prefix in geohash_cover(south, span_west, north, span_east)
+        )
+    )
+    return located_query(
+        cells,
+        Geocode.lat.between(south, north),
+        or_(*(Geocode.lon.between(*span) for span in spans)),
+        *where,
+    )
+
+
+def within_bbox(
+    session: Session,
+    south: float,
+    west: float,
+    north: float,
+    east: float,
+    *where: ColumnElement[bool],
+) -> list[Entity]:
+    return list(session.scalars(bbox_query(south, west, north, east, *where)))
+
+
+def within_radius(
+    session: Session,
+    lat: float,
+    lon: float,
+    radius_km: float,
+    *where: ColumnElement[bool],
+) -> list[tuple[Entity, float]]:
+    """Return (entity, distance in km) for geocoded entities within radius_km of a point.
+
+    Results are ordered by distance."""
+
+    found = []
+    query = bbox_query(*bbox_around(lat, lon, radius_km), *where)
+    for entity, entity_lat, entity_lon in session.execute(query):
+        if (distance := haversine_km(lat, lon, entity_lat, entity_lon)) <= radius_km:
+            found.append((entity, distance))
+    return sorted(found, key=lambda result: result[1])
+
+
+def nearest(
+    session: Session,
+    lat: float,
+    lon: float,
+    k: int,
+    *where: ColumnElement[bool],
+    initial_radius_km: float = 1,
+) -> list[tuple[Entity, float]]:
+    """Return (entity, distance in km) for the k geocoded entities nearest a point.
+
+    This searches within a radius that doubles until it contains at least k
+    entities (or the whole earth)."""
+
+    radius = initial_radius_km
+    while True:
+        found = within_radius(session, lat, lon, radius, *where)
+        if len(found) >= k or radius >= math.pi * EARTH_RADIUS_KM:
+            return found[:k]
+        radius *= 2
+
+
+# Properties exported with each location, by formats that carry them.
+EXPORT_FIELDS: dict[str, type] = {
+    "unique_system_identifier": int,
+    "call_sign": str,
+    "full_name": str,
+    "operator_class": str,
+    "address": str,
+    "last_code": str,
+}
+
+
+def split_values(ctx: click.Context, param: click.Parameter, value: tuple[str, ...]):
+    """Allow multiple-value options to be given comma-separated as well as repeated."""
+
+    return [item.strip() for v in value for item in v.split(",") if item.strip()]
 
 
 @click.command(context_settings={"auto_envvar_prefix": "FCC"})
@@ -128,15 +813,76 @@ class Locator:
 )
 @click.option("--desc-format", "-D", default="{address}")
 @click.option(
-    "--output", "-o", "output_file", type=click.File(mode="w"), default=sys.stdout
+    "--zip",
+    "-Z",
+    "zip_codes",
+    multiple=True,
+    callback=split_values,
+    help="ZIP code or ZIP code prefix",
+)
+@click.option("--state", "-S", "states", multiple=True, callback=split_values)
+@click.option("--city", "-C", "cities", multiple=True, callback=split_values)
+@click.option(
+    "--operator-class",
+    "-O",
+    "operator_classes",
+    multiple=True,
+    callback=split_values,
+)
+@click.option("--call-sign", "-c", "call_signs", multiple=True, callback=split_values)
+@click.option("--active-only", "-A", is_flag=True, help="Skip inactive licenses")
+@click.option("--rate", default=1.0, help="Maximum geocoding requests per second")
+@click.option("--concurrency", default=4, help="Concurrent geocoding requests")
+@click.option("--batch-size", default=1000, help="Rows to fetch and geocode at a time")
+@click.option(
+    "--index",
+    "-i",
+    "index_path",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Local geocoding index built by geoindex.py",
+)
+@click.option(
+    "--precision",
+    type=click.Choice(GeoIndex.precisions),
+    default="address",
+    help="Match local index entries by street address or by ZIP code",
+)
+@click.option(
+    "--migrate-cache",
+    is_flag=True,
+    help="Re-key geocode cache entries written by older versions",
 )
+@click.option("--output", "-o", "output_file", type=click.File(mode="wb"), default="-")
+@click.option(
+    "--format",
+    "-f",
+    "output_format",
+    type=click.Choice(list(EXPORTERS)),
+    default="gpx",
+    help="Output format",
+)
+@click.option("--gzip", "-z", "compress", is_flag=True, help="Gzip the output")
 def main(
     dburi: str,
-    api_key: str,
+    api_key: str | None,
     verbosity: int,
     label_format: str,
     desc_format: str,
-    output_file: io.IOBase,
+    zip_codes: list[str],
+    states: list[str],
+    cities: list[str],
+    operator_classes: list[str],
+    call_signs: list[str],
+    active_only: bool,
+    rate: float,
+    concurrency: int,
+    batch_size: int,
+    index_path: str | None,
+    precision: str,
+    migrate_cache: bool,
+    output_file: BinaryIO,
+    output_format: str,
+    compress: bool,
 ):
     logLevel = ["WARNING", "INFO", "DEBUG"][min(verbosity, 2)]
     logging.basicConfig(
@@ -144,57 +890,59 @@ def main(
         format="%(asctime)s.%(msecs)03d [%(levelname)s] %(message)s",
         datefmt="%T",
     )
-    locator = Locator(api_key)
+    try:
+        formatter = RowFormatter(label_format, desc_format)
+    except ValueError as err:
+        raise click.UsageError(str(err))
+
+    index = GeoIndex(index_path) if index_path is not None else None
+    locator = Locator(
+        api_key, rate=rate, concurrency=concurrency, index=index, precision=precision
+    )
+    if migrate_cache:
+        LOG.info(f"migrated {locator.migrate_cache()} cache entries")
     engine = create_engine(dburi, echo=False)
-    gpxout = gpx.GpxFile()
-    with Session(engine) as session:
-        q = select(Entity).where(Entity.zip_code == "02478")
-        res = session.execute(q)
-        for entity in res.scalars():
-            last_status: History | None = next(
-                reversed(sorted(entity.history, key=lambda x: x.log_date)), None
-            )
-            full_name = " ".join(
-                [
-                    getattr(entity, x)
-                    for x in ["first_name", "mi", "last_name"]
-                    if getattr(entity, x)
-                ]
-            )
-            if last_status is not None and last_status.code.strip() in [
-                "LICAN",
-                "LIEXP",
-            ]:
-                LOG.info(f"skipping {full_name} ({entity.call_sign}): license expired")
-            address = f"{entity.street_address}, {entity.city}, {entity.state} {entity.zip_code}"
-            try:
-                loc = locator.locate(address)
-            except ValueError as err:
-                LOG.error(err)
-                continue
-
-            attrs = {
-                "full_name": full_name,
-                "loc": loc,
-                "address": address,
-            }
-            attrs.update(entity.to_dict())
-            attrs.update(entity.license.to_dict())
-
-            desc = desc_format.format(**attrs)
-            label = label_format.format(**attrs)
-
-            gpxout.wpt.append(
-                gpx.Waypoint(
-                    name=label,
-                    desc=desc,
-                    lat=loc.lat,
-                    lon=loc.lon,
+    if engine.dialect.name == "sqlite":
+        # Geocodes are committed while the export query is still being read,
+        # which sqlite only allows in WAL mode. The mode is stored in the file.
+        with engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+    where = export_filters(
+        zip_codes=zip_codes,
+        states=states,
+        cities=cities,
+        operator_classes=operator_classes,
+        call_signs=call_signs,
+        active_only=active_only,
+    )
+    with (
+        output_file,
+        EXPORTERS[output_format](
+            output_file, EXPORT_FIELDS, compress=compress
+        ) as exporter,
+        Session(engine) as session,
+    ):
+        # yield_per fetches rows in chunks, with a server-side cursor where the
+        # database supports one.
+        res = session.execute(
+            export_query(*where).execution_options(yield_per=batch_size)
+        )
+        for batch in res.partitions():
+            # Geocodes are committed batch by batch on their own connection, so
+            # that a failure part way through doesn't lose the ones already found.
+            with engine.begin() as conn:
+                locations = locator.locate_entities(
+                    conn, [entity for entity, _, _ in batch]
                 )
-            )
-
-    with output_file:
-        output_file.write(gpxout.to_xml(skip_empty=True, pretty_print=True).decode())
+            rows = []
+            for entity, license, last_code in batch:
+                loc = locations[entity.unique_system_identifier]
+                if isinstance(loc, ValueError):
+                    LOG.error(loc)
+                    continue
+                rows.append(formatter.row(entity, license, last_code, loc))
+            exporter.write(rows)
+        LOG.info(f"exported {exporter.count} locations")
 
 
 if __name__ == "__main__":
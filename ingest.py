@@ -1,26 +1,53 @@
+from collections.abc import Iterable, Iterator, Sequence
+from typing import Any, IO
+
+import contextlib
+import io
+import itertools
 import os
+import datetime
+import hashlib
+import logging
+import threading
+import time
+import multiprocessing
+import zipfile
+import click
 import dotenv
 
-dotenv.load_dotenv()
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 from sqlalchemy import create_engine
+from sqlalchemy import delete
+from sqlalchemy import insert
+from sqlalchemy import select
+from sqlalchemy import Table
 from sqlalchemy.orm import Session
 from sqlalchemy.event import listens_for
 from sqlalchemy.pool import Pool
+from sqlalchemy.engine import Connection
 from sqlalchemy.engine import Engine
 from sqlalchemy.engine.interfaces import DBAPIConnection
 from sqlalchemy.pool import ConnectionPoolEntry
 
+from fccdb import AppliedTransaction
 from fccdb import Base
+from fccdb import create_indexes
 from fccdb import Entity
-from fccdb import Amateur
-from fccdb import History
-from fccdb import LicenseHeader
-from fccdb import Comment
-from fccdb import LicenseAttachment
-from fccdb import LicenseSpecialCondition
-from fccdb import LicenseFreeformSpecialCondition
+from fccdb import drop_indexes
+from fccdb import IngestCheckpoint
+from fccdb import invalidate_geocodes
+from fccdb import LicenseStatus
+from fccdb import NameSearch
+from fccdb import DEFAULT_BATCH_SIZE
+from fccdb import RECORD_TYPES
+from fccdb import refresh_license_status
+from fccdb import refresh_name_search
 
+dotenv.load_dotenv()
+LOG = logging.getLogger(__name__)
 
 # @listens_for(Engine, "connect")
 # def on_connect(dbapi_con: DBAPIConnection, con_record: ConnectionPoolEntry):
@@ -29,46 +56,560 @@ from fccdb import LicenseFreeformSpecialCondition
 #    cursor.execute("PRAGMA synchronous=OFF")
 #    cursor.close()
 
+# A batch of parsed rows on its way from a parser process to a writer thread,
+# with the number of its first record in the file. A parser sends
+# (record_type, 0, None) after the last batch of a file, and the writers exit
+# when they receive None.
+WorkItem = tuple[str, int, Sequence[tuple[Any, ...]] | None] | None
+
+_batches: "multiprocessing.Queue[WorkItem]"
+
+# Where a ULS file is read from: a path, or a .zip archive and the name of a member.
+Source = str | tuple[str, str]
+
+
+def source_name(source: Source) -> str:
+    return source if isinstance(source, str) else f"{source[0]}:{source[1]}"
+
+
+@contextlib.contextmanager
+def open_source(source: Source, binary: bool = False) -> Iterator[IO[Any]]:
+    """Open a ULS file for reading, as text with "\r\n" line endings unless binary.
+
+    Archive members are decompressed as they are read, without being extracted."""
+
+    with contextlib.ExitStack() as stack:
+        if isinstance(source, str):
+            fd = stack.enter_context(open(source, "rb"))
+        else:
+            archive, member = source
+            fd = stack.enter_context(
+                stack.enter_context(zipfile.ZipFile(archive)).open(member)
+            )
+        if binary:
+            yield fd
+        else:
+            yield stack.enter_context(io.TextIOWrapper(fd, newline="\r\n"))
+
+
+def find_sources(path: str, record_types: list[str] | None = None) -> dict[str, Source]:
+    """Find the ULS files in a directory or .zip archive, by record type.
+
+    Files are named after their record type, as in the FCC's archives. Only record
+    types in record_types (default: all known types) are returned."""
+
+    wanted = record_types or list(RECORD_TYPES)
+    if os.path.isdir(path):
+        return {
+            record_type: source
+            for record_type in wanted
+            if os.path.exists(source := os.path.join(path, f"{record_type}.dat"))
+        }
+
+    with zipfile.ZipFile(path) as archive:
+        members = {
+            os.path.basename(name).removesuffix(".dat").upper(): name
+            for name in archive.namelist()
+            if name.lower().endswith(".dat")
+        }
+    for name in set(members) - set(RECORD_TYPES):
+        LOG.warning(f"{path}: ignoring {members[name]}: unknown record type")
+    return {
+        record_type: (path, members[record_type])
+        for record_type in wanted
+        if record_type in members
+    }
+
+
+def _init_parser(batches: "multiprocessing.Queue[WorkItem]"):
+    global _batches
+    _batches = batches
+
+
+def source_fingerprint(source: Source) -> str:
+    """Identify the contents of a ULS file without reading it.
+
+    Archive members are identified by the CRC-32 and size stored in the archive's
+    directory, and other files by their size and modification time."""
+
+    if isinstance(source, str):
+        st = os.stat(source)
+        return f"{st.st_size}:{st.st_mtime_ns}"
+    archive, member = source
+    with zipfile.ZipFile(archive) as zf:
+        info = zf.getinfo(member)
+    return f"{info.file_size}:{info.CRC:08x}"
+
+
+def iter_pending_batches(
+    records: Iterable[list[str]],
+    committed: Sequence[tuple[int, int]],
+    batch_size: int,
+) -> Iterator[tuple[int, list[list[str]]]]:
+    """Batch records, leaving out the (first record, rows) ranges in committed.
+
+    Yields the number of the first record of each batch with its records. Batches
+    never span a committed range, so a resumed load may use a different batch size."""
+
+    records = iter(records)
+    number = 0
+    for start, rows in sorted(committed):
+        while number < start:
+            batch = list(itertools.islice(records, min(batch_size, start - number)))
+            if not batch:
+                return
+            yield number, batch
+            number += len(batch)
+        if number < start + rows:
+            skipped = start + rows - number
+            number += sum(1 for _ in itertools.islice(records, skipped))
+    for batch in itertools.batched(records, batch_size):
+        yield number, list(batch)
+        number += len(batch)
+
+
+def _parse_file(
+    record_type: str,
+    source: Source,
+    batch_size: int,
+    committed: Sequence[tuple[int, int]] = (),
+) -> int:
+    """Parse one ULS file in a worker process and feed batches to the writers.
+
+    Records in committed ranges were written by an earlier load and are skipped."""
+
+    model = RECORD_TYPES[record_type]
+    count = 0
+    try:
+        with open_source(source) as fd:
+            for first, records in iter_pending_batches(
+                model.read_records(fd), committed, batch_size
+            ):
+                _batches.put((record_type, first, model.coerce_records(records)))
+                count += len(records)
+    finally:
+        # Batches from one process arrive in order, so this tells the writers
+        # that everything from this file has been queued.
+        _batches.put((record_type, 0, None))
+    return count
+
+
+def load_order(record_types: list[str]) -> list[list[str]]:
+    """Group record types so that every table in a group only references tables in earlier groups."""
+
+    levels: dict[Table, int] = {}
+    for table in Base.metadata.sorted_tables:
+        parents = [
+            fk.column.table for fk in table.foreign_keys if fk.column.table is not table
+        ]
+        levels[table] = 1 + max((levels[parent] for parent in parents), default=-1)
+
+    groups: dict[int, list[str]] = {}
+    for record_type in record_types:
+        level = levels[RECORD_TYPES[record_type].__table__]
+        groups.setdefault(level, []).append(record_type)
+    return [groups[level] for level in sorted(groups)]
+
+
+class Progress:
+    """Track rows written per table and periodically log throughput."""
+
+    def __init__(self, interval: float = 10):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.rows: dict[str, int] = {}
+        self.started: dict[str, float] = {}
+        self.last_report = time.time()
+
+    def start(self, record_type: str):
+        with self.lock:
+            self.rows[record_type] = 0
+            self.started[record_type] = time.time()
+
+    def update(self, record_type: str, count: int):
+        with self.lock:
+            self.rows[record_type] += count
+            now = time.time()
+            if now - self.last_report < self.interval:
+                return
+            self.last_report = now
+            for name in self.rows:
+                self.report(name, now)
+
+    def finish(self, record_type: str):
+        with self.lock:
+            self.report(record_type, time.time(), done=True)
+
+    def report(self, record_type: str, now: float, done: bool = False):
+        model = RECORD_TYPES[record_type]
+        rows = self.rows[record_type]
+        elapsed = max(now - self.started[record_type], 1e-6)
+        LOG.info(
+            f"{model.__tablename__}: {'loaded' if done else 'wrote'} {rows} rows "
+            f"in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)"
+        )
+
+
+class IngestEngine:
+    """Parse ULS files in a process pool and write them through one or more connections.
+
+    Parsing is CPU-bound and writing is I/O-bound, so parser processes hand batches of
+    rows to writer threads through a bounded queue. Tables are loaded in dependency
+    order: all tables in one group of load_order() are finished before the next
+    group starts, so foreign keys always point at rows that already exist.
+
+    Each batch is committed on its own, together with an IngestCheckpoint row, so an
+    interrupted load can be run again and carry on from the batches it had written."""
+
+    def __init__(
+        self,
+        engine: Engine,
+        parsers: int | None = None,
+        writers: int = 1,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        queue_size: int = 16,
+    ):
+        self.engine = engine
+        self.parsers = parsers or os.cpu_count() or 1
+        self.writers = writers
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.progress = Progress()
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.checkpoints: dict[str, dict[str, str]] = {}
+
+    def load(
+        self, files: dict[str, Source], defer_indexes: bool = True, resume: bool = True
+    ):
+        """Load files, a mapping of record type to path or archive member.
+
+        If defer_indexes is true, secondary indexes on the tables being loaded are
+        dropped for the duration of the load and rebuilt afterwards. If resume is
+        true, batches that were committed by an earlier, interrupted load of the same
+        files are not loaded again; otherwise any checkpoints are discarded. Tables
+        without checkpoints to resume from are emptied and loaded from the start."""
+
+        tables = [RECORD_TYPES[record_type].__table__ for record_type in files]
+        if defer_indexes:
+            with self.engine.begin() as conn:
+                drop_indexes(conn, tables)
+
+        # Writers are threads, so parsers must not be forked from this process.
+        context = multiprocessing.get_context("spawn")
+        batches: "multiprocessing.Queue[WorkItem]" = context.Queue(self.queue_size)
+        try:
+            with ProcessPoolExecutor(
+                self.parsers,
+                mp_context=context,
+                initializer=_init_parser,
+                initargs=(batches,),
+            ) as pool:
+                committed = self.committed(files, resume)
+                for group in load_order(list(files)):
+                    self.load_group(
+                        pool, batches, {rt: files[rt] for rt in group}, committed
+                    )
+        finally:
+            # Even after a failed load, don't leave the tables without indexes.
+            if defer_indexes:
+                LOG.info("creating indexes")
+                with self.engine.begin() as conn:
+                    create_indexes(conn, tables)
+
+        LOG.info("refreshing license status")
+        with self.engine.begin() as conn:
+            refresh_license_status(conn)
+            refresh_name_search(conn)
+            LOG.info(f"invalidated {invalidate_geocodes(conn)} geocodes")
+            conn.execute(
+                delete(IngestCheckpoint).where(IngestCheckpoint.record_type.in_(files))
+            )
+
+    def committed(
+        self, files: dict[str, Source], resume: bool
+    ) -> dict[str, list[tuple[int, int]]]:
+        """Return the (first record, rows) ranges already loaded from each file."""
+
+        self.checkpoints = {
+            record_type: {
+                "fingerprint": source_fingerprint(source),
+                "source": source_name(source),
+            }
+            for record_type, source in files.items()
+        }
+        committed: dict[str, list[tuple[int, int]]] = {rt: [] for rt in files}
+        with self.engine.begin() as conn:
+            where = IngestCheckpoint.record_type.in_(files)
+            if not resume:
+                conn.execute(delete(IngestCheckpoint).where(where))
+            for checkpoint in conn.execute(select(IngestCheckpoint).where(where)):
+                fingerprint = self.checkpoints[checkpoint.record_type]["fingerprint"]
+                if checkpoint.fingerprint != fingerprint:
+                    raise ValueError(
+                        f"{RECORD_TYPES[checkpoint.record_type].__tablename__} was "
+                        f"partly loaded from a different {checkpoint.source}; "
+                        "load again without resuming to start over"
+                    )
+                committed[checkpoint.record_type].append(
+                    (checkpoint.first_record, checkpoint.rows)
+                )
+            # Only tables with checkpoints are part of an interrupted load; anything
+            # else in the others is left from an earlier load and is replaced.
+            self.empty(conn, {rt: files[rt] for rt in files if not committed[rt]})
+
+        for record_type, ranges in committed.items():
+            if ranges:
+                LOG.info(
+                    f"{RECORD_TYPES[record_type].__tablename__}: resuming after "
+                    f"{sum(rows for _, rows in ranges)} rows"
+                )
+        return committed
+
+    def empty(self, conn: Connection, files: dict[str, Source]):
+        """Delete everything from the tables that files are loaded into.
+
+        The tables derived from entity are emptied with it; load() rebuilds them."""
+
+        tables = {RECORD_TYPES[record_type].__table__ for record_type in files}
+        if Entity.__table__ in tables:
+            tables |= {LicenseStatus.__table__, NameSearch.__table__}
+        for table in reversed(Base.metadata.sorted_tables):
+            if table in tables:
+                conn.execute(table.delete())
+
+    def load_group(
+        self,
+        pool: ProcessPoolExecutor,
+        batches: "multiprocessing.Queue[WorkItem]",
+        files: dict[str, Source],
+        committed: dict[str, list[tuple[int, int]]] | None = None,
+    ):
+        errors: list[Exception] = []
+        self.pending = len(files)
+        writers = [
+            threading.Thread(target=self.writer, args=(batches, errors))
+            for _ in range(self.writers)
+        ]
+        for thread in writers:
+            thread.start()
+
+        futures: dict[str, Future[int]] = {}
+        for record_type, source in files.items():
+            LOG.info(
+                f"loading {source_name(source)} into "
+                f"{RECORD_TYPES[record_type].__tablename__}"
+            )
+            self.progress.start(record_type)
+            futures[record_type] = pool.submit(
+                _parse_file,
+                record_type,
+                source,
+                self.batch_size,
+                (committed or {}).get(record_type, ()),
+            )
+
+        for record_type, future in futures.items():
+            try:
+                future.result()
+            except Exception as err:
+                errors.append(err)
+
+        if any(isinstance(err, BrokenProcessPool) for err in errors):
+            # A parser process died without sending the end of its file, and
+            # nothing more is coming from the others, so stop the writers here.
+            for _ in writers:
+                batches.put(None)
+
+        for thread in writers:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+        for record_type in files:
+            self.progress.finish(record_type)
+
+    def writer(
+        self, batches: "multiprocessing.Queue[WorkItem]", errors: list[Exception]
+    ):
+        with contextlib.ExitStack() as stack:
+            try:
+                conn = stack.enter_context(self.engine.connect())
+            except Exception as err:
+                # Nothing can be written, but the queue must still be drained.
+                errors.append(err)
+            while (item := batches.get()) is not None:
+                record_type, first, batch = item
+                if batch is None:
+                    self.file_done(batches)
+                    continue
+                # After a failure keep draining the queue so that parsers
+                # blocked on a full queue can finish.
+                if errors:
+                    continue
+                try:
+                    with conn.begin():
+                        RECORD_TYPES[record_type].write_batch(conn, batch)
+                        self.checkpoint(conn, record_type, first, len(batch))
+                except Exception as err:
+                    errors.append(err)
+                    continue
+                self.progress.update(record_type, len(batch))
+
+    def checkpoint(self, conn: Connection, record_type: str, first: int, rows: int):
+        if record_type not in self.checkpoints:
+            return
+        conn.execute(
+            insert(IngestCheckpoint),
+            dict(
+                self.checkpoints[record_type],
+                record_type=record_type,
+                first_record=first,
+                rows=rows,
+                committed_at=datetime.datetime.now(),
+            ),
+        )
+
+    def file_done(self, batches: "multiprocessing.Queue[WorkItem]"):
+        with self.lock:
+            self.pending -= 1
+            if self.pending == 0:
+                for _ in range(self.writers):
+                    batches.put(None)
+
+
+def apply_transactions(
+    engine: Engine, datadir: str, record_types: list[str] | None = None
+) -> bool:
+    """Apply a directory or .zip archive of ULS daily transaction files as upserts.
+
+    Each set of files is applied in a single transaction and recorded in the
+    applied_transaction table by content hash, so applying the same daily twice is a
+    no-op. Returns False if the files had already been applied."""
+
+    files = find_sources(datadir, record_types)
+
+    digest = hashlib.sha256()
+    for record_type, source in sorted(files.items()):
+        digest.update(record_type.encode())
+        with open_source(source, binary=True) as fd:
+            digest.update(hashlib.file_digest(fd, "sha256").digest())
+
+    with Session(engine) as session, session.begin():
+        if session.get(AppliedTransaction, digest.hexdigest()) is not None:
+            LOG.info(f"skipping {datadir}: already applied")
+            return False
+
+        # A license in a daily set is sent with all of its records, so its rows are
+        # replaced in every table of the set, even those with no rows for it.
+        # Transaction files are small enough to read into memory.
+        rows: dict[str, list[tuple[Any, ...]]] = {}
+        ids: set[int] = set()
+        for record_type, source in files.items():
+            model = RECORD_TYPES[record_type]
+            key = model.get_field_names().index("unique_system_identifier")
+            with open_source(source) as fd:
+                rows[record_type] = list(model.iter_rows(fd))
+            ids.update(row[key] for row in rows[record_type])
+
+        changed = 0
+        changed_ids: set[int] = set()
+        for group in load_order(list(files)):
+            for record_type in group:
+                model = RECORD_TYPES[record_type]
+                count = model.upsert_rows(
+                    session.connection(),
+                    rows[record_type],
+                    changed_ids=changed_ids,
+                    ids=ids,
+                )
+                LOG.info(f"{model.__tablename__}: {count} rows changed")
+                changed += count
+
+        refresh_license_status(session.connection(), changed_ids)
+        refresh_name_search(session.connection(), changed_ids)
+        invalidated = invalidate_geocodes(session.connection(), changed_ids)
+        LOG.info(f"invalidated {invalidated} geocodes")
+
+        session.add(
+            AppliedTransaction(
+                digest=digest.hexdigest(),
+                name=os.path.basename(os.path.normpath(datadir)),
+                applied_at=datetime.datetime.now(),
+                rows_changed=changed,
+            )
+        )
+    return True
+
+
+@click.command(context_settings={"auto_envvar_prefix": "FCC"})
+@click.option("--dburi", "-d", required=True)
+@click.option("--verbosity", "-v", count=True)
+@click.option("--parsers", "-p", type=int, help="Number of parser processes")
+@click.option("--writers", "-w", default=1, help="Number of writer connections")
+@click.option("--batch-size", "-b", default=DEFAULT_BATCH_SIZE)
+@click.option(
+    "--table",
+    "-t",
+    "record_types",
+    multiple=True,
+    type=click.Choice(list(RECORD_TYPES)),
+    help="Only load these record types (default: all found in DATADIR)",
+)
+@click.option(
+    "--incremental",
+    "-i",
+    is_flag=True,
+    help="Apply each DATADIR as a daily transaction set instead of doing a full load",
+)
+@click.option(
+    "--resume/--restart",
+    default=True,
+    help="Carry on from the batches committed by an interrupted load (default), or "
+    "empty the tables and load them from the start",
+)
+@click.argument("datadirs", nargs=-1, type=click.Path(exists=True))
+def main(
+    dburi: str,
+    verbosity: int,
+    parsers: int | None,
+    writers: int,
+    batch_size: int,
+    record_types: tuple[str, ...],
+    incremental: bool,
+    resume: bool,
+    datadirs: tuple[str, ...],
+):
+    """Load ULS files from each DATADIR, a directory or a .zip archive from the FCC."""
+
+    logLevel = ["WARNING", "INFO", "DEBUG"][min(verbosity + 1, 2)]
+    logging.basicConfig(
+        level=logLevel,
+        format="%(asctime)s.%(msecs)03d [%(levelname)s] %(message)s",
+        datefmt="%T",
+    )
+
+    engine = create_engine(dburi)
+    Base.metadata.create_all(engine)
+
+    if incremental:
+        for datadir in datadirs:
+            apply_transactions(engine, datadir, list(record_types))
+        return
+
+    if len(datadirs) > 1:
+        raise click.UsageError("a full load takes a single DATADIR")
+    # Archives for different services hold different record types, so by default
+    # everything found is loaded.
+    datadir = datadirs[0] if datadirs else "db"
+    if not (files := find_sources(datadir, list(record_types))):
+        raise click.UsageError(f"no ULS files found in {datadir}")
+    if missing := set(record_types) - set(files):
+        raise click.UsageError(f"no files for {', '.join(sorted(missing))}")
+    IngestEngine(engine, parsers=parsers, writers=writers, batch_size=batch_size).load(
+        files, resume=resume
+    )
+
 
-engine = create_engine(os.environ["FCC_DBURI"])
-Base.metadata.create_all(engine)
-with Session(engine) as session:
-    with session.begin():
-        print("import entities")
-        with open("db/EN.dat", newline="\r\n") as fd:
-            Entity.import_csv(fd, session)
-
-    with session.begin():
-        print("import amateur")
-        with open("db/AM.dat", newline="\r\n") as fd:
-            Amateur.import_csv(fd, session)
-
-    with session.begin():
-        print("import history")
-        with open("db/HS.dat", newline="\r\n") as fd:
-            History.import_csv(fd, session)
-
-    with session.begin():
-        print("import headers")
-        with open("db/HD.dat", newline="\r\n") as fd:
-            LicenseHeader.import_csv(fd, session)
-
-    with session.begin():
-        print("import comments")
-        with open("test.dat", newline="\r\n") as fd:
-            Comment.import_csv(fd, session)
-
-    with session.begin():
-        print("import attachments")
-        with open("db/LA.dat", newline="\r\n") as fd:
-            LicenseAttachment.import_csv(fd, session)
-
-    with session.begin():
-        print("import special conditions")
-        with open("db/SC.dat", newline="\r\n") as fd:
-            LicenseSpecialCondition.import_csv(fd, session)
-
-    with session.begin():
-        print("import freeform special conditions")
-        with open("db/SF.dat", newline="\r\n") as fd:
-            LicenseFreeformSpecialCondition.import_csv(fd, session)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Find licensees by partial or misspelled names.
+
+The names in the name_search table are indexed by trigrams: with an FTS5 table
+using the trigram tokenizer on sqlite, and with pg_trgm on postgresql. Candidates
+are found through the index and then ranked by how many of the trigrams of the
+search text they contain. On sqlite, names containing every word of the search
+text are candidates; only if there are too few of them are names sharing the
+rarest trigrams of the search text added. Search from the command line with:
+
+    python namesearch.py -d sqlite:///fcc.db jon smyth
+"""
+
+import logging
+import re
+
+import click
+import dotenv
+
+from sqlalchemy import bindparam
+from sqlalchemy import Connection
+from sqlalchemy import create_engine
+from sqlalchemy import literal
+from sqlalchemy import select
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from fccdb import Entity
+from fccdb import NameSearch
+
+dotenv.load_dotenv()
+LOG = logging.getLogger(__name__)
+
+WORD = re.compile(r"[^\W_]+")
+
+# Approximate matches on sqlite are found through the rarest trigrams of the search
+# text, using as many as will together match no more than this many names. Common
+# trigrams match much of the table and add little to the ranking, and ranking costs
+# a couple of microseconds per name matched.
+FUZZY_MATCH_LIMIT = 20_000
+
+# Exact matches are not ordered by rank: every one is read to rank them, which is
+# slow for common names, and they are ranked again anyway.
+FTS_QUERY = text(
+    "SELECT rowid, names FROM name_search_fts WHERE name_search_fts MATCH :match "
+    "LIMIT :limit"
+)
+
+FTS_RANKED_QUERY = text(
+    "SELECT rowid, names FROM name_search_fts WHERE name_search_fts MATCH :match "
+    "ORDER BY rank LIMIT :limit"
+)
+
+VOCAB_QUERY = text(
+    "SELECT term, doc FROM name_search_vocab WHERE term IN :terms"
+).bindparams(bindparam("terms", expanding=True))
+
+
+def words(value: str) -> list[str]:
+    return WORD.findall(value.lower())
+
+
+def trigrams(value: str) -> set[str]:
+    """Return the trigrams of the words in value, padded as pg_trgm does."""
+
+    return {
+        padded[i : i + 3]
+        for word in words(value)
+        for padded in [f"  {word} "]
+        for i in range(len(padded) - 2)
+    }
+
+
+def match_score(query: set[str], names: str) -> float:
+    """Return the fraction of the trigrams in query that are found in names."""
+
+    if not query:
+        return 0.0
+    return len(query & trigrams(names)) / len(query)
+
+
+def _sqlite_candidates(
+    conn: Connection, terms: list[str], k: int, limit: int
+) -> dict[int, str]:
+    # Names in which every term appears.
+    found = dict(
+        conn.execute(
+            FTS_QUERY,
+            {"match": " AND ".join(f'"{term}"' for term in terms), "limit": limit},
+        ).all()
+    )
+    if len(found) >= k:
+        return found
+
+    # Names sharing the rarest trigrams of the terms, those with the most of them
+    # first. Trigrams that appear nowhere, such as those around a misspelling, are
+    # left out.
+    grams = {term[i : i + 3] for term in terms for i in range(len(term) - 2)}
+    counts = dict(conn.execute(VOCAB_QUERY, {"terms": list(grams)}).all())
+    rare: list[str] = []
+    total = 0
+    for gram in sorted(counts, key=counts.__getitem__):
+        total += counts[gram]
+        if rare and total > FUZZY_MATCH_LIMIT:
+            break
+        rare.append(gram)
+    if rare:
+        found.update(
+            conn.execute(
+                FTS_RANKED_QUERY,
+                {"match": " OR ".join(f'"{gram}"' for gram in rare), "limit": limit},
+            ).all()
+        )
+    return found
+
+
+def _postgresql_candidates(conn: Connection, value: str, limit: int) -> dict[int, str]:
+    query = (
+        select(NameSearch.unique_system_identifier, NameSearch.names)
+        .where(literal(value).op("<%")(NameSearch.names))
+        .order_by(
+            literal(value).op("<<->")(NameSearch.names),
+            NameSearch.unique_system_identifier,
+        )
+        .limit(limit)
+    )
+    return dict(conn.execute(query).all())
+
+
+def _like_candidates(conn: Connection, terms: list[str], limit: int) -> dict[int, str]:
+    query = select(NameSearch.unique_system_identifier, NameSearch.names).limit(limit)
+    for term in terms:
+        query = query.where(NameSearch.names.ilike(f"%{term}%"))
+    return dict(conn.execute(query).all())
+
+
+def search_names(
+    session: Session, value: str, k: int = 10, candidates: int = 200
+) -> list[tuple[Entity, float]]:
+    """Return up to k entities whose names best match value, best first, with scores.
+
+    First, last, entity and trustee names are searched. A score is the fraction of
+    the trigrams of value found in an entity's names, so 1.0 means every word of
+    value appears whole. Up to candidates matches are read from the index before
+    ranking, so when more names than that match, the best of them may be missed.
+    Raises ValueError if value has no word of three or more characters.
+
+    Other databases than sqlite and postgresql fall back to a substring scan, which
+    finds only exact matches."""
+
+    terms = [word for word in words(value) if len(word) >= 3]
+    if not terms:
+        raise ValueError("search text needs a word of at least three characters")
+
+    conn = session.connection()
+    limit = max(k, candidates)
+    if conn.dialect.name == "sqlite":
+        found = _sqlite_candidates(conn, terms, k, limit)
+    elif conn.dialect.name == "postgresql":
+        found = _postgresql_candidates(conn, " ".join(terms), limit)
+    else:
+        found = _like_candidates(conn, terms, limit)
+
+    query = trigrams(value)
+    ranked = sorted(
+        ((match_score(query, names), usi, names) for usi, names in found.items()),
+        key=lambda match: (-match[0], len(match[2]), match[1]),
+    )[:k]
+
+    entities = {
+        entity.unique_system_identifier: entity
+        for entity in session.scalars(
+            select(Entity).where(
+                Entity.unique_system_identifier.in_([usi for _, usi, _ in ranked])
+            )
+        )
+    }
+    return [(entities[usi], score) for score, usi, _ in ranked if usi in entities]
+
+
+@click.command(context_settings={"auto_envvar_prefix": "FCC"})
+@click.option("--dburi", "-d", required=True)
+@click.option("--verbosity", "-v", count=True)
+@click.option("--limit", "-k", default=10, help="Number of matches")
+@click.argument("search", nargs=-1, required=True)
+def main(dburi: str, verbosity: int, limit: int, search: tuple[str, ...]):
+    logLevel = ["WARNING", "INFO", "DEBUG"][min(verbosity + 1, 2)]
+    logging.basicConfig(level=logLevel)
+
+    engine = create_engine(dburi)
+    with Session(engine) as session:
+        try:
+            matches = search_names(session, " ".join(search), limit)
+        except ValueError as err:
+            raise click.UsageError(str(err))
+        for entity, score in matches:
+            name = entity.entity_name or f"{entity.first_name} {entity.last_name}"
+            print(f"{score:.2f} {entity.call_sign or '-':10} {name}")
+
+
+if __name__ == "__main__":
+    main()
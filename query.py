@@ -1,15 +1,258 @@
-import os
-import dotenv
+"""Look up licensees by call sign, licensee ID or FRN.
 
-dotenv.load_dotenv()
+Lookups go straight to Core queries (no ORM objects are built) over a pool of
+read-only connections, and results are kept in a bounded LRU cache with a TTL.
+Run a local HTTP server with:
+
+    python query.py -d sqlite:///fcc.db --port 8073
+
+and request /call_sign/K1ABC, /licensee_id/L00000001 or /frn/0001234567.
+"""
+
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Any
+
+import datetime
+import http.server
+import json
+import logging
+import threading
+import time
+
+import click
+import dotenv
 
+from sqlalchemy import bindparam
 from sqlalchemy import create_engine
+from sqlalchemy import Engine
+from sqlalchemy import event
+from sqlalchemy import Select
 from sqlalchemy import select
-from sqlalchemy.orm import Session
 
-from fccdb import *
+from fccdb import Amateur
+from fccdb import Base
+from fccdb import Entity
+from fccdb import LicenseStatus
+
+dotenv.load_dotenv()
+LOG = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """A thread-safe LRU cache whose entries also expire after ttl seconds."""
+
+    def __init__(self, maxsize: int = 100_000, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Any) -> Any | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Any, value: Any):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+
+def readonly_engine(dburi: str, pool_size: int = 8) -> Engine:
+    """Create an engine whose pooled connections refuse to write."""
+
+    engine = create_engine(dburi, pool_size=pool_size, max_overflow=0)
+    if engine.dialect.name == "sqlite":
+
+        @event.listens_for(engine, "connect")
+        def query_only(dbapi_con: Any, con_record: Any):
+            dbapi_con.execute("pragma query_only = on")
+
+    elif engine.dialect.name == "postgresql":
+        engine = engine.execution_options(postgresql_readonly=True)
+    return engine
+
+
+def _normalize_frn(frn: str) -> str:
+    return frn.strip().zfill(10)
+
+
+def _normalize_id(value: str) -> str:
+    return value.strip().upper()
+
+
+class Lookup:
+    """Look up licensees, returning plain dicts of entity, license and status fields.
+
+    Results are cached, and shared between callers, so they must not be modified."""
+
+    # Lookup keys, the Entity column each one searches and how values are normalized.
+    keys: dict[str, tuple[Any, Callable[[str], str]]] = {
+        "call_sign": (Entity.call_sign, _normalize_id),
+        "licensee_id": (Entity.licensee_id, _normalize_id),
+        "frn": (Entity.fcc_registration_number, _normalize_frn),
+    }
+
+    # The parts of each result, and the columns they are built from.
+    parts: dict[str, tuple[type[Base], tuple[str, ...]]] = {
+        "entity": (Entity, Entity.get_field_names()),
+        "license": (Amateur, Amateur.get_field_names()),
+        "status": (LicenseStatus, LicenseStatus.get_field_names()),
+    }
+
+    def __init__(self, engine: Engine, cache: TTLCache | None = None):
+        self.engine = engine
+        self.cache = TTLCache() if cache is None else cache
+
+        # Where each part's columns are in a result row, and which of them is
+        # unique_system_identifier.
+        self.layout: list[tuple[str, tuple[str, ...], int, int]] = []
+        start = 0
+        for part, (_, names) in self.parts.items():
+            self.layout.append(
+                (part, names, start, start + names.index("unique_system_identifier"))
+            )
+            start += len(names)
+        self.queries = {key: self.query(key) for key in self.keys}
+
+    def query(self, key: str) -> Select:
+        """Build the query for a lookup key, taking the value as the "value" parameter."""
+
+        column, _ = self.keys[key]
+        columns = [
+            model.__table__.c[name]
+            for model, names in self.parts.values()
+            for name in names
+        ]
+        return (
+            select(*columns)
+            .select_from(Entity)
+            .outerjoin(Amateur)
+            .outerjoin(LicenseStatus)
+            .where(column == bindparam("value"))
+            .order_by(
+                LicenseStatus.is_active.desc(),
+                Entity.unique_system_identifier.desc(),
+            )
+        )
+
+    def lookup(self, key: str, value: str) -> list[dict[str, dict[str, Any] | None]]:
+        """Return every licensee matching value, active licenses first.
+
+        key is one of the keys of Lookup.keys. Raises KeyError for unknown keys."""
+
+        _, normalize = self.keys[key]
+        value = normalize(value)
+        if (results := self.cache.get((key, value))) is not None:
+            return results
+
+        results = []
+        with self.engine.connect() as conn:
+            for row in conn.execute(self.queries[key], {"value": value}):
+                # Outer joins give all-NULL columns for missing licenses and statuses.
+                results.append(
+                    {
+                        part: (
+                            None
+                            if row[key_index] is None
+                            else dict(zip(names, row[start : start + len(names)]))
+                        )
+                        for part, names, start, key_index in self.layout
+                    }
+                )
+
+        self.cache.set((key, value), results)
+        return results
+
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"can't serialize {value!r}")
+
+
+class LookupHandler(http.server.BaseHTTPRequestHandler):
+    """Serve GET /<key>/<value>, where key is one of Lookup.keys."""
+
+    # Keep connections open between requests, and don't let Nagle's algorithm hold
+    # back the body until the headers are acknowledged.
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: "LookupServer"
+
+    def do_GET(self):
+        _, key, value = (self.path.split("?")[0].split("/", 2) + ["", ""])[:3]
+        if key not in Lookup.keys or not value:
+            self.respond(400, {"error": f"expected /<{'|'.join(Lookup.keys)}>/<value>"})
+            return
+        try:
+            results = self.server.lookup.lookup(key, value)
+        except Exception:
+            LOG.exception(f"lookup of {self.path} failed")
+            self.respond(500, {"error": "lookup failed"})
+            return
+        self.respond(200 if results else 404, results)
+
+    def respond(self, status: int, body: Any):
+        data = json.dumps(body, default=_json_default).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args: Any):
+        LOG.debug(format, *args)
+
+
+class LookupServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], lookup: Lookup):
+        super().__init__(address, LookupHandler)
+        self.lookup = lookup
+
+
+@click.command(context_settings={"auto_envvar_prefix": "FCC"})
+@click.option("--dburi", "-d", required=True)
+@click.option("--verbosity", "-v", count=True)
+@click.option("--host", default="127.0.0.1")
+@click.option("--port", "-p", default=8073)
+@click.option("--pool-size", default=8, help="Database connections")
+@click.option("--cache-size", default=100_000, help="Cached lookups")
+@click.option("--ttl", default=300.0, help="Seconds to cache each lookup")
+def main(
+    dburi: str,
+    verbosity: int,
+    host: str,
+    port: int,
+    pool_size: int,
+    cache_size: int,
+    ttl: float,
+):
+    logLevel = ["WARNING", "INFO", "DEBUG"][min(verbosity + 1, 2)]
+    logging.basicConfig(level=logLevel)
+
+    lookup = Lookup(readonly_engine(dburi, pool_size), TTLCache(cache_size, ttl))
+    server = LookupServer((host, port), lookup)
+    LOG.info(f"listening on {host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
 
 if __name__ == "__main__":
-    engine = create_engine(os.environ["FCC_DBURI"], echo=True)
-    Base.metadata.create_all(engine)
-    session = Session(engine)
+    main()
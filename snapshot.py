@@ -0,0 +1,362 @@
+"""Write ULS files out as columnar Parquet or Arrow IPC datasets for analysis.
+
+Files are parsed with the same readers and column conversions as ingest, one batch
+of columns at a time, and written without going through a database or the ORM.
+Each record type becomes a dataset in its own directory, named after its table,
+optionally partitioned by state in hive style:
+
+    python snapshot.py -o snapshot -p state db
+
+DATADIR may also be one of the FCC's .zip archives, which is read in place.
+
+    >>> pyarrow.dataset.dataset("snapshot/entity", partitioning="hive")
+
+Requires pyarrow. Arrow IPC files can be memory-mapped without copying when they
+are written with --compression none."""
+
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+
+import logging
+import multiprocessing
+import os
+import time
+import urllib.parse
+
+import click
+import dotenv
+
+from sqlalchemy import Boolean
+from sqlalchemy import Date
+from sqlalchemy import DateTime
+from sqlalchemy import Float
+from sqlalchemy import Integer
+from sqlalchemy.types import TypeEngine
+
+from fccdb import Base
+from fccdb import DEFAULT_BATCH_SIZE
+from fccdb import RECORD_TYPES
+from ingest import find_sources
+from ingest import open_source
+from ingest import Source
+
+dotenv.load_dotenv()
+LOG = logging.getLogger(__name__)
+
+FORMATS = {"parquet": ".parquet", "ipc": ".arrow"}
+
+# Partition directory name for rows with no partition value, as used by Hive.
+DEFAULT_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+# Rows per Parquet row group or IPC record batch. Batches are buffered per
+# partition until they reach this size, so that small partitions don't end up
+# as many tiny row groups.
+DEFAULT_ROW_GROUP_SIZE = 128 * 1024
+
+# The state of each entity, by unique_system_identifier, for partitioning the
+# tables that don't have a state column. Set in worker processes by _init_worker.
+_states: dict[int, str] | None = None
+
+
+def _pyarrow() -> Any:
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ValueError("snapshots require pyarrow")
+    return pyarrow
+
+
+def arrow_type(pa: Any, column_type: TypeEngine) -> Any:
+    if isinstance(column_type, DateTime):
+        return pa.timestamp("us")
+    if isinstance(column_type, Date):
+        return pa.date32()
+    if isinstance(column_type, Boolean):
+        return pa.bool_()
+    if isinstance(column_type, Integer):
+        return pa.int64()
+    if isinstance(column_type, Float):
+        return pa.float64()
+    return pa.string()
+
+
+def arrow_schema(model: type[Base]) -> Any:
+    """Return the Arrow schema for the columns of model, in get_field_names() order."""
+
+    pa = _pyarrow()
+    columns = model.__table__.c
+    return pa.schema(
+        [
+            pa.field(name, arrow_type(pa, columns[name].type))
+            for name in model.get_field_names()
+        ]
+    )
+
+
+class DatasetWriter:
+    """Write batches of columns into a directory of Parquet or IPC files.
+
+    Rows may be split between partitions, each written to its own
+    <partition_by>=<value> subdirectory."""
+
+    def __init__(
+        self,
+        directory: str,
+        schema: Any,
+        format: str = "parquet",
+        compression: str | None = "zstd",
+        partition_by: str | None = None,
+        row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+    ):
+        if format not in FORMATS:
+            raise ValueError(f"unknown format {format}")
+        self.pa = _pyarrow()
+        self.directory = directory
+        self.schema = schema
+        self.format = format
+        self.compression = compression
+        self.partition_by = partition_by
+        self.row_group_size = row_group_size
+        self.writers: dict[str | None, Any] = {}
+        self.buffers: dict[str | None, list[Any]] = {}
+        self.buffered: dict[str | None, int] = {}
+        self.count = 0
+
+    def write(
+        self, columns: Sequence[Sequence[Any]], partitions: Sequence[str | None] = ()
+    ):
+        """Write a batch of columns, in schema order.
+
+        If partition_by was given, partitions holds the partition of each row."""
+
+        batch = self.pa.RecordBatch.from_arrays(
+            [
+                self.pa.array(column, type=field.type)
+                for column, field in zip(columns, self.schema)
+            ],
+            schema=self.schema,
+        )
+        self.count += batch.num_rows
+        if self.partition_by is None:
+            self.buffer(None, batch)
+            return
+
+        rows: dict[str | None, list[int]] = {}
+        for i, partition in enumerate(partitions):
+            rows.setdefault(partition or None, []).append(i)
+        for partition, indices in rows.items():
+            self.buffer(partition, batch.take(self.pa.array(indices)))
+
+    def buffer(self, partition: str | None, batch: Any):
+        self.buffers.setdefault(partition, []).append(batch)
+        self.buffered[partition] = self.buffered.get(partition, 0) + batch.num_rows
+        if self.buffered[partition] >= self.row_group_size:
+            self.flush(partition)
+
+    def flush(self, partition: str | None):
+        table = self.pa.Table.from_batches(
+            self.buffers.pop(partition), schema=self.schema
+        ).combine_chunks()
+        del self.buffered[partition]
+        if partition not in self.writers:
+            self.writers[partition] = self.open(partition)
+        writer = self.writers[partition]
+        if self.format == "parquet":
+            writer.write_table(table, row_group_size=table.num_rows)
+        else:
+            writer.write_table(table, max_chunksize=table.num_rows)
+
+    def open(self, partition: str | None) -> Any:
+        directory = self.directory
+        if self.partition_by is not None:
+            value = DEFAULT_PARTITION
+            if partition is not None:
+                value = urllib.parse.quote(partition, safe="")
+            directory = os.path.join(directory, f"{self.partition_by}={value}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-0{FORMATS[self.format]}")
+
+        if self.format == "parquet":
+            return self.pa.parquet.ParquetWriter(
+                path, self.schema, compression=self.compression or "none"
+            )
+        return self.pa.ipc.new_file(
+            path,
+            self.schema,
+            options=self.pa.ipc.IpcWriteOptions(compression=self.compression),
+        )
+
+    def close(self):
+        for partition in list(self.buffers):
+            self.flush(partition)
+        for writer in self.writers.values():
+            writer.close()
+        if not self.writers:
+            # Leave an empty file, so that the dataset still has a schema.
+            self.open(None).close()
+
+
+def snapshot_file(
+    record_type: str,
+    source: Source,
+    outdir: str,
+    format: str = "parquet",
+    compression: str | None = "zstd",
+    partition_by: str | None = None,
+    states: dict[int, str] | None = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> int:
+    """Write one ULS file as a dataset in outdir/<table>. Returns the number of rows.
+
+    When partitioning by state, tables without a state column take the state of
+    their entity from states; for tables that have one, states is filled in."""
+
+    model = RECORD_TYPES[record_type]
+    names = model.get_field_names()
+    key = names.index("unique_system_identifier")
+    state = names.index("state") if "state" in names else None
+    if partition_by not in (None, "state"):
+        raise ValueError(f"can't partition by {partition_by}")
+    if partition_by == "state" and state is None and states is None:
+        raise ValueError(f"partitioning {record_type} by state needs entity states")
+
+    writer = DatasetWriter(
+        os.path.join(outdir, model.__tablename__),
+        arrow_schema(model),
+        format=format,
+        compression=compression,
+        partition_by=partition_by,
+    )
+    with open_source(source) as fd:
+        for columns in model.iter_column_batches(fd, batch_size=batch_size):
+            partitions: Sequence[str | None] = ()
+            if partition_by is not None and state is not None:
+                partitions = columns[state]
+                if states is not None:
+                    states.update(zip(columns[key], partitions))
+            elif partition_by is not None and states is not None:
+                partitions = [states.get(usi) for usi in columns[key]]
+            writer.write(columns, partitions)
+    writer.close()
+    return writer.count
+
+
+def _init_worker(states: dict[int, str] | None):
+    global _states
+    _states = states
+
+
+def _snapshot_file(record_type: str, source: Source, outdir: str, **kwargs: Any) -> int:
+    return snapshot_file(record_type, source, outdir, states=_states, **kwargs)
+
+
+def snapshot(
+    files: dict[str, Source],
+    outdir: str,
+    format: str = "parquet",
+    compression: str | None = "zstd",
+    partition_by: str | None = None,
+    jobs: int | None = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> dict[str, int]:
+    """Write files, a mapping of record type to source, as datasets under outdir.
+
+    Files are written in parallel by jobs processes. When partitioning by state the
+    EN file is written first, to learn the state of each entity. Returns the number
+    of rows written for each record type."""
+
+    options = dict(
+        format=format,
+        compression=compression,
+        partition_by=partition_by,
+        batch_size=batch_size,
+    )
+    counts: dict[str, int] = {}
+    states: dict[int, str] | None = None
+    if partition_by == "state":
+        if "EN" not in files:
+            raise ValueError("partitioning by state needs the EN file")
+        states = {}
+        counts["EN"] = snapshot_file(
+            "EN", files["EN"], outdir, states=states, **options
+        )
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        jobs or os.cpu_count() or 1,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(states,),
+    ) as pool:
+        futures = {
+            record_type: pool.submit(
+                _snapshot_file, record_type, source, outdir, **options
+            )
+            for record_type, source in files.items()
+            if record_type not in counts
+        }
+        for record_type, future in futures.items():
+            counts[record_type] = future.result()
+    return counts
+
+
+@click.command(context_settings={"auto_envvar_prefix": "FCC"})
+@click.option("--verbosity", "-v", count=True)
+@click.option("--output", "-o", "outdir", default="snapshot", type=click.Path())
+@click.option("--format", "-f", type=click.Choice(list(FORMATS)), default="parquet")
+@click.option(
+    "--compression",
+    "-c",
+    type=click.Choice(["zstd", "lz4", "none"]),
+    default="zstd",
+)
+@click.option("--partition-by", "-p", type=click.Choice(["state"]))
+@click.option("--jobs", "-j", type=int, help="Number of writer processes")
+@click.option("--batch-size", "-b", default=DEFAULT_BATCH_SIZE)
+@click.option(
+    "--table",
+    "-t",
+    "record_types",
+    multiple=True,
+    type=click.Choice(list(RECORD_TYPES)),
+    help="Only write these record types (default: all found in DATADIR)",
+)
+@click.argument("datadir", default="db", type=click.Path(exists=True))
+def main(
+    verbosity: int,
+    outdir: str,
+    format: str,
+    compression: str,
+    partition_by: str | None,
+    jobs: int | None,
+    batch_size: int,
+    record_types: tuple[str, ...],
+    datadir: str,
+):
+    logLevel = ["WARNING", "INFO", "DEBUG"][min(verbosity + 1, 2)]
+    logging.basicConfig(level=logLevel)
+
+    files = find_sources(datadir, list(record_types) or None)
+    start = time.time()
+    try:
+        counts = snapshot(
+            files,
+            outdir,
+            format=format,
+            compression=None if compression == "none" else compression,
+            partition_by=partition_by,
+            jobs=jobs,
+            batch_size=batch_size,
+        )
+    except ValueError as err:
+        raise click.UsageError(str(err))
+    for record_type, count in counts.items():
+        LOG.info(f"{RECORD_TYPES[record_type].__tablename__}: wrote {count} rows")
+    LOG.info(f"wrote {sum(counts.values())} rows in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Geohashes and distance calculations for spatial queries over geocoded entities."""
+
+import math
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Stored geohashes are about 5m across, which is finer than any query needs.
+GEOHASH_PRECISION = 9
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def geohash_encode(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        interval, coord = (lon_range, lon) if even else (lat_range, lat)
+        mid = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = value = 0
+    return "".join(chars)
+
+
+def geohash_cell_size(precision: int) -> tuple[float, float]:
+    """Return the (height, width) in degrees of geohash cells of the given precision."""
+
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180 / 2**lat_bits, 360 / 2**lon_bits
+
+
+def geohash_cover(
+    south: float, west: float, north: float, east: float, max_cells: int = 16
+) -> list[str]:
+    """Return geohash prefixes whose cells together cover a bounding box.
+
+    The longest prefixes that need no more than max_cells cells are used, so that
+    a query matching any of the prefixes reads as few rows outside the box as
+    possible. Boxes that cross the antimeridian must be split in two by the caller."""
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = geohash_cell_size(precision)
+        rows = range(
+            math.floor((south + 90) / height),
+            min(math.floor((north + 90) / height), round(180 / height) - 1) + 1,
+        )
+        cols = range(
+            math.floor((west + 180) / width),
+            min(math.floor((east + 180) / width), round(360 / width) - 1) + 1,
+        )
+        if len(rows) * len(cols) <= max_cells:
+            return [
+                geohash_encode(
+                    (row + 0.5) * height - 90, (col + 0.5) * width - 180, precision
+                )
+                for row in rows
+                for col in cols
+            ]
+
+    # Even single character cells are too many; every geohash matches.
+    return [""]
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Return the great circle distance between two points, in kilometers."""
+
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = (
+        math.sin(dphi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bbox_around(
+    lat: float, lon: float, radius_km: float
+) -> tuple[float, float, float, float]:
+    """Return (south, west, north, east) for a box containing a circle around a point.
+
+    If the box crosses the antimeridian, west is greater than east."""
+
+    angle = radius_km / EARTH_RADIUS_KM
+    dlat = math.degrees(angle)
+    south, north = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    if lat + dlat >= 90 or lat - dlat <= -90:
+        # The circle contains a pole.
+        return south, -180.0, north, 180.0
+
+    dlon = math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(lat))))
+    west, east = lon - dlon, lon + dlon
+    if west < -180:
+        west += 360
+    if east > 180:
+        east -= 360
+    return south, west, north, east
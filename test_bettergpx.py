@@ -1,6 +1,14 @@
+import datetime
+import gzip
+import io
+import math
+
+import pydantic
 import pytest
 import bettergpx
 
+from lxml import etree
+
 
 @pytest.fixture
 def ex_waypoint() -> bettergpx.Waypoint:
@@ -111,3 +119,131 @@ def test_bounds(ex_bounds: bettergpx.Bounds):
         ex_bounds.to_xml(skip_empty=True)
         == b'<bounds minlat="42.37" minlon="-71.14" maxlat="42.38" maxlon="-71.15"/>'
     )
+
+
+@pytest.mark.parametrize("pretty_print", [False, True])
+def test_gpx_writer(
+    pretty_print: bool,
+    ex_metadata: bettergpx.Metadata,
+    ex_waypoint: bettergpx.Waypoint,
+    ex_route: bettergpx.Route,
+    ex_track: bettergpx.Track,
+):
+    named = bettergpx.Waypoint(
+        lat=1, lon=2, name="K1ABC & co", link=bettergpx.Link(href="https://x")
+    )
+    gpx = bettergpx.GpxFile(
+        metadata=ex_metadata,
+        waypoints=[ex_waypoint, named],
+        routes=[ex_route],
+        tracks=[ex_track],
+    )
+
+    buf = io.BytesIO()
+    with bettergpx.GpxWriter(
+        buf, metadata=ex_metadata, pretty_print=pretty_print
+    ) as writer:
+        for item in [ex_waypoint, named, ex_route, ex_track]:
+            writer.write(item)
+
+    assert buf.getvalue() == gpx.to_xml(skip_empty=True, pretty_print=pretty_print)
+
+
+def test_gpx_writer_empty():
+    buf = io.BytesIO()
+    bettergpx.GpxWriter(buf).close()
+    assert etree.fromstring(buf.getvalue()).tag == (
+        "{http://www.topografix.com/GPX/1/1}gpx"
+    )
+
+
+def test_gpx_writer_gzip(ex_waypoint: bettergpx.Waypoint):
+    buf = io.BytesIO()
+    with bettergpx.GpxWriter(buf, compress=True) as writer:
+        writer.write(ex_waypoint)
+    assert gzip.decompress(buf.getvalue()) == bettergpx.GpxFile(
+        waypoints=[ex_waypoint]
+    ).to_xml(skip_empty=True)
+
+
+def test_gpx_writer_order(ex_route: bettergpx.Route, ex_waypoint: bettergpx.Waypoint):
+    with bettergpx.GpxWriter(io.BytesIO()) as writer:
+        writer.write(ex_route)
+        with pytest.raises(ValueError):
+            writer.write(ex_waypoint)
+
+
+def test_gpx_writer_error(ex_waypoint: bettergpx.Waypoint):
+    buf = io.BytesIO()
+    with pytest.raises(RuntimeError):
+        with bettergpx.GpxWriter(buf) as writer:
+            writer.write(ex_waypoint)
+            raise RuntimeError("export failed")
+    assert b"</gpx>" not in buf.getvalue()
+    with pytest.raises(etree.XMLSyntaxError):
+        etree.fromstring(buf.getvalue())
+
+
+@pytest.fixture
+def ex_track_xml() -> bytes:
+    return (
+        b'<gpx xmlns="http://www.topografix.com/GPX/1/1" version="1.1">'
+        b'<wpt lat="42.39" lon="-71.18"><ele>12.5</ele><name>K1ABC</name>'
+        b'<sat>4</sat><link href="https://example.com"><text>site</text></link>'
+        b"<extensions><foo>bar</foo></extensions></wpt>"
+        b"<trk><name>field day</name>"
+        b'<trkseg><trkpt lat="42.0" lon="-71.0"><ele>10</ele>'
+        b"<time>2024-06-22T18:00:00Z</time></trkpt>"
+        b'<trkpt lat="42.1" lon="-71.1"/></trkseg>'
+        b'<trkseg><trkpt lat="43.0" lon="-72.0"/></trkseg>'
+        b"</trk></gpx>"
+    )
+
+
+def test_iter_points(ex_track_xml: bytes):
+    (wpt,) = bettergpx.iter_points(io.BytesIO(ex_track_xml))
+    assert wpt == bettergpx.Waypoint(
+        lat=42.39,
+        lon=-71.18,
+        ele=12.5,
+        name="K1ABC",
+        sat=4,
+        link=bettergpx.Link(href="https://example.com", text="site"),
+    )
+
+    trkpts = list(bettergpx.iter_points(io.BytesIO(ex_track_xml), "trkpt"))
+    assert [(p.lat, p.lon) for p in trkpts] == [
+        (42.0, -71.0),
+        (42.1, -71.1),
+        (43.0, -72.0),
+    ]
+    assert trkpts[0].time == datetime.datetime(2024, 6, 22, 18, tzinfo=datetime.UTC)
+
+
+def test_iter_points_invalid():
+    xml = b'<gpx><wpt lat="north" lon="-71.18"/></gpx>'
+    with pytest.raises(pydantic.ValidationError):
+        list(bettergpx.iter_points(io.BytesIO(xml)))
+
+
+@pytest.mark.parametrize("validate", [False, True])
+def test_iter_track_segments(ex_track_xml: bytes, validate: bool):
+    segments = list(
+        bettergpx.iter_track_segments(io.BytesIO(ex_track_xml), validate=validate)
+    )
+    assert len(segments) == 2
+    assert list(segments[0].lat) == [42.0, 42.1]
+    assert list(segments[0].lon) == [-71.0, -71.1]
+    assert segments[0].ele[0] == 10 and math.isnan(segments[0].ele[1])
+    assert (
+        segments[0].time[0]
+        == datetime.datetime(2024, 6, 22, 18, tzinfo=datetime.UTC).timestamp()
+    )
+    assert list(segments[1].lat) == [43.0]
+
+
+def test_iter_track_segments_validate():
+    xml = b'<gpx><trk><trkseg><trkpt lat="1" lon="2"><sat>-1</sat></trkpt></trkseg></trk></gpx>'
+    assert len(next(bettergpx.iter_track_segments(io.BytesIO(xml))).lat) == 1
+    with pytest.raises(pydantic.ValidationError):
+        list(bettergpx.iter_track_segments(io.BytesIO(xml), validate=True))
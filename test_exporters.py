@@ -0,0 +1,86 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+import bettergpx
+import exporters
+
+FIELDS = {"call_sign": str, "unique_system_identifier": int}
+
+
+@pytest.fixture
+def ex_rows() -> list[exporters.ExportRow]:
+    return [
+        exporters.ExportRow(
+            lat=42.39,
+            lon=-71.18,
+            name="Alice Example [E] K1ABC",
+            desc="64 Livermore Rd, Belmont, MA 02478",
+            properties={"call_sign": "K1ABC", "unique_system_identifier": 1},
+        ),
+        exporters.ExportRow(
+            lat=42.37,
+            lon=-71.11,
+            name='Bob "Example", Jr.',
+            desc="",
+            properties={"call_sign": None, "unique_system_identifier": 2},
+        ),
+    ]
+
+
+def export(name: str, rows: list[exporters.ExportRow], **kwargs) -> bytes:
+    buf = io.BytesIO()
+    with exporters.EXPORTERS[name](buf, FIELDS, **kwargs) as exporter:
+        exporter.write(rows[:1])
+        exporter.write(rows[1:])
+    assert exporter.count == len(rows)
+    return buf.getvalue()
+
+
+def test_gpx_exporter(ex_rows):
+    points = list(bettergpx.iter_points(io.BytesIO(export("gpx", ex_rows))))
+    assert [(p.lat, p.lon, p.name) for p in points] == [
+        (row.lat, row.lon, row.name) for row in ex_rows
+    ]
+
+
+def test_gpx_exporter_error(ex_rows):
+    buf = io.BytesIO()
+    with pytest.raises(RuntimeError):
+        with exporters.GpxExporter(buf, FIELDS) as exporter:
+            exporter.write(ex_rows)
+            raise RuntimeError("export failed")
+    assert b"</gpx>" not in buf.getvalue()
+
+
+def test_geojsonseq_exporter(ex_rows):
+    features = [json.loads(line) for line in export("geojsonseq", ex_rows).splitlines()]
+    assert features[0]["geometry"] == {"type": "Point", "coordinates": [-71.18, 42.39]}
+    assert features[0]["properties"]["call_sign"] == "K1ABC"
+    assert features[1]["properties"]["name"] == 'Bob "Example", Jr.'
+
+
+def test_csv_exporter(ex_rows):
+    data = gzip.decompress(export("csv", ex_rows, compress=True))
+    rows = list(csv.DictReader(io.StringIO(data.decode())))
+    assert list(rows[0]) == ["lat", "lon", "name", "desc", *FIELDS]
+    assert rows[1]["name"] == 'Bob "Example", Jr.'
+    assert rows[1]["unique_system_identifier"] == "2"
+
+
+def test_parquet_exporter(ex_rows):
+    pq = pytest.importorskip("pyarrow.parquet")
+    table = pq.read_table(io.BytesIO(export("parquet", ex_rows)))
+    assert table.column("call_sign").to_pylist() == ["K1ABC", None]
+    assert json.loads(table.schema.metadata[b"geo"])["primary_column"] == "geometry"
+
+
+def test_exporter_is_abstract():
+    class Incomplete(exporters.Exporter):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete(io.BytesIO(), FIELDS)
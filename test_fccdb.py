@@ -0,0 +1,220 @@
+import csv
+import datetime
+import io
+import random
+
+import pytest
+
+from sqlalchemy import create_engine
+from sqlalchemy import Date
+from sqlalchemy import Float
+from sqlalchemy import Integer
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import fccdb
+import ulsschema
+
+
+@pytest.fixture
+def ex_entity_lines() -> list[str]:
+    return [
+        "EN|1|||K1ABC|L|L00000001|Alice Example|Alice|Q|Example|||||64 Livermore Road|Belmont|MA|02478|||000|0000000001|I||A|04/15/2020|||\r\n",
+        "EN|2|||W1XYZ|L|L00000002|Bob Example|Bob||Example|Jr||||12 Main St\r\r\n",
+        "|Arlington|MA|02474|||000|0000000002|I|||||3|K1ABC\r\n",
+    ]
+
+
+@pytest.fixture
+def ex_history_lines() -> list[str]:
+    return [
+        "HS|1||K1ABC|01/02/2010|LIISS\r\n",
+        "HS|1||K1ABC|01/02/2020|LIREN\r\n",
+    ]
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    fccdb.Base.metadata.create_all(engine)
+    return engine
+
+
+def table_rows(engine, model) -> list[tuple]:
+    with Session(engine) as session:
+        return [tuple(row) for row in session.execute(select(model.__table__))]
+
+
+def legacy_read_records(data):
+    """The csv-based reader that read_uls_records replaced."""
+
+    def line_combiner(data):
+        vline = []
+        for line in data:
+            line = line.removesuffix("\r\n")
+            vline.append(line.replace("\r", " "))
+            if line.endswith("\r"):
+                continue
+            yield "".join(vline)
+            vline = []
+
+    return [
+        record for record in csv.reader(line_combiner(data), dialect="uls") if record
+    ]
+
+
+def uls_file(text: str) -> io.TextIOWrapper:
+    return io.TextIOWrapper(io.BytesIO(text.encode()), newline="\r\n")
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_read_uls_records_matches_legacy(seed: int):
+    rng = random.Random(seed)
+    text = "".join(
+        rng.choice(["a", "b", "|", "|", " ", '"', "\r", "\r\n", "\r\n"])
+        for _ in range(rng.randint(0, 200))
+    )
+    expected = legacy_read_records(uls_file(text))
+
+    # split the input into arbitrary chunks to exercise chunk boundaries
+    cuts = sorted(rng.sample(range(len(text) + 1), min(len(text) + 1, 10)))
+    chunks = [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+    assert list(fccdb.read_uls_records(chunks)) == expected
+    assert list(fccdb.read_uls_records(uls_file(text), chunk_size=7)) == expected
+
+
+def test_iter_rows(ex_entity_lines: list[str]):
+    rows = list(fccdb.Entity.iter_rows(ex_entity_lines))
+    assert len(rows) == 2
+    assert rows[0][1] == 1
+    assert rows[0][26] == datetime.date(2020, 4, 15)
+    assert rows[1][15] == "12 Main St "
+    assert rows[1][16] == "Arlington"
+    assert rows[1][28] == 3
+
+
+@pytest.mark.parametrize(
+    "model,lines", [("Entity", "ex_entity_lines"), ("History", "ex_history_lines")]
+)
+def test_bulk_matches_orm(request, model: str, lines: str):
+    cls = getattr(fccdb, model)
+    data = request.getfixturevalue(lines)
+
+    orm_engine = create_engine("sqlite://")
+    bulk_engine = create_engine("sqlite://")
+    for engine in (orm_engine, bulk_engine):
+        fccdb.Base.metadata.create_all(engine)
+
+    with Session(orm_engine) as session, session.begin():
+        cls.import_csv(data, session)
+    with Session(bulk_engine) as session, session.begin():
+        assert cls.bulk_import_csv(data, session, batch_size=1) == len(
+            list(cls.read_records(data))
+        )
+
+    assert table_rows(orm_engine, cls) == table_rows(bulk_engine, cls)
+
+
+def test_bulk_rejects_extra_fields():
+    with pytest.raises(ValueError):
+        list(fccdb.History.iter_rows(["HS|1||K1ABC|01/02/2010|LIISS|extra\r\n"]))
+
+
+@pytest.mark.parametrize("value", ["13/01/2020", "01/02", "not a date"])
+def test_invalid_dates(value: str):
+    with pytest.raises(ValueError):
+        fccdb.History(log_date=value)
+    with pytest.raises(ValueError):
+        list(fccdb.History.iter_rows([f"HS|1||K1ABC|{value}|LIISS\r\n"]))
+
+
+def test_model_attribute_coercion():
+    entity = fccdb.Entity(unique_system_identifier="12", status_date="04/15/2020")
+    assert entity.unique_system_identifier == 12
+    assert entity.status_date == datetime.date(2020, 4, 15)
+    entity.linked_unique_system_identifier = ""
+    assert entity.linked_unique_system_identifier is None
+
+
+def test_refresh_license_status(engine, ex_entity_lines, ex_history_lines):
+    with Session(engine) as session, session.begin():
+        fccdb.Entity.bulk_import_csv(ex_entity_lines, session)
+        fccdb.History.bulk_import_csv(ex_history_lines, session)
+        fccdb.Amateur.bulk_import_csv(["AM|1|||K1ABC|E\r\n"], session)
+        fccdb.refresh_license_status(session.connection())
+
+    with Session(engine) as session:
+        status = {
+            s.unique_system_identifier: s
+            for s in session.scalars(select(fccdb.LicenseStatus))
+        }
+        assert status[1].last_code == "LIREN"
+        assert status[1].last_log_date == datetime.date(2020, 1, 2)
+        assert status[1].operator_class == "E"
+        assert status[1].is_active
+        assert status[2].last_code is None
+        assert status[2].is_active
+
+    with Session(engine) as session, session.begin():
+        fccdb.History.bulk_import_csv(["HS|1||K1ABC|01/02/2024|LIEXP\r\n"], session)
+        fccdb.refresh_license_status(session.connection(), [1])
+
+    with Session(engine) as session:
+        status = session.get(fccdb.LicenseStatus, 1)
+        assert status.last_code == "LIEXP"
+        assert not status.is_active
+        assert session.get(fccdb.LicenseStatus, 2) is not None
+
+
+def test_hand_written_models_match_schema():
+    tables = ulsschema.load_tables()
+    for record_type in ["EN", "AM", "HS", "HD", "CO", "LA", "SC", "SF"]:
+        model = fccdb.RECORD_TYPES[record_type]
+        assert len(model.get_field_names()) == len(tables[record_type].columns)
+
+
+def test_generated_model(engine):
+    model = fccdb.RECORD_TYPES["FR"]
+    assert model.__tablename__ == "frequency"
+    columns = model.__table__.c
+    assert isinstance(columns.frequency_assigned.type, Float)
+    assert isinstance(columns.location_number.type, Integer)
+    assert isinstance(columns.status_date.type, Date)
+    assert columns.unique_system_identifier.index
+
+    names = model.get_field_names()
+    values = dict.fromkeys(names, "") | {
+        "record_type": "FR",
+        "unique_system_identifier": "1",
+        "frequency_assigned": "146.52000000",
+        "power_output": "50.000",
+        "status_date": "01/02/2020",
+    }
+    line = "|".join(values.values()) + "\r\n"
+    with Session(engine) as session, session.begin():
+        assert model.bulk_import_csv([line], session) == 1
+    [row] = table_rows(engine, model)
+    assert row[names.index("frequency_assigned")] == 146.52
+    assert row[names.index("power_output")] == 50.0
+    assert row[names.index("status_date")] == datetime.date(2020, 1, 2)
+
+
+def test_parse_schema():
+    tables = ulsschema.parse_schema("""create table dbo.PUBACC_XX
+(
+      record_type               char(2)              not null,
+      unique_system_identifier  numeric(9,0)         not null,
+      callsign                  char(10)             null,
+      power                     numeric(15,3)        null  /* watts */
+)
+go
+""")
+    assert tables == {
+        "XX": [
+            ulsschema.ColumnSpec("record_type", "char", 2, None, False),
+            ulsschema.ColumnSpec("unique_system_identifier", "numeric", 9, 0, False),
+            ulsschema.ColumnSpec("call_sign", "char", 10, None, True),
+            ulsschema.ColumnSpec("power", "numeric", 15, 3, True),
+        ]
+    }
+    assert ulsschema.table_name("FRC [Restricted & Commercial Operator]") == "frc"
@@ -0,0 +1,75 @@
+import io
+
+import pytest
+
+import geoindex
+
+OPENADDRESSES_CSV = """\
+LON,LAT,NUMBER,STREET,UNIT,CITY,DISTRICT,REGION,POSTCODE,ID,HASH
+-71.1801,42.3903,64,Livermore Road,,Belmont,,MA,02478,,a1
+-71.1790,42.3950,12,North Street,,Belmont,,MA,02478-1234,,a2
+-71.1700,42.3800,,Concord Avenue,,Belmont,,MA,02478,,a3
+-71.1600,42.3700,5,Main Street,,Belmont,,MA,,,a4
+"""
+
+# The Census gazetteer is tab separated, with trailing whitespace in the last header.
+ZCTA_GAZETTEER = """\
+GEOID\tALAND\tAWATER\tALAND_SQMI\tAWATER_SQMI\tINTPTLAT\tINTPTLONG                 
+02478\t12053216\t264318\t4.654\t0.102\t42.391248\t-71.180108                 
+02474\t14240187\t463281\t5.498\t0.179\t42.420263\t-71.156256                 
+"""
+
+
+@pytest.fixture
+def ex_index(tmp_path):
+    index = geoindex.GeoIndex(str(tmp_path / "geo.db"))
+    index.load_openaddresses(io.StringIO(OPENADDRESSES_CSV))
+    index.load_zip_centroids(io.StringIO(ZCTA_GAZETTEER))
+    yield index
+    index.close()
+
+
+@pytest.mark.parametrize(
+    "address,expected",
+    [
+        ("64 Livermore Road, Belmont, MA 02478", "64 LIVERMORE RD|02478"),
+        ("64 Livermore Rd., Waverley, MA 02478-1234", "64 LIVERMORE RD|02478"),
+        ("64 Livermore Road, Belmont, MA", None),
+        ("02478", None),
+    ],
+)
+def test_address_key(address: str, expected: str | None):
+    assert geoindex.address_key(address) == expected
+
+
+def test_load_openaddresses(tmp_path):
+    index = geoindex.GeoIndex(str(tmp_path / "geo.db"))
+    # Rows without a house number or postcode are skipped.
+    assert index.load_openaddresses(io.StringIO(OPENADDRESSES_CSV)) == 2
+
+
+def test_lookup(ex_index):
+    assert ex_index.lookup("64 LIVERMORE RD, BELMONT, MA 02478") == (42.3903, -71.1801)
+    assert ex_index.lookup("12 N St, Belmont, MA 02478") == (42.395, -71.179)
+    assert ex_index.lookup("1 Nowhere Ln, Belmont, MA 02478") is None
+    assert ex_index.lookup("1 Nowhere Ln, Belmont, MA 02478", "zip") == (
+        42.391248,
+        -71.180108,
+    )
+    assert ex_index.lookup("1 Nowhere Ln, Belmont, MA 99999", "zip") is None
+
+
+def test_index_persists(tmp_path, ex_index):
+    index = geoindex.GeoIndex(ex_index.path)
+    assert index.lookup("12 N St, Belmont, MA 02478") == (42.395, -71.179)
+
+
+def test_load_zip_centroids_csv(tmp_path):
+    index = geoindex.GeoIndex(str(tmp_path / "geo.db"))
+    assert (
+        index.load_zip_centroids(io.StringIO("zip,lat,lng\n2478,42.39,-71.18\n")) == 1
+    )
+    assert index.lookup("Belmont, MA 02478", "zip") == (42.39, -71.18)
+
+    with pytest.raises(ValueError):
+        index.load_zip_centroids(io.StringIO("zip,x,y\n02478,1,2\n"))
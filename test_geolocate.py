@@ -0,0 +1,528 @@
+import asyncio
+import csv
+import datetime
+import http.server
+import json
+import socket
+import threading
+import time
+
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from click.testing import CliRunner
+
+from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import fccdb
+import geoindex
+import geolocate
+import spatial
+
+
+@pytest.fixture
+def ex_session():
+    engine = create_engine("sqlite://")
+    fccdb.Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(
+            [
+                fccdb.Entity(
+                    record_type="EN",
+                    unique_system_identifier=1,
+                    call_sign="K1ABC",
+                    first_name="Alice",
+                    last_name="Example",
+                    street_address="64 Livermore Road",
+                    city="Belmont",
+                    state="MA",
+                    zip_code="02478",
+                ),
+                fccdb.Entity(
+                    record_type="EN",
+                    unique_system_identifier=2,
+                    call_sign="W1XYZ",
+                    zip_code="024781234",
+                ),
+                fccdb.Entity(
+                    record_type="EN",
+                    unique_system_identifier=3,
+                    call_sign="N1OTH",
+                    zip_code="02474",
+                ),
+                fccdb.Amateur(
+                    record_type="AM",
+                    unique_system_identifier=1,
+                    call_sign="K1ABC",
+                    operator_class="E",
+                ),
+                fccdb.History(
+                    record_type="HS",
+                    unique_system_identifier=1,
+                    log_date=datetime.date(2010, 1, 2),
+                    code="LIISS",
+                ),
+                fccdb.History(
+                    record_type="HS",
+                    unique_system_identifier=1,
+                    log_date=datetime.date(2020, 1, 2),
+                    code="LIEXP",
+                ),
+                fccdb.History(
+                    record_type="HS",
+                    unique_system_identifier=1,
+                    log_date=datetime.date(2015, 1, 2),
+                    code="LIREN",
+                ),
+            ]
+        )
+        session.flush()
+        fccdb.refresh_license_status(session.connection())
+        session.commit()
+        yield session
+
+
+def test_export_query(ex_session: Session):
+    statements = []
+    event.listen(
+        ex_session.get_bind(),
+        "before_cursor_execute",
+        lambda *args: statements.append(args[2]),
+    )
+
+    rows = ex_session.execute(
+        geolocate.export_query(fccdb.Entity.zip_code.startswith("02478"))
+    ).all()
+
+    assert len(statements) == 1
+    by_usi = {row[0].unique_system_identifier: row for row in rows}
+    assert set(by_usi) == {1, 2}
+    assert by_usi[1][1].operator_class == "E"
+    assert by_usi[1][2] == "LIEXP"
+    assert by_usi[2][1] is None
+    assert by_usi[2][2] is None
+
+
+class StubGeocodeHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        address = parse_qs(urlparse(self.path).query)["q"][0].lower()
+        self.server.requests.append(address)
+        if "flaky" in address and self.server.requests.count(address) == 1:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if "stalled" in address:
+            # Longer than the test locators' timeout
+            time.sleep(1)
+            return
+        if "missing" in address:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        result = {
+            "place_id": 1,
+            "licence": "test",
+            "boundingbox": ["0", "0", "0", "0"],
+            "lat": "42.38",
+            "lon": "-71.16",
+            "display_name": address,
+            "class": "building",
+            "type": "yes",
+            "importance": 0.5,
+        }
+        if "nowhere" in address:
+            results = []
+        elif "ambiguous" in address:
+            results = [result, result]
+        else:
+            results = [result]
+        body = json.dumps(results).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def geocode_server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubGeocodeHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def ex_locator(tmp_path, geocode_server):
+    host, port = geocode_server.server_address
+    return geolocate.Locator(
+        "testkey",
+        cachepath=str(tmp_path / "cache"),
+        rate=20,
+        geocode_url=f"http://{host}:{port}/search?q={{address}}&api_key={{api_key}}",
+    )
+
+
+def test_locate_many(ex_locator, geocode_server):
+    ex_locator.locate("1 Cached St")
+    results = ex_locator.locate_many(
+        ["1 Cached St", "2 Main St", "2 Main St", "3 nowhere", "4 ambiguous"]
+    )
+
+    assert results["1 Cached St"] == geolocate.Location(lat=42.38, lon=-71.16)
+    assert results["2 Main St"] == geolocate.Location(lat=42.38, lon=-71.16)
+    assert isinstance(results["3 nowhere"], ValueError)
+    assert isinstance(results["4 ambiguous"], ValueError)
+    assert sorted(geocode_server.requests) == [
+        "1 cached st",
+        "2 main st",
+        "3 nowhere",
+        "4 ambiguous",
+    ]
+
+
+def test_locate_many_http_error(ex_locator, geocode_server):
+    results = ex_locator.locate_many(["2 Main St", "5 missing"])
+    assert results["2 Main St"] == geolocate.Location(lat=42.38, lon=-71.16)
+    assert str(results["5 missing"]) == "5 missing: HTTP 404"
+    # Failed requests aren't cached.
+    with pytest.raises(ValueError):
+        ex_locator.locate("5 missing")
+    assert geocode_server.requests.count("5 missing") == 2
+
+
+def test_locate_many_timeout(ex_locator, geocode_server):
+    ex_locator.timeout = 0.2
+    ex_locator.retries = 1
+    ex_locator.retry_backoff = 0.01
+    results = ex_locator.locate_many(["2 Main St", "6 stalled"])
+    assert results["2 Main St"] == geolocate.Location(lat=42.38, lon=-71.16)
+    assert isinstance(results["6 stalled"], ValueError)
+    assert geocode_server.requests.count("6 stalled") == 2
+
+
+@pytest.mark.parametrize(
+    "address,expected",
+    [
+        (
+            "64 Livermore Road, Belmont, MA 02478",
+            "64 LIVERMORE RD, BELMONT, MA 02478",
+        ),
+        (
+            "  64  livermore rd.,belmont ,  ma 024781234",
+            "64 LIVERMORE RD, BELMONT, MA 02478",
+        ),
+        (
+            "12 North Street, North Andover, MA 01845-1234",
+            "12 N ST, NORTH ANDOVER, MA 01845",
+        ),
+    ],
+)
+def test_normalize_address(address: str, expected: str):
+    assert geolocate.normalize_address(address) == expected
+
+
+def test_locate_normalizes_cache_key(ex_locator, geocode_server):
+    ex_locator.locate("64 Livermore Road, Belmont, MA 02478")
+    ex_locator.locate("64 LIVERMORE RD, Belmont, MA 024781234")
+    assert len(geocode_server.requests) == 1
+
+
+def test_negative_cache(ex_locator, geocode_server):
+    ex_locator.negative_ttl = 0.2
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            ex_locator.locate("3 nowhere")
+    assert len(geocode_server.requests) == 1
+
+    time.sleep(0.3)
+    with pytest.raises(ValueError):
+        ex_locator.locate("3 nowhere")
+    assert len(geocode_server.requests) == 2
+
+
+def test_migrate_cache(ex_locator, geocode_server):
+    loc = geolocate.Location(lat=1, lon=2)
+    ex_locator.cache["64 Livermore Road, Belmont, MA 02478"] = loc
+    assert ex_locator.migrate_cache() == 1
+    assert ex_locator.migrate_cache() == 0
+    assert ex_locator.locate("64 Livermore Rd, Belmont, MA 02478") == loc
+    assert geocode_server.requests == []
+
+
+def test_locate_many_rate_limit(ex_locator, geocode_server):
+    start = time.monotonic()
+    ex_locator.locate_many([f"{i} Main St" for i in range(6)])
+    elapsed = time.monotonic() - start
+
+    # one request is allowed immediately, the rest are spaced 1/20s apart
+    assert len(geocode_server.requests) == 6
+    assert 0.25 - 0.02 < elapsed < 1
+
+
+def test_token_bucket():
+    bucket = geolocate.TokenBucket(rate=10)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+
+
+@pytest.fixture
+def ex_async_locator(tmp_path, geocode_server):
+    host, port = geocode_server.server_address
+    return geolocate.AsyncLocator(
+        "testkey",
+        cachepath=str(tmp_path / "cache"),
+        rate=50,
+        retry_backoff=0.01,
+        geocode_url=f"http://{host}:{port}/search?q={{address}}&api_key={{api_key}}",
+    )
+
+
+def test_async_locate_coalesces_requests(ex_async_locator, geocode_server):
+    async def locate_concurrently():
+        return await asyncio.gather(
+            *(ex_async_locator.locate("2 Main St") for _ in range(5))
+        )
+
+    results = asyncio.run(locate_concurrently())
+    assert all(loc == results[0] for loc in results)
+    assert geocode_server.requests == ["2 main st"]
+    assert ex_async_locator.cached("2 Main St") == results[0]
+
+
+def test_async_locate_retries(ex_async_locator, geocode_server):
+    loc = asyncio.run(ex_async_locator.locate("1 flaky St"))
+    assert loc == geolocate.Location(lat=42.38, lon=-71.16)
+    assert geocode_server.requests == ["1 flaky st", "1 flaky st"]
+
+
+def test_async_locate_many(ex_async_locator, geocode_server):
+    results = asyncio.run(
+        ex_async_locator.locate_many(
+            ["2 Main St", "3 nowhere", "2 Main St", "5 missing"]
+        )
+    )
+    assert results["2 Main St"] == geolocate.Location(lat=42.38, lon=-71.16)
+    assert isinstance(results["3 nowhere"], ValueError)
+    assert isinstance(results["5 missing"], ValueError)
+    assert sorted(geocode_server.requests) == ["2 main st", "3 nowhere", "5 missing"]
+
+
+def test_async_locate_connection_error(tmp_path):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        host, port = sock.getsockname()
+    locator = geolocate.AsyncLocator(
+        "testkey",
+        cachepath=str(tmp_path / "cache"),
+        rate=50,
+        retries=1,
+        retry_backoff=0.01,
+        geocode_url=f"http://{host}:{port}/search?q={{address}}&api_key={{api_key}}",
+    )
+    results = asyncio.run(locator.locate_many(["2 Main St"]))
+    assert isinstance(results["2 Main St"], ValueError)
+
+
+@pytest.fixture
+def ex_index(tmp_path):
+    index = geoindex.GeoIndex(str(tmp_path / "geo.db"))
+    index.add_address_points([("64 Livermore Road, Belmont, MA 02478", 42.39, -71.18)])
+    index.add_zip_centroids([("02478", 42.391, -71.180)])
+    yield index
+    index.close()
+
+
+def test_locate_local_index(ex_locator, ex_index, geocode_server):
+    ex_locator.index = ex_index
+    results = ex_locator.locate_many(
+        ["64 Livermore Rd, Belmont, MA 02478", "2 Main St, Belmont, MA 02478"]
+    )
+    assert results["64 Livermore Rd, Belmont, MA 02478"] == geolocate.Location(
+        lat=42.39, lon=-71.18
+    )
+    assert ex_locator.local_hits == 1
+    # Only addresses missing from the index go to the geocoding service.
+    assert geocode_server.requests == ["2 main st, belmont, ma 02478"]
+
+    ex_locator.precision = "zip"
+    assert ex_locator.locate("2 Main St, Belmont, MA 02478") == geolocate.Location(
+        lat=42.391, lon=-71.180
+    )
+
+
+def test_locate_offline(tmp_path, ex_index):
+    locator = geolocate.Locator(None, cachepath=str(tmp_path / "cache"), index=ex_index)
+    assert locator.locate("64 Livermore Road, Belmont, MA 02478").lat == 42.39
+    with pytest.raises(ValueError):
+        locator.locate("2 Main St, Belmont, MA 02478")
+
+    results = asyncio.run(
+        geolocate.AsyncLocator(
+            None, cachepath=str(tmp_path / "cache"), index=ex_index
+        ).locate_many(["2 Main St, Belmont, MA 02478"])
+    )
+    assert isinstance(results["2 Main St, Belmont, MA 02478"], ValueError)
+
+
+def test_locate_entities(ex_session, ex_locator, geocode_server):
+    conn = ex_session.connection()
+    entities = ex_session.scalars(
+        select(fccdb.Entity).order_by(fccdb.Entity.unique_system_identifier)
+    ).all()
+    results = ex_locator.locate_entities(conn, entities)
+    assert results[1] == geolocate.Location(lat=42.38, lon=-71.16)
+    assert len(geocode_server.requests) == 3
+
+    stored = ex_session.scalars(select(fccdb.Geocode)).all()
+    assert {g.unique_system_identifier for g in stored} == {1, 2, 3}
+    assert {g.source for g in stored} == {"geocoder"}
+
+    # A second locator (on another host, say) with an empty cache reuses the
+    # stored geocodes.
+    other = geolocate.Locator(None, cachepath=str(ex_locator.cache.directory) + "2")
+    assert other.locate_entities(conn, entities) == results
+    assert other.stored_hits == 3
+
+    # Moving an entity invalidates only its geocode.
+    entities[0].street_address = "1 New Street"
+    ex_session.flush()
+    assert fccdb.invalidate_geocodes(conn, [1, 2]) == 1
+    assert {
+        g.unique_system_identifier for g in ex_session.scalars(select(fccdb.Geocode))
+    } == {2, 3}
+    other.locate_entities(conn, entities)
+    assert other.stored_hits == 5
+
+
+@pytest.fixture
+def ex_located_session(ex_session):
+    # Entity 1 is in Belmont, 2 in Cambridge and 3 in New York.
+    for usi, lat, lon in [(1, 42.39, -71.18), (2, 42.37, -71.11), (3, 40.71, -74.0)]:
+        ex_session.add(
+            fccdb.Geocode(
+                unique_system_identifier=usi,
+                address_hash="x",
+                lat=lat,
+                lon=lon,
+                source="test",
+                geocoded_at=datetime.datetime.now(),
+            )
+        )
+    ex_session.flush()
+    return ex_session
+
+
+def test_within_bbox(ex_located_session):
+    entities = geolocate.within_bbox(ex_located_session, 42, -72, 43, -71)
+    assert sorted(e.unique_system_identifier for e in entities) == [1, 2]
+
+
+def test_within_radius(ex_located_session):
+    results = geolocate.within_radius(ex_located_session, 42.39, -71.18, 25)
+    assert [e.unique_system_identifier for e, _ in results] == [1, 2]
+    assert results[0][1] == pytest.approx(0)
+    assert results[1][1] == pytest.approx(6.2, abs=0.1)
+
+    results = geolocate.within_radius(
+        ex_located_session, 42.39, -71.18, 25, fccdb.LicenseStatus.is_active
+    )
+    assert [e.unique_system_identifier for e, _ in results] == [2]
+
+
+def test_within_radius_antimeridian(ex_located_session):
+    # Adak, Alaska, and a point across the antimeridian from it
+    for usi, lat, lon in [(1, 51.88, -176.66), (2, 52.9, 179.5)]:
+        geocode = ex_located_session.get(fccdb.Geocode, (usi, "x"))
+        geocode.lat, geocode.lon = lat, lon
+        geocode.geohash = spatial.geohash_encode(lat, lon)
+    ex_located_session.flush()
+    results = geolocate.within_radius(ex_located_session, 51.88, -176.66, 500)
+    assert [e.unique_system_identifier for e, _ in results] == [1, 2]
+
+
+def test_nearest(ex_located_session):
+    results = geolocate.nearest(ex_located_session, 41, -74, 2)
+    assert [e.unique_system_identifier for e, _ in results] == [3, 1]
+    assert len(geolocate.nearest(ex_located_session, 0, 0, 10)) == 3
+
+
+@pytest.mark.parametrize(
+    "filters,expected",
+    [
+        ({}, {1, 2, 3}),
+        ({"zip_codes": ["02478"]}, {1, 2}),
+        ({"zip_codes": ["0247"]}, {1, 2, 3}),
+        ({"zip_codes": ["02474", "99"]}, {3}),
+        ({"states": ["ma"], "cities": ["BELMONT"]}, {1}),
+        ({"operator_classes": ["e"]}, {1}),
+        ({"call_signs": ["w1xyz", "N1OTH"]}, {2, 3}),
+        ({"active_only": True}, {2, 3}),
+    ],
+)
+def test_export_filters(ex_session: Session, filters, expected):
+    rows = ex_session.execute(
+        geolocate.export_query(*geolocate.export_filters(**filters))
+    ).all()
+    assert {row[0].unique_system_identifier for row in rows} == expected
+
+
+def test_row_formatter(ex_session: Session):
+    formatter = geolocate.RowFormatter(
+        "{full_name} [{operator_class}] {call_sign}", "{address} {loc.lat:.1f}"
+    )
+    rows = ex_session.execute(
+        geolocate.export_query().order_by(fccdb.Entity.unique_system_identifier)
+    ).all()
+    loc = geolocate.Location(lat=42.39, lon=-71.18)
+    row = formatter.row(*rows[0], loc)
+    assert row.name == "Alice Example [E] K1ABC"
+    assert row.desc == "64 Livermore Road, Belmont, MA 02478 42.4"
+    assert row.properties["last_code"] == "LIEXP"
+    assert formatter.row(*rows[1], loc).name == " [] W1XYZ"
+
+    with pytest.raises(ValueError, match="unknown field"):
+        geolocate.RowFormatter("{nonesuch}", "")
+    for template in ["{}", "{0}", "{0.call_sign}"]:
+        with pytest.raises(ValueError, match="positional field"):
+            geolocate.RowFormatter(template, "")
+
+
+def test_main(tmp_path, ex_session: Session, ex_index):
+    dburi = f"sqlite:///{tmp_path}/fcc.db"
+    engine = create_engine(dburi)
+    fccdb.Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        for entity in ex_session.scalars(select(fccdb.Entity)):
+            session.merge(entity)
+        session.commit()
+
+    output = tmp_path / "out.csv"
+    result = CliRunner().invoke(
+        geolocate.main,
+        [
+            *("--dburi", dburi, "--index", ex_index.path, "--precision", "zip"),
+            *("--zip", "02478,02474", "--format", "csv", "-o", str(output)),
+            *("--batch-size", "1"),
+        ],
+        env={"HOME": str(tmp_path)},
+    )
+    assert result.exit_code == 0, result.output
+    rows = list(csv.DictReader(output.open()))
+    # 02474 isn't in the index, and there is no API key to fall back on
+    assert sorted(row["call_sign"] for row in rows) == ["K1ABC", "W1XYZ"]
+    # Geocodes are stored as each batch is located.
+    with Session(engine) as session:
+        assert len(session.scalars(select(fccdb.Geocode)).all()) == 2
@@ -0,0 +1,384 @@
+import datetime
+import multiprocessing
+import os
+import threading
+import time
+import zipfile
+import zlib
+
+import pytest
+
+from click.testing import CliRunner
+from concurrent.futures.process import BrokenProcessPool
+
+from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy import func
+from sqlalchemy import inspect
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+import fccdb
+import ingest
+import namesearch
+
+
+@pytest.fixture
+def ex_datadir(tmp_path):
+    with open(tmp_path / "EN.dat", "w", newline="") as fd:
+        for usi in range(1, 11):
+            fd.write(f"EN|{usi}|||K1A{usi:02d}|L||Licensee {usi}\r\n")
+    with open(tmp_path / "HS.dat", "w", newline="") as fd:
+        for usi in range(1, 11):
+            fd.write(f"HS|{usi}||K1A{usi:02d}|01/02/2010|LIISS\r\n")
+            fd.write(f"HS|{usi}||K1A{usi:02d}|01/02/2020|LIREN\r\n")
+    return tmp_path
+
+
+def test_load_order():
+    groups = ingest.load_order(["HS", "AM", "EN"])
+    assert groups == [["EN"], ["HS", "AM"]]
+
+
+def test_ingest_engine(tmp_path, ex_datadir):
+    engine = create_engine(f"sqlite:///{tmp_path}/fcc.db")
+    fccdb.Base.metadata.create_all(engine)
+    ingest.IngestEngine(engine, parsers=2, batch_size=3).load(
+        {rt: str(ex_datadir / f"{rt}.dat") for rt in ["HS", "EN"]}
+    )
+    with Session(engine) as session:
+        assert session.scalar(select(func.count()).select_from(fccdb.Entity)) == 10
+        assert session.scalar(select(func.count()).select_from(fccdb.History)) == 20
+
+
+@pytest.fixture
+def ex_daily(tmp_path):
+    daily = tmp_path / "daily"
+    daily.mkdir()
+    with open(daily / "EN.dat", "w", newline="") as fd:
+        fd.write("EN|1|||K1A01|L||Licensee 1\r\n")
+        fd.write("EN|2|||K1A02|L||Renamed Licensee\r\n")
+        fd.write("EN|11|||K1A11|L||Licensee 11\r\n")
+    with open(daily / "HS.dat", "w", newline="") as fd:
+        fd.write("HS|1||K1A01|01/02/2010|LIISS\r\n")
+        fd.write("HS|1||K1A01|01/02/2020|LIREN\r\n")
+        fd.write("HS|2||K1A02|01/02/2020|LIREN\r\n")
+        fd.write("HS|2||K1A02|03/04/2024|LIMOD\r\n")
+    return daily
+
+
+def test_apply_transactions(tmp_path, ex_datadir, ex_daily):
+    engine = create_engine(f"sqlite:///{tmp_path}/fcc.db")
+    fccdb.Base.metadata.create_all(engine)
+    ingest.IngestEngine(engine, parsers=1).load(
+        {rt: str(ex_datadir / f"{rt}.dat") for rt in ["HS", "EN"]}
+    )
+    with Session(engine) as session, session.begin():
+        for usi in [1, 2]:
+            session.add(
+                fccdb.Geocode(
+                    unique_system_identifier=usi,
+                    address_hash="stale",
+                    lat=0,
+                    lon=0,
+                    source="test",
+                    geocoded_at=datetime.datetime.now(),
+                )
+            )
+
+    assert ingest.apply_transactions(engine, str(ex_daily))
+    assert not ingest.apply_transactions(engine, str(ex_daily))
+
+    with Session(engine) as session:
+        assert session.scalar(select(func.count()).select_from(fccdb.Entity)) == 11
+        assert session.get(fccdb.Entity, 2).entity_name == "Renamed Licensee"
+        assert sorted(h.code for h in session.get(fccdb.Entity, 2).history) == [
+            "LIMOD",
+            "LIREN",
+        ]
+        assert len(session.get(fccdb.Entity, 1).history) == 2
+        assert session.get(fccdb.LicenseStatus, 2).last_code == "LIMOD"
+        assert session.get(fccdb.LicenseStatus, 11).is_active
+        [(entity, _)] = namesearch.search_names(session, "renamed", k=1)
+        assert entity.unique_system_identifier == 2
+        applied = session.scalars(select(fccdb.AppliedTransaction)).one()
+        # entity 1 is unchanged, so only entities 2 and 11 and the history of
+        # entity 2 are written
+        assert applied.rows_changed == 4
+        # only geocodes for changed entities are checked
+        assert [
+            g.unique_system_identifier for g in session.scalars(select(fccdb.Geocode))
+        ] == [1]
+
+
+def test_ingest_rebuilds_indexes(tmp_path, ex_datadir):
+    engine = create_engine(f"sqlite:///{tmp_path}/fcc.db")
+    fccdb.Base.metadata.create_all(engine)
+    ingest.IngestEngine(engine, parsers=1).load(
+        {rt: str(ex_datadir / f"{rt}.dat") for rt in ["HS", "EN"]}
+    )
+    indexes = {index["name"] for index in inspect(engine).get_indexes("entity")}
+    assert {"ix_entity_call_sign", "ix_entity_zip_code"} <= indexes
+
+
+def test_main_loads_generated_tables(tmp_path, ex_datadir):
+    model = fccdb.RECORD_TYPES["FR"]
+    with open(ex_datadir / "FR.dat", "w", newline="") as fd:
+        for usi in [1, 2]:
+            fd.write(f"FR|{usi}|||K1A{usi:02d}|A|1|1|FB||146.52\r\n")
+    assert ingest.load_order(["FR", "EN"]) == [["EN"], ["FR"]]
+
+    result = CliRunner().invoke(
+        ingest.main, ["-d", f"sqlite:///{tmp_path}/fcc.db", "-p", "1", str(ex_datadir)]
+    )
+    assert result.exit_code == 0, result.output
+
+    engine = create_engine(f"sqlite:///{tmp_path}/fcc.db")
+    with Session(engine) as session:
+        assert session.scalar(select(func.count()).select_from(fccdb.Entity)) == 10
+        assert session.scalars(select(model.frequency_assigned)).all() == [
+            146.52,
+            146.52,
+        ]
+
+
+def make_archive(path, datadir, names=("EN.dat", "HS.dat")):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name in names:
+            archive.write(datadir / name, name)
+    return str(path)
+
+
+def test_find_sources(tmp_path, ex_datadir):
+    assert ingest.find_sources(str(ex_datadir)) == {
+        rt: str(ex_datadir / f"{rt}.dat") for rt in ["EN", "HS"]
+    }
+    with zipfile.ZipFile(tmp_path / "l_amat.zip", "w") as archive:
+        archive.write(ex_datadir / "EN.dat", "l_amat/en.dat")
+        archive.writestr("counts", "")
+        archive.writestr("XX.dat", "")
+    sources = ingest.find_sources(str(tmp_path / "l_amat.zip"))
+    assert sources == {"EN": (str(tmp_path / "l_amat.zip"), "l_amat/en.dat")}
+    with ingest.open_source(sources["EN"]) as fd:
+        assert fd.readline() == "EN|1|||K1A01|L||Licensee 1\r\n"
+    data = (ex_datadir / "EN.dat").read_bytes()
+    assert ingest.source_fingerprint(sources["EN"]) == (
+        f"{len(data)}:{zlib.crc32(data):08x}"
+    )
+
+
+def test_main_no_files(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/fcc.db")
+    fccdb.Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        fccdb.drop_indexes(conn, [])
+    indexes = {index["name"] for index in inspect(engine).get_indexes("entity")}
+    assert "ix_entity_call_sign" in indexes
+
+    empty = tmp_path / "empty"
+    empty.mkdir()
+    result = CliRunner().invoke(
+        ingest.main, ["-d", f"sqlite:///{tmp_path}/fcc.db", str(empty)]
+    )
+    assert result.exit_code == 2
+    assert "no ULS files found" in result.output
+
+
+def test_main_loads_archive(tmp_path, ex_datadir):
+    archive = make_archive(tmp_path / "l_amat.zip", ex_datadir)
+    result = CliRunner().invoke(
+        ingest.main, ["-d", f"sqlite:///{tmp_path}/fcc.db", "-p", "2", archive]
+    )
+    assert result.exit_code == 0, result.output
+
+    engine = create_engine(f"sqlite:///{tmp_path}/fcc.db")
+    with Session(engine) as session:
+        assert session.scalar(select(func.count()).select_from(fccdb.Entity)) == 10
+        assert session.scalar(select(func.count()).select_from(fccdb.History)) == 20
+
+
+def test_apply_transactions_archive(tmp_path, ex_datadir, ex_daily):
+    engine = create_engine(f"sqlite:///{tmp_path}/fcc.db")
+    fccdb.Base.metadata.create_all(engine)
+    ingest.IngestEngine(engine, parsers=1).load(ingest.find_sources(str(ex_datadir)))
+
+    archive = make_archive(tmp_path / "l_am_mon.zip", ex_daily)
+    assert ingest.apply_transactions(engine, archive)
+    # The same files, extracted, have the same content hash.
+    assert not ingest.apply_transactions(engine, str(ex_daily))
+    with Session(engine) as session:
+        assert session.get(fccdb.Entity, 2).entity_name == "Renamed Licensee"
+
+
+def test_iter_pending_batches():
+    records = [[str(number)] for number in range(10)]
+    batches = [
+        (first, [int(record[0]) for record in batch])
+        for first, batch in ingest.iter_pending_batches(records, [(6, 2), (0, 3)], 2)
+    ]
+    assert batches == [(3, [3, 4]), (5, [5]), (8, [8, 9])]
+
+
+def fail_history_after(monkeypatch, batches):
+    write_batch = fccdb.History.write_batch
+    written = []
+
+    def fail_after(cls, conn, rows):
+        if len(written) == batches:
+            raise RuntimeError("connection lost")
+        write_batch(conn, rows)
+        written.append(rows)
+
+    monkeypatch.setattr(fccdb.History, "write_batch", classmethod(fail_after))
+
+
+def test_resume_load(tmp_path, ex_datadir, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path}/fcc.db")
+    fccdb.Base.metadata.create_all(engine)
+    files = ingest.find_sources(str(ex_datadir))
+    fail_history_after(monkeypatch, 2)
+    with pytest.raises(RuntimeError):
+        ingest.IngestEngine(engine, parsers=1, batch_size=4).load(files)
+    indexes = {index["name"] for index in inspect(engine).get_indexes("entity")}
+    assert "ix_entity_call_sign" in indexes
+    with Session(engine) as session:
+        checkpoints = session.scalars(
+            select(fccdb.IngestCheckpoint).where(
+                fccdb.IngestCheckpoint.record_type == "HS"
+            )
+        ).all()
+        assert [(c.first_record, c.rows) for c in checkpoints] == [(0, 4), (4, 4)]
+        assert session.scalar(select(func.count()).select_from(fccdb.History)) == 8
+
+    monkeypatch.undo()
+    # A different batch size doesn't matter; committed records are still skipped.
+    ingest.IngestEngine(engine, parsers=1, batch_size=5).load(files)
+    with Session(engine) as session:
+        assert session.scalar(select(func.count()).select_from(fccdb.Entity)) == 10
+        assert session.scalar(select(func.count()).select_from(fccdb.History)) == 20
+        assert session.scalars(select(fccdb.IngestCheckpoint)).all() == []
+
+
+def test_resume_changed_file(tmp_path, ex_datadir):
+    engine = create_engine(f"sqlite:///{tmp_path}/fcc.db")
+    fccdb.Base.metadata.create_all(engine)
+    with Session(engine) as session, session.begin():
+        session.add(
+            fccdb.IngestCheckpoint(
+                record_type="EN",
+                first_record=0,
+                fingerprint="0:0",
+                source="EN.dat",
+                rows=5,
+                committed_at=datetime.datetime.now(),
+            )
+        )
+    files = ingest.find_sources(str(ex_datadir))
+    with pytest.raises(ValueError):
+        ingest.IngestEngine(engine, parsers=1).load(files)
+    ingest.IngestEngine(engine, parsers=1).load(files, resume=False)
+    with Session(engine) as session:
+        assert session.scalar(select(func.count()).select_from(fccdb.Entity)) == 10
+
+
+def test_restart_load(tmp_path, ex_datadir, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path}/fcc.db")
+    fccdb.Base.metadata.create_all(engine)
+    files = ingest.find_sources(str(ex_datadir))
+    fail_history_after(monkeypatch, 2)
+    with pytest.raises(RuntimeError):
+        ingest.IngestEngine(engine, parsers=1, batch_size=4).load(files)
+    monkeypatch.undo()
+
+    ingest.IngestEngine(engine, parsers=1).load({"HS": files["HS"]}, resume=False)
+    with Session(engine) as session:
+        assert session.scalar(select(func.count()).select_from(fccdb.History)) == 20
+
+    ingest.IngestEngine(engine, parsers=1).load(files, resume=False)
+    with Session(engine) as session:
+        assert session.scalar(select(func.count()).select_from(fccdb.Entity)) == 10
+        assert session.scalar(select(func.count()).select_from(fccdb.History)) == 20
+        assert session.scalar(select(func.count()).select_from(fccdb.NameSearch)) == 10
+
+
+def test_parser_killed(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/fcc.db")
+    fccdb.Base.metadata.create_all(engine)
+    # The parser blocks opening the fifo until it is killed, like an OOM kill.
+    os.mkfifo(tmp_path / "EN.dat")
+    errors = []
+
+    def load():
+        try:
+            ingest.IngestEngine(engine, parsers=1).load(
+                {"EN": str(tmp_path / "EN.dat")}
+            )
+        except Exception as err:
+            errors.append(err)
+
+    thread = threading.Thread(target=load, daemon=True)
+    thread.start()
+    while not (children := multiprocessing.active_children()):
+        time.sleep(0.1)
+    time.sleep(0.5)
+    for child in children:
+        child.kill()
+    thread.join(30)
+    assert not thread.is_alive()
+    assert isinstance(errors[0], BrokenProcessPool)
+
+
+def test_load_twice(tmp_path, ex_datadir):
+    engine = create_engine(f"sqlite:///{tmp_path}/fcc.db")
+    fccdb.Base.metadata.create_all(engine)
+    files = ingest.find_sources(str(ex_datadir))
+    for _ in range(2):
+        ingest.IngestEngine(engine, parsers=1).load(files)
+    with Session(engine) as session:
+        assert session.scalar(select(func.count()).select_from(fccdb.Entity)) == 10
+        assert session.scalar(select(func.count()).select_from(fccdb.History)) == 20
+
+
+def test_apply_transactions_replaces_license(tmp_path, ex_datadir):
+    engine = create_engine(f"sqlite:///{tmp_path}/fcc.db")
+    fccdb.Base.metadata.create_all(engine)
+    ingest.IngestEngine(engine, parsers=1).load(ingest.find_sources(str(ex_datadir)))
+
+    # Entity 2 is sent again with no history, so its history is gone.
+    daily = tmp_path / "daily"
+    daily.mkdir()
+    (daily / "EN.dat").write_bytes(b"EN|2|||K1A02|L||Renamed Licensee\r\n")
+    (daily / "HS.dat").write_bytes(b"")
+    assert ingest.apply_transactions(engine, str(daily))
+
+    with Session(engine) as session:
+        assert session.get(fccdb.Entity, 2).history == []
+        assert len(session.get(fccdb.Entity, 1).history) == 2
+        assert session.get(fccdb.LicenseStatus, 2).last_code is None
+
+
+def test_writer_cannot_connect(tmp_path, ex_datadir):
+    engine = create_engine(f"sqlite:///{tmp_path}/fcc.db", poolclass=NullPool)
+    fccdb.Base.metadata.create_all(engine)
+
+    @event.listens_for(engine, "do_connect")
+    def refuse_writers(*args):
+        if threading.current_thread() is not thread:
+            raise RuntimeError("too many connections")
+
+    errors = []
+
+    def load():
+        try:
+            ingest.IngestEngine(engine, parsers=1, batch_size=1, queue_size=2).load(
+                ingest.find_sources(str(ex_datadir))
+            )
+        except Exception as err:
+            errors.append(err)
+
+    thread = threading.Thread(target=load, daemon=True)
+    thread.start()
+    thread.join(60)
+    assert not thread.is_alive()
+    assert "too many connections" in str(errors[0])
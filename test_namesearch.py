@@ -0,0 +1,100 @@
+import pytest
+
+from sqlalchemy import create_engine
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+import fccdb
+import namesearch
+
+
+@pytest.fixture
+def ex_session():
+    engine = create_engine("sqlite://")
+    fccdb.Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(
+            [
+                fccdb.Entity(
+                    record_type="EN",
+                    unique_system_identifier=1,
+                    call_sign="K1ABC",
+                    entity_name="Smith, Jonathan",
+                    first_name="Jonathan",
+                    last_name="Smith",
+                ),
+                fccdb.Entity(
+                    record_type="EN",
+                    unique_system_identifier=2,
+                    call_sign="W1XYZ",
+                    first_name="Jon",
+                    last_name="Smithson",
+                ),
+                fccdb.Entity(
+                    record_type="EN",
+                    unique_system_identifier=3,
+                    call_sign="W1AW",
+                    entity_name="Radio Club of Belmont",
+                ),
+                fccdb.Amateur(
+                    record_type="AM",
+                    unique_system_identifier=3,
+                    call_sign="W1AW",
+                    trustee_name="Alice Example",
+                ),
+            ]
+        )
+        session.flush()
+        fccdb.refresh_name_search(session.connection())
+        yield session
+
+
+def matches(session, value, k=10):
+    return [
+        (entity.unique_system_identifier, round(score, 2))
+        for entity, score in namesearch.search_names(session, value, k)
+    ]
+
+
+def test_trigrams():
+    assert namesearch.trigrams("Jo-Ann") == {
+        "  j",
+        " jo",
+        "jo ",
+        "  a",
+        " an",
+        "ann",
+        "nn ",
+    }
+
+
+def test_search_exact(ex_session):
+    assert matches(ex_session, "smith") == [(1, 1.0), (2, 0.83)]
+    assert matches(ex_session, "jonathan smith", k=1) == [(1, 1.0)]
+    # Each has one word whole and the other as part of a word.
+    assert matches(ex_session, "jon smith") == [(2, 0.9), (1, 0.9)]
+    assert matches(ex_session, "radio club") == [(3, 1.0)]
+    assert matches(ex_session, "alice") == [(3, 1.0)]
+    assert matches(ex_session, "nobody") == []
+
+
+def test_search_misspelled(ex_session):
+    [(usi, score)] = matches(ex_session, "Belmnot")
+    assert usi == 3 and 0 < score < 1
+    assert matches(ex_session, "smyth jonathon")[0][0] == 1
+
+
+def test_search_short(ex_session):
+    with pytest.raises(ValueError):
+        namesearch.search_names(ex_session, "Al B")
+
+
+def test_refresh_some(ex_session):
+    ex_session.execute(
+        update(fccdb.Entity)
+        .where(fccdb.Entity.unique_system_identifier == 2)
+        .values(last_name="Jones")
+    )
+    fccdb.refresh_name_search(ex_session.connection(), [2])
+    assert matches(ex_session, "smith") == [(1, 1.0)]
+    assert matches(ex_session, "jones")[0] == (2, 1.0)
@@ -0,0 +1,131 @@
+import http.client
+import json
+import threading
+import time
+
+import pytest
+
+from sqlalchemy import create_engine
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+import fccdb
+import query
+
+
+@pytest.fixture
+def dburi(tmp_path):
+    dburi = f"sqlite:///{tmp_path / 'fcc.db'}"
+    engine = create_engine(dburi)
+    fccdb.Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(
+            [
+                fccdb.Entity(
+                    record_type="EN",
+                    unique_system_identifier=1,
+                    call_sign="K1ABC",
+                    licensee_id="L00000001",
+                    fcc_registration_number="0000012345",
+                    first_name="Alice",
+                ),
+                fccdb.Entity(
+                    record_type="EN",
+                    unique_system_identifier=2,
+                    call_sign="K1ABC",
+                    licensee_id="L00000002",
+                    first_name="Bob",
+                ),
+                fccdb.Amateur(
+                    record_type="AM",
+                    unique_system_identifier=1,
+                    call_sign="K1ABC",
+                    operator_class="E",
+                ),
+                fccdb.LicenseStatus(unique_system_identifier=1, is_active=True),
+                fccdb.LicenseStatus(unique_system_identifier=2, is_active=False),
+            ]
+        )
+        session.commit()
+    engine.dispose()
+    return dburi
+
+
+@pytest.fixture
+def lookup(dburi):
+    engine = query.readonly_engine(dburi, pool_size=2)
+    yield query.Lookup(engine)
+    engine.dispose()
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = query.TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_ttl_cache_expires():
+    cache = query.TTLCache(ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+
+
+def test_lookup_call_sign(lookup):
+    results = lookup.lookup("call_sign", " k1abc ")
+    # Active licenses come first.
+    assert [r["entity"]["first_name"] for r in results] == ["Alice", "Bob"]
+    assert results[0]["license"]["operator_class"] == "E"
+    assert results[0]["status"]["is_active"] is True
+    assert results[1]["license"] is None
+
+
+def test_lookup_licensee_id_and_frn(lookup):
+    [result] = lookup.lookup("licensee_id", "L00000002")
+    assert result["entity"]["unique_system_identifier"] == 2
+    [result] = lookup.lookup("frn", "12345")
+    assert result["entity"]["unique_system_identifier"] == 1
+    assert lookup.lookup("frn", "99999") == []
+
+
+def test_lookup_is_cached(lookup):
+    first = lookup.lookup("call_sign", "K1ABC")
+    assert lookup.lookup("call_sign", "k1abc") is first
+    assert (lookup.cache.hits, lookup.cache.misses) == (1, 1)
+
+
+def test_readonly_engine_refuses_writes(dburi):
+    engine = query.readonly_engine(dburi)
+    with engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.execute(text("delete from entity"))
+    engine.dispose()
+
+
+def test_server(lookup):
+    server = query.LookupServer(("127.0.0.1", 0), lookup)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+        statuses = {}
+        for path in ["/call_sign/K1ABC", "/call_sign/N0NE", "/nosuchkey/x"]:
+            conn.request("GET", path)
+            res = conn.getresponse()
+            statuses[path] = (res.status, json.loads(res.read()))
+        conn.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    status, body = statuses["/call_sign/K1ABC"]
+    assert status == 200 and len(body) == 2
+    assert statuses["/call_sign/N0NE"] == (404, [])
+    assert statuses["/nosuchkey/x"][0] == 400
@@ -0,0 +1,93 @@
+import datetime
+import zipfile
+
+import pytest
+
+import fccdb
+import ingest
+import snapshot
+
+pa = pytest.importorskip("pyarrow")
+ds = pytest.importorskip("pyarrow.dataset")
+
+
+@pytest.fixture
+def ex_datadir(tmp_path):
+    datadir = tmp_path / "db"
+    datadir.mkdir()
+    with open(datadir / "EN.dat", "w", newline="") as fd:
+        fd.write(
+            "EN|1|||K1ABC|L|L00000001|Alice Example|Alice||Example|||||"
+            "64 Livermore Road|Belmont|MA|02478|||000|0000000001|I||A|04/15/2020|||\r\n"
+        )
+        fd.write("EN|2|||W1XYZ|L|L00000002|Bob Example|Bob||Example|||||||NH\r\n")
+        fd.write("EN|3|||N1OTH|L||No State\r\n")
+    with open(datadir / "HS.dat", "w", newline="") as fd:
+        fd.write("HS|1||K1ABC|01/02/2010|LIISS\r\n")
+        fd.write("HS|1||K1ABC|01/02/2020|LIREN\r\n")
+        fd.write("HS|2||W1XYZ|03/04/2021|LIISS\r\n")
+        fd.write("HS|4||K1ZZZ|03/04/2021|LIISS\r\n")
+    return datadir
+
+
+def files(datadir):
+    return {rt: str(datadir / f"{rt}.dat") for rt in ["EN", "HS"]}
+
+
+def test_arrow_schema():
+    schema = snapshot.arrow_schema(fccdb.History)
+    assert schema.names == list(fccdb.History.get_field_names())
+    assert schema.field("unique_system_identifier").type == pa.int64()
+    assert schema.field("log_date").type == pa.date32()
+    assert schema.field("code").type == pa.string()
+
+
+def test_snapshot(tmp_path, ex_datadir):
+    counts = snapshot.snapshot(files(ex_datadir), str(tmp_path / "out"), jobs=1)
+    assert counts == {"EN": 3, "HS": 4}
+
+    entity = ds.dataset(tmp_path / "out" / "entity").to_table()
+    assert entity.column("call_sign").to_pylist() == ["K1ABC", "W1XYZ", "N1OTH"]
+    assert entity.column("status_date").to_pylist()[0] == datetime.date(2020, 4, 15)
+
+    with open(ex_datadir / "HS.dat", newline="\r\n") as fd:
+        rows = list(fccdb.History.iter_rows(fd))
+    history = ds.dataset(tmp_path / "out" / "history").to_table()
+    assert [tuple(row.values()) for row in history.to_pylist()] == rows
+
+
+def test_snapshot_partitioned(tmp_path, ex_datadir):
+    outdir = tmp_path / "out"
+    snapshot.snapshot(files(ex_datadir), str(outdir), partition_by="state", jobs=1)
+
+    history = ds.dataset(outdir / "history", partitioning="hive").to_table()
+    by_state = {}
+    for row in history.to_pylist():
+        by_state.setdefault(row["state"], []).append(row["unique_system_identifier"])
+    # Entities with no state, and rows with no entity, are in the default partition.
+    assert by_state == {"MA": [1, 1], "NH": [2], None: [4]}
+    assert (outdir / "entity" / f"state={snapshot.DEFAULT_PARTITION}").is_dir()
+
+
+def test_snapshot_ipc(tmp_path, ex_datadir):
+    outdir = tmp_path / "out"
+    snapshot.snapshot(files(ex_datadir), str(outdir), format="ipc", compression=None)
+    with pa.memory_map(str(outdir / "history" / "part-0.arrow")) as source:
+        history = pa.ipc.open_file(source).read_all()
+    assert history.num_rows == 4
+
+
+def test_snapshot_partition_needs_entities(tmp_path, ex_datadir):
+    with pytest.raises(ValueError):
+        snapshot.snapshot(
+            {"HS": str(ex_datadir / "HS.dat")}, str(tmp_path), partition_by="state"
+        )
+
+
+def test_snapshot_archive(tmp_path, ex_datadir):
+    with zipfile.ZipFile(tmp_path / "l_amat.zip", "w") as archive:
+        for rt in ["EN", "HS"]:
+            archive.write(ex_datadir / f"{rt}.dat", f"{rt}.dat")
+    sources = ingest.find_sources(str(tmp_path / "l_amat.zip"))
+    counts = snapshot.snapshot(sources, str(tmp_path / "out"), jobs=1)
+    assert counts == {"EN": 3, "HS": 4}
@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+import spatial
+
+
+def test_geohash_encode():
+    assert spatial.geohash_encode(42.605, -5.603, 5) == "ezs42"
+    assert spatial.geohash_encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+
+
+def test_geohash_cover():
+    rng = random.Random(0)
+    for _ in range(200):
+        south = rng.uniform(-80, 70)
+        west = rng.uniform(-170, 150)
+        north = south + rng.expovariate(1)
+        east = west + rng.expovariate(1)
+        cells = spatial.geohash_cover(south, west, north, east)
+        assert len(cells) <= 16
+        for _ in range(20):
+            geohash = spatial.geohash_encode(
+                rng.uniform(south, north), rng.uniform(west, east)
+            )
+            assert any(geohash.startswith(cell) for cell in cells)
+
+
+def test_bbox_around():
+    rng = random.Random(0)
+    for _ in range(200):
+        lat, lon = rng.uniform(-85, 85), rng.uniform(-170, 170)
+        radius = rng.uniform(0.1, 500)
+        south, west, north, east = spatial.bbox_around(lat, lon, radius)
+        for _ in range(20):
+            p_lat = rng.uniform(lat - 10, lat + 10)
+            p_lon = rng.uniform(lon - 10, lon + 10)
+            if spatial.haversine_km(lat, lon, p_lat, p_lon) <= radius:
+                p_lon = (p_lon + 180) % 360 - 180
+                assert south <= p_lat <= north
+                if west <= east:
+                    assert west <= p_lon <= east
+                else:
+                    assert p_lon >= west or p_lon <= east
+
+
+def test_bbox_around_antimeridian():
+    # Adak, in the Aleutians
+    south, west, north, east = spatial.bbox_around(51.88, -176.66, 500)
+    assert west > east
+    assert 170 < west < 180 and -170 < east < -165
+    assert south < 51.88 < north
+
+
+def test_haversine_km():
+    # Boston to New York
+    assert spatial.haversine_km(42.3601, -71.0589, 40.7128, -74.0060) == pytest.approx(
+        306, abs=1
+    )
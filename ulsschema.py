@@ -0,0 +1,101 @@
+"""Read the ULS table definitions in docs/schema.sql and docs/table_names.txt.
+
+schema.sql is the FCC's own (SQL Server) definition of the public access tables,
+one "create table dbo.PUBACC_XX" statement per record type, with columns in the
+order they appear in the .dat files."""
+
+from typing import NamedTuple
+
+import os
+import re
+
+DOCS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "docs")
+
+TABLE = re.compile(r"create\s+table\s+dbo\.pubacc_(\w+)", re.IGNORECASE)
+COLUMN = re.compile(
+    r"^\s*(\w+)\s+(\w+)\s*(?:\(\s*(\d+)\s*(?:,\s*(\d+)\s*)?\))?\s+(not\s+null|null)",
+    re.IGNORECASE,
+)
+SEPARATOR = re.compile(r"^\s*go\s*$", re.IGNORECASE | re.MULTILINE)
+
+# Spellings in schema.sql that the hand-written models in fccdb.py normalize.
+COLUMN_RENAMES = [("callsign", "call_sign"), ("uls_file_num", "uls_file_number")]
+
+
+class ColumnSpec(NamedTuple):
+    name: str
+    type: str
+    length: int | None
+    scale: int | None
+    nullable: bool
+
+
+class TableSpec(NamedTuple):
+    record_type: str
+    title: str
+    columns: list[ColumnSpec]
+
+
+def column_name(name: str) -> str:
+    name = name.lower()
+    for old, new in COLUMN_RENAMES:
+        name = re.sub(rf"(?<![^_]){old}(?![^_])", new, name)
+    return name
+
+
+def parse_schema(text: str) -> dict[str, list[ColumnSpec]]:
+    """Return the columns of each table in schema.sql, by record type."""
+
+    tables: dict[str, list[ColumnSpec]] = {}
+    for statement in SEPARATOR.split(text):
+        if (match := TABLE.search(statement)) is None:
+            continue
+        columns = []
+        for line in statement[match.end() :].splitlines():
+            if (column := COLUMN.match(line)) is None:
+                continue
+            name, coltype, length, scale, null = column.groups()
+            columns.append(
+                ColumnSpec(
+                    column_name(name),
+                    coltype.lower(),
+                    None if length is None else int(length),
+                    None if scale is None else int(scale),
+                    not null.lower().startswith("not"),
+                )
+            )
+        tables[match[1].upper()] = columns
+    return tables
+
+
+def parse_table_names(text: str) -> dict[str, str]:
+    """Return the title of each record type, from lines like "AN - Antenna"."""
+
+    titles = {}
+    for line in text.splitlines():
+        if match := re.match(r"^([A-Z0-9]{2})\s+[-–]\s+(.+?)\s*$", line):
+            titles[match[1]] = match[2]
+    return titles
+
+
+def table_name(title: str) -> str:
+    """Turn a title like "FRC [Restricted & Commercial Operator]" into "frc"."""
+
+    title = re.sub(r"\[.*?\]|\(.*?\)", "", title)
+    return "_".join(word.lower() for word in re.findall(r"[A-Za-z0-9]+", title))
+
+
+def load_tables(docs_dir: str = DOCS_DIR) -> dict[str, TableSpec]:
+    """Return the definition of every table in docs_dir, or nothing if it's missing."""
+
+    try:
+        with open(os.path.join(docs_dir, "schema.sql")) as fd:
+            schema = parse_schema(fd.read())
+        with open(os.path.join(docs_dir, "table_names.txt"), encoding="utf-8") as fd:
+            titles = parse_table_names(fd.read())
+    except FileNotFoundError:
+        return {}
+    return {
+        record_type: TableSpec(record_type, titles.get(record_type, record_type), cols)
+        for record_type, cols in schema.items()
+    }